@@ -5,13 +5,17 @@ from threading import Thread, Event
 import pygame
 
 from db.dao import Dao
+from db.rollup import HOUR
 from net_test.nettest import StabilityTester
+from net_test.scheduler import TickScheduler
 from net_test.sniffer import Sniffer
 from user_io.PingScene import PingScene
 from user_io.flag_handler import CMDHandler
 from user_io.output import Generator
 from user_io.pygameplotter import Engine
 
+PRODUCER_JOIN_TIMEOUT = 10  # seconds to wait on each tester/sniffer thread at shutdown
+
 
 def get_record_count(dao, date, record_type):
     # e.g. if YYYY was given,
@@ -20,17 +24,21 @@ def get_record_count(dao, date, record_type):
     return ts_count, pk_count
 
 
-def start_tester(iface, evt, loop_times, dp_scene: PingScene):
+def start_tester(iface, evt, loop_times, dp_scene: PingScene) -> Thread:
     tester = StabilityTester(iface)
     if loop_times == inf:
-        Thread(target=tester.ping_with_event, args=(evt, dp_scene,)).start()
+        thread = Thread(target=tester.ping_with_event, args=(evt, dp_scene,))
     else:
-        Thread(target=tester.ping_with_event_counter, args=(evt, loop_times, dp_scene)).start()
+        thread = Thread(target=tester.ping_with_event_counter, args=(evt, loop_times, dp_scene))
+    thread.start()
+    return thread
 
 
-def start_sniffer(iface, ifaceipv4, evt, count):
+def start_sniffer(iface, ifaceipv4, evt, count) -> Thread:
     sniffer = Sniffer(iface, ifaceipv4, evt, packet_count=count)
-    Thread(target=sniffer.start_sniffing).start()
+    thread = Thread(target=sniffer.start_sniffing)
+    thread.start()
+    return thread
 
 
 if __name__ == '__main__':
@@ -54,68 +62,140 @@ if __name__ == '__main__':
         print(f"Found {tsc} timestamps and {pkc} sniff records in the given date.")
 
     if any_output_flag:
-        generator = Generator()
+        generator = Generator(workers=handler.WORKERS,
+                              csv_time=Generator.CSV_EPOCH if handler.EPOCH_FLAG else Generator.CSV_ISO,
+                              compression=handler.COMPRESSION.lower() if handler.COMPRESSION else None)
 
     if handler.PICKLE_FOUND:
-        # if cmd handler found any pickles as an arg, open
+        # if cmd handler found any saved graphs as an arg, open
         # noinspection PyUnboundLocalVariable
-        generator.open_saved_pickles(handler.pickles)
+        generator.open_saved_figures(handler.pickles)
 
     if handler.SAVE_FOUND:
         # do stuff for output here
         # noinspection PyUnboundLocalVariable
         generator.start_new_pass(handler.OUTPUT_PATH, handler.ANON_FLAG)
         d = Dao()
+        # flows only exist if the sniffer ran with -aggregate at some point in the range
+        flows_found = d.has_flow_records_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE)
 
         if handler.CSV_FLAG:
             # generate csv
             print("Generating CSV...")
             generator.generate_timestamp_csv(
-                d.get_all_timestamp_records_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
-                                                     interval=handler.DATA_CHUNK)
+                d.seek_timestamp_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                                  interval=handler.DATA_CHUNK)
             )
             generator.generate_packet_csv(
-                d.get_all_packet_records_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
-                                                  interval=handler.DATA_CHUNK)
+                d.seek_packet_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                               interval=handler.DATA_CHUNK)
             )
+            if flows_found:
+                generator.generate_packet_csv(
+                    d.seek_packet_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                                   interval=handler.DATA_CHUNK, flows=True),
+                    infix=Generator.FLOW_INFIX
+                )
             print("Done generating CSV!")
 
+        if handler.PARQUET_FLAG:
+            print("Generating Parquet...")
+            generator.generate_timestamp_parquet(
+                d.seek_timestamp_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                                  interval=handler.DATA_CHUNK)
+            )
+            generator.generate_packet_parquet(
+                d.seek_packet_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                               interval=handler.DATA_CHUNK)
+            )
+            if flows_found:
+                generator.generate_packet_parquet(
+                    d.seek_packet_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                                   interval=handler.DATA_CHUNK, flows=True),
+                    infix=Generator.FLOW_INFIX
+                )
+            print("Done generating Parquet!")
+
+        if handler.HTML_FLAG:
+            print("Generating HTML...")
+            generator.generate_html(
+                d.seek_timestamp_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                                  interval=handler.DATA_CHUNK),
+                d.seek_traffic_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                                interval=handler.DATA_CHUNK),
+                handler.SAVE_STARTDATE, handler.SAVE_ENDDATE
+            )
+            print("Done generating HTML!")
+
         if handler.PDF_FLAG:
             # generate pdf
             print("Generating PDF...")
-            generator.generate_timestamp_pdf(
-                d.get_all_timestamp_records_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
-                                                     interval=handler.DATA_CHUNK)
-            )
-            generator.generate_packet_pdf(
-                d.get_all_packet_records_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
-                                                  interval=handler.DATA_CHUNK)
-            )
+            if handler.SUMMARY_FLAG:
+                # hourly stats and outages instead of every row
+                generator.generate_summary_pdf(
+                    handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                    d.get_ping_rollups_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE, HOUR),
+                    d.get_traffic_rollups_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE, HOUR),
+                    (d.seek_timestamp_columns_in_dates(lo, hi, interval=handler.DATA_CHUNK)
+                     for lo, hi in d.get_failed_ping_windows(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE))
+                )
+            else:
+                generator.generate_timestamp_pdf(
+                    d.seek_timestamp_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                                      interval=handler.DATA_CHUNK)
+                )
+                generator.generate_packet_pdf(
+                    d.seek_packet_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                                   interval=handler.DATA_CHUNK)
+                )
+                if flows_found:
+                    generator.generate_packet_pdf(
+                        d.seek_packet_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                                       interval=handler.DATA_CHUNK, flows=True),
+                        infix=Generator.FLOW_INFIX
+                    )
             print("Done generating PDF!")
 
         if handler.GRAPH_FLAG:
             # generate graph
             print("Generating graph...")
-            generator.generate_timestamp_graph(
-                d.get_all_timestamp_records_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
-                                                     interval=handler.DATA_CHUNK),
-                pickle_dump=handler.PICKLE_FLAG
-            )
-            generator.generate_packet_graph(
-                d.get_all_packet_records_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
-                                                  interval=handler.DATA_CHUNK),
-                pickle_dump=handler.PICKLE_FLAG
-            )
+            # long ranges are drawn from the rollup buckets, shorter ones from every raw row
+            if handler.SAVE_ENDDATE - handler.SAVE_STARTDATE > Generator.GRAPH_ROLLUP_AFTER:
+                granularity = Generator.graph_granularity(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE)
+                generator.generate_rollup_graph(
+                    handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                    d.get_ping_rollups_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE, granularity),
+                    d.get_traffic_rollups_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE, granularity),
+                    pickle_dump=handler.PICKLE_FLAG
+                )
+            else:
+                generator.generate_timestamp_graph(
+                    d.seek_timestamp_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                                      interval=handler.DATA_CHUNK),
+                    pickle_dump=handler.PICKLE_FLAG
+                )
+                generator.generate_packet_graph(
+                    d.seek_packet_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                                   interval=handler.DATA_CHUNK),
+                    pickle_dump=handler.PICKLE_FLAG
+                )
+                if flows_found:
+                    generator.generate_packet_graph(
+                        d.seek_packet_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                                       interval=handler.DATA_CHUNK, flows=True),
+                        pickle_dump=handler.PICKLE_FLAG, infix=Generator.FLOW_INFIX
+                    )
             print("Done generating graph!")
 
         if handler.ONEFILE_FLAG:
             # generate non-descriptive onefile with graph
             print("Generating onefile...")
             generator.generate_onefile(
-                d.get_all_timestamp_records_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
-                                                     interval=handler.DATA_CHUNK),
-                d.get_all_packet_records_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
-                                                  interval=handler.DATA_CHUNK)
+                d.seek_timestamp_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                                  interval=handler.DATA_CHUNK),
+                d.seek_traffic_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                                interval=handler.DATA_CHUNK),
+                handler.SAVE_STARTDATE, handler.SAVE_ENDDATE
             )
             print("Done generating onefile!")
 
@@ -123,11 +203,11 @@ if __name__ == '__main__':
             # generate descriptive onefile with graph
             print("Generating verbose onefile...")
             generator.generate_onefile_verbose(
-                d.get_all_timestamp_records_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
-                                                     interval=handler.DATA_CHUNK),
-                d.get_all_packet_records_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                d.seek_timestamp_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
                                                   interval=handler.DATA_CHUNK),
-                handler.DROP_THRESHOLD
+                d.seek_traffic_columns_in_dates(handler.SAVE_STARTDATE, handler.SAVE_ENDDATE,
+                                                interval=handler.DATA_CHUNK),
+                handler.SAVE_STARTDATE, handler.SAVE_ENDDATE, handler.DROP_THRESHOLD
             )
             print("Done generating verbose onefile!")
 
@@ -139,21 +219,31 @@ if __name__ == '__main__':
 
     StabilityTester.UPPER_LIMIT = int(handler.SLEEP_TIME * 1000)
     StabilityTester.SLEEP_TIME = handler.SLEEP_TIME
+    if handler.ASYNC_PING_FLAG:
+        StabilityTester.ENGINE = StabilityTester.ASYNC_ENGINE
+    if handler.CATCH_UP_FLAG:
+        StabilityTester.TICK_POLICY = TickScheduler.CATCH_UP
 
     Sniffer.IP_FILTER = handler.IP_FILTER
+    Sniffer.AGGREGATE_WINDOW = handler.AGGREGATE_WINDOW
+    Sniffer.SAMPLE_EVERY = handler.SAMPLE_EVERY
+    if handler.RAW_CAPTURE_FLAG:
+        Sniffer.ENGINE = Sniffer.RAW_ENGINE
 
     ping_scene = PingScene(handler.SLEEP_TIME, StabilityTester.UPPER_LIMIT,
                            title=f"Interface {handler.INTERFACE_IPV4 if handler.INTERFACE_IPV4 else 'dynamic'}",
                            timer=True)
     engine = Engine([ping_scene])
+    Dao.start_writer()
     # TODO make tester non-mandatory
     # TODO make tester compatible with linux https://github.com/kyan001/ping3/blob/master/ping3.py look at ping fun
     tester_event = Event()
-    start_tester(handler.INTERFACE_IPV4, tester_event, handler.LOOP_TIMES, ping_scene)
+    producers = [start_tester(handler.INTERFACE_IPV4, tester_event, handler.LOOP_TIMES, ping_scene)]
 
     scapy_event = Event()
     if handler.SNIFF_FLAG:
-        start_sniffer(handler.INTERFACE_READABLE, handler.INTERFACE_IPV4, scapy_event, handler.PACKET_COUNT)
+        producers.append(start_sniffer(handler.INTERFACE_READABLE, handler.INTERFACE_IPV4, scapy_event,
+                                       handler.PACKET_COUNT))
 
     try:
         while True:
@@ -161,9 +251,19 @@ if __name__ == '__main__':
                 raise KeyboardInterrupt()
             engine.main_loop()
     except KeyboardInterrupt:
+        pass
+    finally:
         print("Shutting down threads...")
         tester_event.set()
         scapy_event.set()
-    finally:
+        # the tester finishes its tick and the sniffer flushes its flows before the writer takes its stop marker,
+        # anything put after that would be lost. scapy only checks the event on the next packet, so on a quiet
+        # interface the join gives up after a while
+        for producer in producers:
+            producer.join(max(PRODUCER_JOIN_TIMEOUT, 2 * handler.SLEEP_TIME))
+            if producer.is_alive():
+                print(f"{producer.name} didn't stop in time, its last records may be lost.")
+        print("Flushing pending records...")
+        print(Dao.stop_writer())
         pygame.quit()
         exit(0)
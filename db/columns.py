@@ -0,0 +1,97 @@
+import time
+from typing import Dict, List
+
+import numpy as np
+
+
+# string <-> int code dictionary shared by every chunk of one query, so codes stay comparable across chunks
+class Categories:
+    def __init__(self):
+        self.codes: Dict = {}
+        self.values: List = []
+
+    def encode(self, column) -> np.ndarray:
+        codes = self.codes
+        values = self.values
+
+        def code_of(value):
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(values)
+                values.append(value)
+            return code
+
+        return np.fromiter((code_of(v) for v in column), dtype=np.int32, count=len(column))
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return np.array(self.values, dtype=object)[codes]
+
+    def __getitem__(self, code: int):
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+
+QUARTER_HOUR_MS = 15 * 60 * 1000
+
+
+def local_offset_ms(epoch_ms: int) -> int:
+    # timestamps are stored the way peewee's TimestampField writes them, through time.mktime, so turning them into
+    # datetimes takes the local utc offset to match what the model path (datetime.fromtimestamp) shows
+    return time.localtime(epoch_ms // 1000).tm_gmtoff * 1000
+
+
+# naive datetime64[ms] in the wall clock the model path gives, every export goes through this. utc offsets only change
+# on a quarter hour, so the offset is looked up once per quarter hour the array touches and mapped back to its rows,
+# a chunk spanning a dst change gets both
+def wall_clock(epoch_ms: np.ndarray) -> np.ndarray:
+    quarters, rows = np.unique(epoch_ms // QUARTER_HOUR_MS, return_inverse=True)
+    offsets = np.array([local_offset_ms(int(quarter) * QUARTER_HOUR_MS) for quarter in quarters], dtype=np.int64)
+    return (epoch_ms + offsets[rows.reshape(-1)]).astype('datetime64[ms]')
+
+
+class ColumnChunk:
+    def __init__(self, epoch_ms: np.ndarray):
+        self.epoch_ms = epoch_ms
+
+    def __len__(self):
+        return len(self.epoch_ms)
+
+    def datetimes(self) -> np.ndarray:
+        return wall_clock(self.epoch_ms)
+
+
+class TimestampColumns(ColumnChunk):
+    def __init__(self, epoch_ms, ms, limit, dead, receiver, receiver_readable, interface,
+                 receivers: Categories, receivers_readable: Categories, interfaces: Categories):
+        super().__init__(epoch_ms)
+        self.ms: np.ndarray = ms  # int32
+        self.limit: np.ndarray = limit  # int32
+        self.dead: np.ndarray = dead  # bool
+        self.receiver: np.ndarray = receiver  # int32 codes into receivers
+        self.receiver_readable: np.ndarray = receiver_readable  # int32 codes into receivers_readable
+        self.interface: np.ndarray = interface  # int32 codes into interfaces
+
+        self.receivers = receivers
+        self.receivers_readable = receivers_readable
+        self.interfaces = interfaces
+
+
+class PacketColumns(ColumnChunk):
+    def __init__(self, epoch_ms, size, sender, receiver, interface,
+                 addresses: Categories, interfaces: Categories,
+                 packets=None, first_seen_ms=None, last_seen_ms=None):
+        super().__init__(epoch_ms)
+        self.size: np.ndarray = size  # int64, bytes
+        self.sender: np.ndarray = sender  # int32 codes into addresses
+        self.receiver: np.ndarray = receiver  # int32 codes into addresses
+        self.interface: np.ndarray = interface  # int32 codes into interfaces
+
+        self.addresses = addresses
+        self.interfaces = interfaces
+
+        # only set for flows
+        self.packets: np.ndarray = packets
+        self.first_seen_ms: np.ndarray = first_seen_ms
+        self.last_seen_ms: np.ndarray = last_seen_ms
@@ -1,10 +1,17 @@
 import datetime
 from calendar import monthrange
-from typing import List
+from itertools import chain
+from typing import List, Tuple
 
-from peewee import SqliteDatabase
+import numpy as np
+from peewee import fn
 
-from db.tables import Timeframe, Packet
+from db.columns import Categories, TimestampColumns, PacketColumns
+
+from db.migrate import migrate_timeframe_primary_key
+from db.rollup import update_rollups, rebuild_rollups, split_range, to_epoch_s, MINUTE
+from db.tables import Timeframe, Packet, SampledPacket, Flow, PingRollup, TrafficRollup, database
+from db.writer import BatchWriter, WriterStats
 
 
 class InvalidMagicConstant(Exception):
@@ -19,27 +26,70 @@ class Dao:
     HOUR_MAGIC_CONST = 4
     MINUTE_MAGIC_CONST = 5
 
-    def __init__(self):
-        self.db = SqliteDatabase('data.db')
-
-        self.db.connect()
-        self.db.create_tables([Timeframe, Packet])
-        self.db.close()
+    writer: BatchWriter = None
 
-    def timestamp(self, ms: int, l: int, r: str, rr: str, i: str, iface_dead: bool = False):
-        self.db.connect()
-        Timeframe.create(ms=ms, limit=l,
-                         receiver=r, receiver_readable=rr,
-                         interface=i, interface_dead=iface_dead,
-                         datetime=datetime.datetime.now(datetime.timezone.utc))
-        self.db.close()
+    def __init__(self):
+        self.db = database
+
+        # the connection stays open for the lifetime of the calling thread, peewee keeps one per thread
+        self.db.connect(reuse_if_open=True)
+        migrate_timeframe_primary_key()
+        rollups_existed = PingRollup.table_exists() and TrafficRollup.table_exists()
+        self.db.create_tables([Timeframe, Packet, SampledPacket, Flow, PingRollup, TrafficRollup])
+
+        # older databases predate the rollup tables, backfill them once from the raw rows
+        if not rollups_existed:
+            rebuild_rollups()
+
+    @staticmethod
+    def start_writer(batch_size=BatchWriter.BATCH_SIZE, flush_interval_ms=BatchWriter.FLUSH_INTERVAL_MS,
+                     queue_size=BatchWriter.QUEUE_SIZE) -> BatchWriter:
+        # every Dao instance shares the same writer, so the tester(s) and the sniffer feed a single queue
+        if Dao.writer is None or not Dao.writer.is_alive():
+            Dao.writer = BatchWriter(batch_size, flush_interval_ms, queue_size)
+            Dao.writer.start()
+        return Dao.writer
+
+    @staticmethod
+    def stop_writer() -> WriterStats:
+        # blocks until the final flush is done
+        writer = Dao.writer
+        if writer is None:
+            return WriterStats()
+        writer.stop()
+        Dao.writer = None
+        return writer.get_stats()
+
+    def insert(self, model, row, rollup=True):
+        writer = Dao.writer
+        if writer is not None and writer.is_alive() and not writer.stopped:
+            writer.put(model, row, rollup)
+        else:
+            # no writer running (e.g. standalone scripts), write through
+            self.db.connect(reuse_if_open=True)
+            with self.db.atomic():
+                model.create(**row)
+                if rollup:
+                    update_rollups(model, [row])
+
+    # dt lets the tester stamp every server probed on a tick with the same time, defaults to now
+    def timestamp(self, ms: int, l: int, r: str, rr: str, i: str, iface_dead: bool = False, dt=None):
+        self.insert(Timeframe, dict(ms=ms, limit=l,
+                                    receiver=r, receiver_readable=rr,
+                                    interface=i, interface_dead=iface_dead,
+                                    datetime=dt if dt is not None else datetime.datetime.now(datetime.timezone.utc)))
 
     # refactor this, should probably take less args
-    def save_packet(self, se: str, r: str, iface: str, si: int):
-        self.db.connect()
-        Packet.create(sender=se, receiver=r, interface_used=iface, size=si,
-                      datetime=datetime.datetime.now(datetime.timezone.utc))
-        self.db.close()
+    # sampled packets go to their own table, their traffic is already counted in the flow so they skip the rollups
+    # and none of the packet exports mistake a 1 in N sample for the full capture
+    def save_packet(self, se: str, r: str, iface: str, si: int, sampled: bool = False):
+        self.insert(SampledPacket if sampled else Packet,
+                    dict(sender=se, receiver=r, interface_used=iface, size=si,
+                         datetime=datetime.datetime.now(datetime.timezone.utc)), rollup=not sampled)
+
+    def save_flow(self, se: str, r: str, iface: str, packets: int, size: int, first_seen, last_seen, window_start):
+        self.insert(Flow, dict(sender=se, receiver=r, interface_used=iface, packets=packets, size=size,
+                               first_seen=first_seen, last_seen=last_seen, datetime=window_start))
 
     def dt_calc(self, date, const):
         if const == Dao.YEAR_MAGIC_CONST:
@@ -69,24 +119,127 @@ class Dao:
 
         return dt
 
+    # counts records in [start, end) from the coarsest rollup buckets that fit, only the partial minutes
+    # at the edges of the range are counted from the raw tables. raw is a list of (model, count expression) pairs
+    # covering what the rollup counts, so the edges and the buckets in between count the same thing
+    def count_records_in_range(self, raw: List[Tuple], rollup, count_field, start, end) -> int:
+        field = raw[0][0].datetime
+        total = 0
+        for g, lo, hi in split_range(to_epoch_s(field, start), to_epoch_s(field, end)):
+            if g is None:
+                # numbers are taken as seconds by TimestampField and scaled to its resolution
+                for model, count in raw:
+                    total += model.select(fn.COALESCE(count, 0)) \
+                        .where((model.datetime >= lo) & (model.datetime < hi)).scalar()
+            else:
+                total += rollup.select(fn.COALESCE(fn.SUM(count_field), 0)) \
+                    .where((rollup.granularity == g) & (rollup.bucket >= lo) & (rollup.bucket < hi)) \
+                    .scalar()
+
+        return total
+
     def get_timestamp_number_of_records_in(self, date, const):
         minutes_dt = self.dt_calc(date, const)
-        # https://stackoverflow.com/questions/52194872/peewee-query-to-fetch-all-records-on-a-specific-date
-        index = Timeframe.select() \
-            .where((Timeframe.datetime > date) & (Timeframe.datetime < (date + datetime.timedelta(minutes=minutes_dt)))) \
-            .count()
-
-        return index
-
-    # query for getting M timestamp records skipping past first N records
-    def get_n_timestamp_records_starting_from(self, starting_index: int, interval=1000) -> List[Timeframe]:
-        query = Timeframe.select().order_by(Timeframe.datetime.desc()).limit(interval).offset(starting_index)
-
-        frames = []
-        for frame in query:
-            frames.append(frame)
-
-        return frames
+        return self.count_records_in_range([(Timeframe, fn.COUNT(Timeframe.id))], PingRollup, PingRollup.count,
+                                           date, date + datetime.timedelta(minutes=minutes_dt))
+
+    # newest timestamp rows before the given one as plain (datetime, id, receiver_readable, ms) tuples, seeking past
+    # it through the index instead of counting OFFSET rows. pass the datetime and id of the oldest row already held,
+    # None to start from the newest row. without an id, inclusive also returns the rows at before itself. skip is only
+    # meant for the first page of a scroll back (the rows at before the caller already holds), later pages seek past
+    # the last row
+    def get_timestamp_page_before(self, before=None, before_id=None, skip=0, interval=1000,
+                                  inclusive=False) -> List[Tuple]:
+        query = Timeframe.select(Timeframe.datetime, Timeframe.id, Timeframe.receiver_readable, Timeframe.ms)
+        if before is not None and before_id is not None:
+            query = query.where((Timeframe.datetime <= before) &
+                                ((Timeframe.datetime < before) | (Timeframe.id < before_id)))
+        elif before is not None:
+            query = query.where(Timeframe.datetime <= before if inclusive else Timeframe.datetime < before)
+        query = query.order_by(Timeframe.datetime.desc(), Timeframe.id.desc()).limit(interval)
+        if skip:
+            query = query.offset(skip)
+
+        return list(query.tuples())
+
+    # keyset generator over raw cursor tuples, every chunk is one indexed range query starting right after the last row
+    # of the previous one, so the cost per chunk doesn't grow with how far into the range we are. the id breaks ties
+    # between rows sharing a ms, no model instances are built. columns are selected as is, the datetime comes back
+    # as the stored epoch ms
+    def seek_tuples_in_dates(self, model, columns: List[str], datestart, dateend, interval=1000):
+        table = model._meta.table_name
+        selected = ", ".join(f'"{c}"' for c in columns)
+        start = model.datetime.db_value(datestart)
+        end = model.datetime.db_value(dateend)
+        last = None
+
+        while True:
+            if last is None:
+                where = "datetime > ? AND datetime < ?"
+                params = (start, end)
+            else:
+                # the >= bound keeps sqlite on the datetime index, with the OR alone it merges two index
+                # searches and sorts every page in a temp b-tree
+                where = "datetime >= ? AND (datetime > ? OR id > ?) AND datetime < ?"
+                params = (last[1], last[1], last[0], end)
+
+            cursor = self.db.execute_sql(f'SELECT id, datetime, {selected} FROM "{table}" WHERE {where} '
+                                         f'ORDER BY datetime, id LIMIT ?', params + (interval,))
+            rows = cursor.fetchall()
+            if not rows:
+                return
+
+            yield rows
+
+            if len(rows) < interval:
+                return
+            last = rows[-1]
+
+    # timestamp rows of the range as TimestampColumns chunks
+    def seek_timestamp_columns_in_dates(self, datestart, dateend, interval=1000):
+        receivers = Categories()
+        receivers_readable = Categories()
+        interfaces = Categories()
+
+        for rows in self.seek_tuples_in_dates(Timeframe, ["ms", "limit", "interface_dead", "receiver",
+                                                          "receiver_readable", "interface"],
+                                              datestart, dateend, interval):
+            _, epoch_ms, ms, limit, dead, receiver, receiver_readable, interface = zip(*rows)
+            yield TimestampColumns(np.array(epoch_ms, dtype=np.int64), np.array(ms, dtype=np.int32),
+                                   np.array(limit, dtype=np.int32), np.array(dead, dtype=bool),
+                                   receivers.encode(receiver), receivers_readable.encode(receiver_readable),
+                                   interfaces.encode(interface),
+                                   receivers, receivers_readable, interfaces)
+
+    # packet (or flow) rows of the range as PacketColumns chunks
+    def seek_packet_columns_in_dates(self, datestart, dateend, interval=1000, flows=False):
+        addresses = Categories()
+        interfaces = Categories()
+        model = Flow if flows else Packet
+        columns = ["size", "sender", "receiver", "interface_used"]
+        if flows:
+            columns += ["packets", "first_seen", "last_seen"]
+
+        for rows in self.seek_tuples_in_dates(model, columns, datestart, dateend, interval):
+            fields = list(zip(*rows))
+            extra = {}
+            if flows:
+                extra = dict(packets=np.array(fields[6], dtype=np.int64),
+                             first_seen_ms=np.array(fields[7], dtype=np.int64),
+                             last_seen_ms=np.array(fields[8], dtype=np.int64))
+
+            yield PacketColumns(np.array(fields[1], dtype=np.int64), np.array(fields[2], dtype=np.int64),
+                                addresses.encode(fields[3]), addresses.encode(fields[4]),
+                                interfaces.encode(fields[5]), addresses, interfaces, **extra)
+
+    # all the traffic in the range, every packet once: raw packets and flows never overlap, -sample keeps its
+    # packets in SampledPacket
+    def seek_traffic_columns_in_dates(self, datestart, dateend, interval=1000):
+        return chain(self.seek_packet_columns_in_dates(datestart, dateend, interval),
+                     self.seek_packet_columns_in_dates(datestart, dateend, interval, flows=True))
+
+    def has_flow_records_in_dates(self, datestart, dateend) -> bool:
+        return Flow.select().where((Flow.datetime > datestart) & (Flow.datetime < dateend)).exists()
 
     # generator for all records in given date, gives back records every set interval
     def get_all_timestamp_records_in(self, date, const, interval=1000):
@@ -110,33 +263,63 @@ class Dao:
 
         return
 
-    def get_all_timestamp_records_in_dates(self, datestart, dateend, interval=1000):
-        query = Timeframe.select() \
-            .where(Timeframe.datetime > datestart & Timeframe.datetime < dateend)
-
-        index = 1
-        frames = []
-        for frame in query:
-            if index % interval == 0:
-                yield frames
-                index = 1
-                frames.clear()
-
-            frames.append(frame)
-            index += 1
-
-        yield frames
-
-        return
-
     def get_packet_number_of_records_in(self, date, const):
         minutes_dt = self.dt_calc(date, const)
-        # https://stackoverflow.com/questions/52194872/peewee-query-to-fetch-all-records-on-a-specific-date
-        index = Packet.select() \
-            .where((Packet.datetime > date) & (Packet.datetime < (date + datetime.timedelta(minutes=minutes_dt)))) \
-            .count()
-
-        return index
+        # a flow row stands for all of its packets, like in the traffic rollups
+        return self.count_records_in_range([(Packet, fn.COUNT(Packet.id)), (Flow, fn.SUM(Flow.packets))],
+                                           TrafficRollup, TrafficRollup.packets,
+                                           date, date + datetime.timedelta(minutes=minutes_dt))
+
+    # minutes the minute rollups saw failed pings in, merged into [lo, hi) epoch second windows that reach back to the
+    # minute the same server was last pinged in before and on to the one it was next pinged in after, so the pings
+    # right before and after every outage fall inside its window whatever the ping interval (-t) of the capture was.
+    # outage detection then only reads the raw rows of these windows instead of the whole range
+    def get_failed_ping_windows(self, datestart, dateend) -> List[List[int]]:
+        start = to_epoch_s(Timeframe.datetime, datestart)
+        end = to_epoch_s(Timeframe.datetime, dateend)
+
+        def neighbour(earlier: bool):
+            other = PingRollup.alias()
+            return other.select(other.bucket) \
+                .where((other.granularity == MINUTE) & (other.interface == PingRollup.interface) &
+                       (other.receiver == PingRollup.receiver) &
+                       (other.bucket < PingRollup.bucket if earlier else other.bucket > PingRollup.bucket)) \
+                .order_by(other.bucket.desc() if earlier else other.bucket.asc()).limit(1)
+
+        query = PingRollup.select(PingRollup.bucket, neighbour(True), neighbour(False)) \
+            .where((PingRollup.granularity == MINUTE) & (PingRollup.dead > 0) &
+                   (PingRollup.bucket > start - MINUTE) & (PingRollup.bucket < end))
+
+        # a server pinged less often than the others reaches further back, so the windows are sorted again to merge
+        windows = []
+        for lo, hi in sorted((max(bucket if before is None else before, start),
+                              min((bucket if after is None else after) + MINUTE, end))
+                             for bucket, before, after in query.tuples()):
+            if windows and lo <= windows[-1][1]:
+                windows[-1][1] = max(windows[-1][1], hi)
+            else:
+                windows.append([lo, hi])
+
+        return windows
+
+    # rollup buckets of one granularity (see db.rollup.GRANULARITIES) in [datestart, dateend), oldest first
+    def get_ping_rollups_in_dates(self, datestart, dateend, granularity) -> List[PingRollup]:
+        query = PingRollup.select() \
+            .where((PingRollup.granularity == granularity) &
+                   (PingRollup.bucket >= to_epoch_s(Timeframe.datetime, datestart)) &
+                   (PingRollup.bucket < to_epoch_s(Timeframe.datetime, dateend))) \
+            .order_by(PingRollup.bucket)
+
+        return list(query)
+
+    def get_traffic_rollups_in_dates(self, datestart, dateend, granularity) -> List[TrafficRollup]:
+        query = TrafficRollup.select() \
+            .where((TrafficRollup.granularity == granularity) &
+                   (TrafficRollup.bucket >= to_epoch_s(Packet.datetime, datestart)) &
+                   (TrafficRollup.bucket < to_epoch_s(Packet.datetime, dateend))) \
+            .order_by(TrafficRollup.bucket)
+
+        return list(query)
 
     def get_all_packet_records_in(self, date, const, interval=1000):
         minutes_dt = self.dt_calc(date, const)
@@ -159,21 +342,3 @@ class Dao:
 
         return
 
-    def get_all_packet_records_in_dates(self, datestart, dateend, interval=1000):
-        query = Packet.select() \
-            .where(Packet.datetime > datestart & Packet.datetime < dateend)
-
-        index = 1
-        packets = []
-        for frame in query:
-            if index % interval == 0:
-                yield packets
-                index = 1
-                packets.clear()
-
-            packets.append(frame)
-            index += 1
-
-        yield packets
-
-        return
@@ -0,0 +1,29 @@
+from db.tables import Timeframe, database
+
+
+# early databases used Timeframe.datetime as the primary key, which can't hold several servers probed on the
+# same tick. sqlite can't change a primary key in place, so the table is rebuilt with an id column once
+def migrate_timeframe_primary_key():
+    table = Timeframe._meta.table_name
+    if not database.table_exists(table):
+        return
+
+    columns = [column.name for column in database.get_columns(table)]
+    if 'id' in columns:
+        return
+
+    print("Migrating timestamp table to the new primary key, this only happens once...")
+    old = f"{table}_old"
+    with database.atomic():
+        database.execute_sql(f'ALTER TABLE "{table}" RENAME TO "{old}"')
+        # indexes follow the renamed table, drop them so create_tables doesn't skip the new ones by name
+        for index in database.get_indexes(old):
+            if not index.name.startswith("sqlite_"):
+                database.execute_sql(f'DROP INDEX "{index.name}"')
+
+        database.create_tables([Timeframe])
+        database.execute_sql(
+            f'INSERT INTO "{table}" (ms, "limit", receiver, receiver_readable, interface, interface_dead, datetime) '
+            f'SELECT ms, "limit", receiver, receiver_readable, interface, interface_dead, datetime '
+            f'FROM "{old}" ORDER BY datetime')
+        database.execute_sql(f'DROP TABLE "{old}"')
@@ -0,0 +1,171 @@
+from typing import Dict, List, Tuple
+
+from peewee import EXCLUDED, fn
+
+from db.tables import Timeframe, Packet, Flow, PingRollup, TrafficRollup, database
+
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+GRANULARITIES = (MINUTE, HOUR, DAY)
+
+
+def to_epoch_s(field, value) -> int:
+    # go through the field so buckets line up with however the raw tables store their timestamps
+    return int(field.db_value(value) // field.resolution)
+
+
+def bucket_of(epoch_s: int, granularity: int) -> int:
+    return epoch_s - epoch_s % granularity
+
+
+def aggregate_timestamps(rows: List[Dict]) -> List[Dict]:
+    buckets: Dict[Tuple, Dict] = {}
+    for row in rows:
+        epoch_s = to_epoch_s(Timeframe.datetime, row['datetime'])
+        ms = row['ms']
+        dead = row.get('interface_dead', False) or ms <= 0
+        interface = row.get('interface') or ''
+
+        for g in GRANULARITIES:
+            key = (g, bucket_of(epoch_s, g), interface, row['receiver'])
+            b = buckets.get(key)
+            if b is None:
+                b = buckets[key] = dict(granularity=g, bucket=key[1], interface=interface, receiver=row['receiver'],
+                                        receiver_readable=row['receiver_readable'], count=0, dead=0,
+                                        ms_min=None, ms_max=None, ms_sum=0, ms_sum_sq=0)
+            b['count'] += 1
+            if dead:
+                b['dead'] += 1
+            else:
+                b['ms_min'] = ms if b['ms_min'] is None else min(b['ms_min'], ms)
+                b['ms_max'] = ms if b['ms_max'] is None else max(b['ms_max'], ms)
+                b['ms_sum'] += ms
+                b['ms_sum_sq'] += ms * ms
+
+    return list(buckets.values())
+
+
+# handles both raw packet rows and flow rows, a flow carries its own packet count
+def aggregate_packets(rows: List[Dict]) -> List[Dict]:
+    buckets: Dict[Tuple, Dict] = {}
+    for row in rows:
+        epoch_s = to_epoch_s(Packet.datetime, row['datetime'])
+        interface = row.get('interface_used') or ''
+        packets = row.get('packets', 1)
+
+        for g in GRANULARITIES:
+            key = (g, bucket_of(epoch_s, g), interface)
+            b = buckets.get(key)
+            if b is None:
+                b = buckets[key] = dict(granularity=g, bucket=key[1], interface=interface, packets=0, bytes=0)
+            b['packets'] += packets
+            b['bytes'] += row['size']
+
+    return list(buckets.values())
+
+
+def merge_ping_rollups(buckets: List[Dict]):
+    if not buckets:
+        return
+    # sqlite's two argument min/max are scalar, coalesce covers buckets that so far only saw dead pings
+    PingRollup.insert_many(buckets).on_conflict(
+        conflict_target=[PingRollup.granularity, PingRollup.bucket, PingRollup.interface, PingRollup.receiver],
+        update={
+            PingRollup.count: PingRollup.count + EXCLUDED.count,
+            PingRollup.dead: PingRollup.dead + EXCLUDED.dead,
+            PingRollup.ms_min: fn.MIN(fn.COALESCE(PingRollup.ms_min, EXCLUDED.ms_min),
+                                      fn.COALESCE(EXCLUDED.ms_min, PingRollup.ms_min)),
+            PingRollup.ms_max: fn.MAX(fn.COALESCE(PingRollup.ms_max, EXCLUDED.ms_max),
+                                      fn.COALESCE(EXCLUDED.ms_max, PingRollup.ms_max)),
+            PingRollup.ms_sum: PingRollup.ms_sum + EXCLUDED.ms_sum,
+            PingRollup.ms_sum_sq: PingRollup.ms_sum_sq + EXCLUDED.ms_sum_sq,
+        }
+    ).execute()
+
+
+def merge_traffic_rollups(buckets: List[Dict]):
+    if not buckets:
+        return
+    TrafficRollup.insert_many(buckets).on_conflict(
+        conflict_target=[TrafficRollup.granularity, TrafficRollup.bucket, TrafficRollup.interface],
+        update={
+            TrafficRollup.packets: TrafficRollup.packets + EXCLUDED.packets,
+            TrafficRollup.bytes: TrafficRollup.bytes + EXCLUDED.bytes,
+        }
+    ).execute()
+
+
+# call inside the same transaction as the raw insert so rollups never drift from the raw tables
+def update_rollups(model, rows: List[Dict]):
+    if model is Timeframe:
+        merge_ping_rollups(aggregate_timestamps(rows))
+    elif model is Packet or model is Flow:
+        merge_traffic_rollups(aggregate_packets(rows))
+
+
+# rebuilds every rollup from the raw tables, used once when the rollup tables are first created on an existing db
+def rebuild_rollups():
+    tf = Timeframe._meta.table_name
+    pk = Packet._meta.table_name
+    fl = Flow._meta.table_name
+    pr = PingRollup._meta.table_name
+    tr = TrafficRollup._meta.table_name
+    res = Timeframe.datetime.resolution
+
+    with database.atomic():
+        database.execute_sql(f"DELETE FROM {pr}")
+        database.execute_sql(f"DELETE FROM {tr}")
+        for g in GRANULARITIES:
+            database.execute_sql(
+                f"INSERT INTO {pr} (granularity, bucket, interface, receiver, receiver_readable, "
+                f"count, dead, ms_min, ms_max, ms_sum, ms_sum_sq) "
+                f"SELECT ?, (datetime / ? / ?) * ?, COALESCE(interface, ''), receiver, MAX(receiver_readable), "
+                f"COUNT(*), SUM(dead), MIN(CASE WHEN dead THEN NULL ELSE ms END), "
+                f"MAX(CASE WHEN dead THEN NULL ELSE ms END), SUM(CASE WHEN dead THEN 0 ELSE ms END), "
+                f"SUM(CASE WHEN dead THEN 0 ELSE ms * ms END) "
+                f"FROM (SELECT *, (interface_dead OR ms <= 0) AS dead FROM {tf}) "
+                f"GROUP BY 2, 3, 4",
+                (g, int(res), g, g))
+            database.execute_sql(
+                f"INSERT INTO {tr} (granularity, bucket, interface, packets, bytes) "
+                f"SELECT ?, (datetime / ? / ?) * ?, COALESCE(interface_used, ''), SUM(packets), SUM(size) "
+                f"FROM (SELECT datetime, interface_used, 1 AS packets, size FROM {pk} "
+                f"UNION ALL SELECT datetime, interface_used, packets, size FROM {fl}) "
+                f"GROUP BY 2, 3",
+                (g, int(Packet.datetime.resolution), g, g))
+
+
+# splits [start, end) (epoch seconds) into the coarsest bucket runs that fit inside it,
+# returns (granularity, lo, hi) tuples, granularity None marks an edge that has to come from the raw table
+def split_range(start: int, end: int) -> List[Tuple]:
+    segments = []
+
+    def split(lo, hi, levels):
+        if lo >= hi:
+            return
+        if not levels:
+            segments.append((None, lo, hi))
+            return
+
+        g = levels[0]
+        first = -(-lo // g) * g  # first bucket start at or after lo
+        last = hi - hi % g  # end of the last bucket fully before hi
+        if first >= last:
+            split(lo, hi, levels[1:])
+            return
+
+        split(lo, first, levels[1:])
+        segments.append((g, first, last))
+        split(last, hi, levels[1:])
+
+    split(start, end, sorted(GRANULARITIES, reverse=True))
+    return segments
+
+
+def pick_granularity(start: int, end: int, max_points: int) -> int:
+    # finest granularity that still keeps a series under max_points buckets
+    for g in GRANULARITIES:
+        if (end - start) / g <= max_points:
+            return g
+    return GRANULARITIES[-1]
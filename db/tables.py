@@ -1,8 +1,38 @@
 # https://github.com/coleifer/peewee/issues/1747
 from peewee import TimestampField, TextField, IntegerField, Model, SqliteDatabase, BooleanField
 
+DATABASE_PATH = 'data.db'
+# https://docs.peewee-orm.com/en/latest/peewee/database.html#recommended-settings
+# WAL lets the capture threads keep writing while reports/the scene read, synchronous=normal is durable under WAL
+# except for a power loss right at commit, which is an acceptable trade for a monitoring log
+DATABASE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -64 * 1024,  # negative means KiB, so 64MB of page cache per connection
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'memory',
+}
+DATABASE_TIMEOUT = 10  # seconds to wait on a locked database before failing
 
-class Timeframe(Model):
+# single shared handle for every model and every Dao -- peewee keeps one connection per thread on it
+database = SqliteDatabase(DATABASE_PATH, pragmas=DATABASE_PRAGMAS, timeout=DATABASE_TIMEOUT)
+
+
+def configure_database(path: str = DATABASE_PATH, pragmas: dict = None, timeout: int = DATABASE_TIMEOUT):
+    # must be called before any thread connects, re-initialising closes the calling thread's connection
+    merged = dict(DATABASE_PRAGMAS)
+    if pragmas is not None:
+        merged.update(pragmas)
+    database.init(path, pragmas=merged, timeout=timeout)
+    return database
+
+
+class BaseModel(Model):
+    class Meta:
+        database = database
+
+
+class Timeframe(BaseModel):
     ms = IntegerField()
     limit = IntegerField()
 
@@ -11,20 +41,78 @@ class Timeframe(Model):
     interface = TextField(null=True)
     interface_dead = BooleanField(default=False)
 
-    datetime = TimestampField(primary_key=True, resolution=1e3)
+    # not unique, every server probed on a tick shares the tick's timestamp
+    datetime = TimestampField(resolution=1e3, index=True)
 
     class Meta:
-        database = db = SqliteDatabase('data.db')
+        # per interface/server range scans for the report generators
+        indexes = (
+            (('interface', 'receiver', 'datetime'), False),
+        )
 
 
-class Packet(Model):
+class Packet(BaseModel):
     size = IntegerField()
 
     sender = TextField()
     receiver = TextField()
     interface_used = TextField()
 
-    datetime = TimestampField(resolution=1e3)  # ms
+    datetime = TimestampField(resolution=1e3, index=True)  # ms
+
+
+# every Nth raw packet kept by -sample next to the flows, its own table so it's never read as the full capture
+class SampledPacket(Packet):
+    pass
+
+
+# one row per (sender, receiver, interface) per aggregation window when the sniffer runs in aggregate mode,
+# size is the byte total so report code written against Packet reads it the same way
+class Flow(BaseModel):
+    packets = IntegerField()
+    size = IntegerField()
+
+    sender = TextField()
+    receiver = TextField()
+    interface_used = TextField()
+
+    first_seen = TimestampField(resolution=1e3)
+    last_seen = TimestampField(resolution=1e3)
+    datetime = TimestampField(resolution=1e3, index=True)  # window start
+
+
+# rollups are maintained incrementally by db.rollup as raw rows are written, one row per bucket
+# granularity is the bucket length in seconds, bucket is the bucket start in the same epoch the raw tables use
+class PingRollup(BaseModel):
+    granularity = IntegerField()
+    bucket = IntegerField()
+    interface = TextField(default='')  # '' stands for an unknown interface, NULLs never conflict in a unique index
+    receiver = TextField()
+    receiver_readable = TextField()
+
+    count = IntegerField(default=0)
+    dead = IntegerField(default=0)
+    # min/max/sum/sum_sq only cover live pings, dead ones are counted in dead
+    ms_min = IntegerField(null=True)
+    ms_max = IntegerField(null=True)
+    ms_sum = IntegerField(default=0)
+    ms_sum_sq = IntegerField(default=0)
+
+    class Meta:
+        indexes = (
+            (('granularity', 'bucket', 'interface', 'receiver'), True),
+        )
+
+
+class TrafficRollup(BaseModel):
+    granularity = IntegerField()
+    bucket = IntegerField()
+    interface = TextField(default='')
+
+    packets = IntegerField(default=0)
+    bytes = IntegerField(default=0)
 
     class Meta:
-        database = db = SqliteDatabase('data.db')
+        indexes = (
+            (('granularity', 'bucket', 'interface'), True),
+        )
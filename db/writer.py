@@ -0,0 +1,177 @@
+from queue import Queue, Empty
+from threading import Thread, Lock
+from time import monotonic, sleep
+from typing import Dict, List, Tuple, Type
+
+from peewee import Model
+
+from db.rollup import update_rollups
+from db.tables import database
+
+
+class WriterStats:
+    def __init__(self):
+        self.flushes = 0
+        self.rows = 0
+        self.last_batch = 0
+        self.max_batch = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.queue_high_water = 0
+        self.failed_flushes = 0
+        self.dropped_rows = 0  # rows given up on after MAX_FLUSH_ATTEMPTS failed writes
+
+    def __str__(self):
+        avg = self.total_flush_ms / self.flushes if self.flushes else 0
+        return f"Flushes: {self.flushes} ({self.failed_flushes} failed), rows written: {self.rows}, " \
+               f"rows dropped: {self.dropped_rows}\n" \
+               f"\tLast batch: {self.last_batch} rows in {self.last_flush_ms:.2f}ms, max batch: {self.max_batch}\n" \
+               f"\tAverage flush: {avg:.2f}ms, queue high water mark: {self.queue_high_water}"
+
+
+# background thread that drains rows from a bounded queue and writes them with insert_many,
+# one transaction per model per flush, instead of one connect/create/close per row
+class BatchWriter(Thread):
+    BATCH_SIZE = 500  # flush after this many rows...
+    FLUSH_INTERVAL_MS = 1000  # ...or after this many ms, whichever comes first
+    QUEUE_SIZE = 20000  # producers block when this many rows are waiting
+    MAX_FLUSH_ATTEMPTS = 5  # a batch that failed this many times in a row (e.g. database locked) is dropped
+
+    _STOP = object()
+
+    def __init__(self, batch_size=BATCH_SIZE, flush_interval_ms=FLUSH_INTERVAL_MS, queue_size=QUEUE_SIZE):
+        super().__init__(name="BatchWriter", daemon=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.queue = Queue(maxsize=queue_size)
+        self.stats = WriterStats()
+        self.stats_lock = Lock()
+
+        # keyed by (model, rollup), rows written with rollup=False skip the rollup tables
+        self.pending: Dict[Tuple[Type[Model], bool], List[Dict]] = {}
+        self.pending_count = 0
+        self.attempts: Dict[Tuple[Type[Model], bool], int] = {}  # failed writes in a row per pending key
+        self.stopped = False
+
+    def put(self, model: Type[Model], row: Dict, rollup=True):
+        # blocks if the queue is full, back pressure is preferable to silently losing records
+        self.queue.put(((model, rollup), row))
+
+        size = self.queue.qsize()
+        # every producer thread gets here, the compare and store has to happen under the lock
+        with self.stats_lock:
+            if size > self.stats.queue_high_water:
+                self.stats.queue_high_water = size
+
+    def run(self):
+        # one long lived connection for the writer thread, pragmas are applied once on connect
+        database.connect(reuse_if_open=True)
+
+        deadline = monotonic() + self.flush_interval
+        while True:
+            if self.attempts:
+                # the last write failed, the rows stay pending and are tried again once per flush interval. nothing
+                # new is taken off the queue meanwhile, so the producers get back pressure instead of the pending
+                # rows growing without bound
+                sleep(max(deadline - monotonic(), 0))
+                self.flush()
+                deadline = monotonic() + self.flush_interval
+                continue
+
+            timeout = deadline - monotonic()
+            try:
+                item = self.queue.get(timeout=timeout if timeout > 0 else 0)
+            except Empty:
+                item = None
+
+            if item is BatchWriter._STOP:
+                break
+
+            if item is not None:
+                key, row = item
+                self.pending.setdefault(key, []).append(row)
+                self.pending_count += 1
+
+            if self.pending_count >= self.batch_size or monotonic() >= deadline:
+                self.flush()
+                deadline = monotonic() + self.flush_interval
+
+        # drain whatever made it into the queue before the stop marker, then do the final flush
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except Empty:
+                break
+            if item is not BatchWriter._STOP:
+                key, row = item
+                self.pending.setdefault(key, []).append(row)
+                self.pending_count += 1
+
+        self.flush()
+        # keeps retrying until every batch is written or dropped, each failed batch is bounded by MAX_FLUSH_ATTEMPTS
+        while self.pending_count:
+            sleep(self.flush_interval)
+            self.flush()
+
+        database.close()
+
+    def flush(self):
+        if self.pending_count == 0:
+            return
+
+        start = monotonic()
+        written = 0
+        dropped = 0
+        kept = {}
+        for key, rows in self.pending.items():
+            if not rows:
+                continue
+            model, rollup = key
+            try:
+                # one transaction, a failed batch leaves neither its rows nor its rollups behind and can be retried
+                with database.atomic():
+                    model.insert_many(rows).execute()
+                    if rollup:
+                        update_rollups(model, rows)
+                written += len(rows)
+                self.attempts.pop(key, None)
+            except Exception as e:
+                attempts = self.attempts[key] = self.attempts.get(key, 0) + 1
+                with self.stats_lock:
+                    self.stats.failed_flushes += 1
+                if attempts < BatchWriter.MAX_FLUSH_ATTEMPTS:
+                    kept[key] = rows
+                    print(f"BatchWriter failed to flush {len(rows)} {model.__name__} rows ({e}), "
+                          f"retrying, attempt {attempts} of {BatchWriter.MAX_FLUSH_ATTEMPTS}")
+                else:
+                    del self.attempts[key]
+                    dropped += len(rows)
+                    print(f"BatchWriter dropped {len(rows)} {model.__name__} rows after "
+                          f"{attempts} failed flushes: {e}")
+
+        elapsed = (monotonic() - start) * 1000
+        with self.stats_lock:
+            self.stats.flushes += 1
+            self.stats.rows += written
+            self.stats.dropped_rows += dropped
+            self.stats.last_batch = self.pending_count
+            self.stats.max_batch = max(self.stats.max_batch, self.pending_count)
+            self.stats.last_flush_ms = elapsed
+            self.stats.total_flush_ms += elapsed
+
+        self.pending = kept
+        self.pending_count = sum(len(rows) for rows in kept.values())
+
+    def stop(self, timeout=None):
+        # the final flush happens on the writer thread after the stop marker is consumed
+        if self.stopped:
+            return
+        self.stopped = True
+        self.queue.put(BatchWriter._STOP)
+        self.join(timeout)
+
+    def get_stats(self) -> WriterStats:
+        with self.stats_lock:
+            snapshot = WriterStats()
+            snapshot.__dict__.update(self.stats.__dict__)
+        return snapshot
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import socket
+import struct
+from sys import argv
+from time import monotonic
+from typing import Dict, List, Tuple
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMP_HEADER = struct.Struct("!BBHHH")  # type, code, checksum, id, sequence
+
+
+class IcmpError(Exception):
+    pass
+
+
+class IcmpTimeout(IcmpError):
+    def __init__(self, host, timeout):
+        self.host = host
+        self.timeout = timeout
+
+    def __str__(self):
+        return f"No echo reply from {self.host} within {self.timeout}s."
+
+
+def checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+# one socket and one reader for every probe, replies are matched to the waiting probe by sequence number
+# (and by id on raw sockets, the kernel owns the id on unprivileged ones)
+# https://lwn.net/Articles/422330/ for the unprivileged SOCK_DGRAM variant
+class AsyncPinger:
+    PAYLOAD = b"pywebwatcher2".ljust(32, b".")
+    instances = 0
+
+    def __init__(self, src_addr: str = None):
+        self.src_addr = src_addr
+        # raw sockets see every echo reply on the host, keep testers on different interfaces apart
+        AsyncPinger.instances += 1
+        self.ident = (os.getpid() + AsyncPinger.instances) & 0xFFFF
+        self.sequence = 0
+        self.pending: Dict[int, Tuple[asyncio.Future, float]] = {}
+        self.addresses: Dict[str, str] = {}
+
+        self.sock, self.raw = AsyncPinger.open_socket()
+        if src_addr is not None:
+            self.sock.bind((src_addr, 0))
+        self.sock.setblocking(False)
+
+        self.reader = None
+        self.loop = None
+
+    @staticmethod
+    def open_socket() -> Tuple[socket.socket, bool]:
+        # unprivileged icmp sockets need net.ipv4.ping_group_range on linux, raw sockets need root/admin
+        try:
+            return socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP), False
+        except OSError:
+            return socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP), True
+
+    def start(self):
+        if self.reader is None:
+            self.loop = asyncio.get_running_loop()
+            self.reader = self.loop.create_task(self.read_replies())
+
+    async def read_replies(self):
+        while True:
+            data = await self.loop.sock_recv(self.sock, 2048)
+            received = monotonic()
+
+            offset = (data[0] & 0x0F) * 4 if self.raw else 0  # raw sockets also hand us the ip header
+            if len(data) < offset + ICMP_HEADER.size:
+                continue
+
+            icmp_type, _, _, ident, sequence = ICMP_HEADER.unpack_from(data, offset)
+            if icmp_type != ICMP_ECHO_REPLY or (self.raw and ident != self.ident):
+                continue
+
+            waiting = self.pending.pop(sequence, None)
+            if waiting is None:
+                continue  # late reply for a probe that already timed out
+
+            future, sent = waiting
+            if not future.done():
+                future.set_result((received - sent) * 1000)
+
+    def resolve(self, host: str) -> str:
+        address = self.addresses.get(host)
+        if address is None:
+            address = self.addresses[host] = socket.gethostbyname(host)
+        return address
+
+    def build_request(self, sequence: int) -> bytes:
+        header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, self.ident, sequence)
+        return ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, checksum(header + AsyncPinger.PAYLOAD), self.ident,
+                                sequence) + AsyncPinger.PAYLOAD
+
+    # returns the round trip in ms measured on the monotonic clock, raises IcmpTimeout/IcmpError
+    async def ping(self, host: str, timeout: float) -> float:
+        self.start()
+
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        sequence = self.sequence
+        future = self.loop.create_future()
+
+        # whatever goes wrong, cancellation included, the probe doesn't stay in pending
+        try:
+            try:
+                packet = self.build_request(sequence)
+                self.pending[sequence] = (future, monotonic())
+                await self.send(packet, (self.resolve(host), 0))
+            except OSError as e:
+                raise IcmpError(f"Couldn't send echo request to {host}: {e}")
+
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                raise IcmpTimeout(host, timeout)
+        finally:
+            self.pending.pop(sequence, None)
+
+    # loop.sock_sendto only exists from python 3.11. the socket is non blocking, so this sends right away unless the
+    # send buffer is full, then it waits for the socket to become writable and tries again
+    async def send(self, packet: bytes, address: Tuple[str, int]):
+        while True:
+            try:
+                self.sock.sendto(packet, address)
+                return
+            except (BlockingIOError, InterruptedError):
+                writable = self.loop.create_future()
+                self.loop.add_writer(self.sock.fileno(), lambda: writable.done() or writable.set_result(None))
+                try:
+                    await writable
+                finally:
+                    self.loop.remove_writer(self.sock.fileno())
+
+    async def ping_many(self, hosts: List[str], timeout: float) -> List:
+        # exceptions are returned in place of the rtt so one dead server doesn't hide the others
+        return await asyncio.gather(*(self.ping(host, timeout) for host in hosts), return_exceptions=True)
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+            self.reader = None
+        self.sock.close()
+
+
+# offline check, pings loopback addresses only
+# python -m net_test.icmp [targets, default 100] [rounds, default 5]
+if __name__ == "__main__":
+    targets = [f"127.0.{i // 250}.{i % 250 + 1}" for i in range(int(argv[1]) if len(argv) > 1 else 100)]
+    rounds = int(argv[2]) if len(argv) > 2 else 5
+
+    async def main():
+        pinger = AsyncPinger()
+        print(f"Using {'raw' if pinger.raw else 'unprivileged'} icmp socket, {len(targets)} loopback targets")
+        for r in range(rounds):
+            start = monotonic()
+            results = await pinger.ping_many(targets, timeout=1)
+            replies = [res for res in results if not isinstance(res, Exception)]
+            avg = sum(replies) / len(replies) if replies else 0
+            print(f"Round {r + 1}: {len(replies)}/{len(targets)} replies, average rtt {avg:.3f}ms, "
+                  f"round took {(monotonic() - start) * 1000:.1f}ms")
+        # every probe that replied or timed out is gone from pending, none are left behind
+        assert not pinger.pending, f"{len(pinger.pending)} probes left in pending"
+        pinger.close()
+
+    asyncio.run(main())
@@ -1,6 +1,8 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from json import load
 from threading import Event
-from time import sleep
+from time import monotonic
 from typing import List
 
 import ping3
@@ -8,6 +10,8 @@ from errors import PingError, Timeout
 from ping3 import ping
 
 from db.dao import Dao
+from net_test.icmp import AsyncPinger, IcmpError, IcmpTimeout
+from net_test.scheduler import TickScheduler
 from user_io.PingScene import PingScene
 
 ping3.EXCEPTIONS = True
@@ -16,6 +20,10 @@ ping3.EXCEPTIONS = True
 class StabilityTester:
     UPPER_LIMIT = 1000  # upper limit in ms
     SLEEP_TIME = 1  # sleep time between calls in seconds -- ideally should be the same as upper limit
+    PING3_ENGINE = "ping3"
+    ASYNC_ENGINE = "async"  # one icmp socket + event loop per tester, see net_test/icmp.py
+    ENGINE = PING3_ENGINE
+    TICK_POLICY = TickScheduler.SKIP  # what to do with ticks we fell behind on, see TickScheduler
 
     def __init__(self, src_addr: str):
         with open("servers.json", 'r', encoding="utf-8") as file:
@@ -34,6 +42,18 @@ class StabilityTester:
         if len(self.servers) != len(self.servers_readable):
             raise ServerHostNameMismatchException()
 
+        self.scheduler = None  # created on the first tick, so its origin isn't set while the threads start up
+        self.pool = None
+        self.pinger = None
+        self.loop = None
+        if StabilityTester.ENGINE == StabilityTester.ASYNC_ENGINE:
+            # the loop belongs to the tester thread, it only runs while a tick's probes are in flight
+            self.loop = asyncio.new_event_loop()
+            self.pinger = AsyncPinger(src_addr)
+        else:
+            # one worker per server so every server is probed at the start of every tick
+            self.pool = ThreadPoolExecutor(max_workers=max(len(self.servers), 1), thread_name_prefix="probe")
+
     def ping_forever(self, scene):
         while True:
             self.loop_servers(scene)
@@ -43,28 +63,37 @@ class StabilityTester:
             if evt.is_set():
                 break
             self.loop_servers(scene)
+        self.close()
 
     def ping_with_event_counter(self, evt: Event, c, scene: PingScene):
         for i in range(c):
             if evt.is_set():
                 break
             self.loop_servers(scene)
+        self.close()
 
     def loop_servers(self, scene: PingScene):
         tts = StabilityTester.SLEEP_TIME
 
+        if self.scheduler is None:
+            self.scheduler = TickScheduler(tts, StabilityTester.TICK_POLICY)
+
+        # every probe of a tick is sent at the same time and recorded with the tick's scheduled time
+        tick = self.scheduler.wait()
+        deadline = monotonic() + tts
+        results = self.probe_all(deadline)
+
         for i in range(len(self.servers)):
             try:
-                ms = int(self.ping_server(self.servers[i]))
-                ping_in_s = ms / 1000
-
-                time_left = tts - ping_in_s if ping_in_s < tts else 0
+                if isinstance(results[i], Exception):
+                    raise results[i]
+                ms = int(results[i])
 
                 self.db.timestamp(ms, StabilityTester.UPPER_LIMIT,
                                   self.servers[i], self.servers_readable[i],
-                                  self.interface)
+                                  self.interface, dt=tick)
 
-                scene.add_stamp(self.servers_readable[i], ms)
+                scene.add_stamp(self.servers_readable[i], ms, tick)
 
                 print(f"Server Name: {self.servers_readable[i]}\n"
                       f"\tReplied in: {ms}ms\n"
@@ -72,24 +101,52 @@ class StabilityTester:
 
                 self.local_history[i] = ms
 
-                sleep(time_left)
-
-            except Timeout:
+            except (Timeout, FutureTimeout, IcmpTimeout):
                 self.db.timestamp(0, StabilityTester.UPPER_LIMIT,
                                   self.servers[i], self.servers_readable[i],
-                                  self.interface, True)
-                scene.add_stamp(self.servers_readable[i], 0)
+                                  self.interface, True, dt=tick)
+                scene.add_stamp(self.servers_readable[i], 0, tick)
 
                 print(f"Server Name: {self.servers_readable[i]}\n"
                       f"\t\tConnection timed out.")
 
-            except PingError as pe:
+            except (PingError, IcmpError) as pe:
                 scene.add_stamp(self.servers_readable[i], 0)
                 print(f"Encountered unexpected PingError {pe} when pinging {self.servers_readable[i]}")
-                sleep(0.1)
             except Exception as e:
-                # silently pass if our adapter dies or something, we do not care
-                sleep(tts)
+                # the adapter died, a probe thread crashed etc., the tick still gets a failed row so the gap shows up
+                # in the graphs and reports instead of silently missing
+                self.db.timestamp(0, StabilityTester.UPPER_LIMIT,
+                                  self.servers[i], self.servers_readable[i],
+                                  self.interface, True, dt=tick)
+                scene.add_stamp(self.servers_readable[i], 0, tick)
+                print(f"Probing {self.servers_readable[i]} failed with {type(e).__name__}: {e}")
+
+    # rtt in ms or the exception the probe raised, in the same order as self.servers
+    def probe_all(self, deadline) -> List:
+        if self.pinger is not None:
+            return self.loop.run_until_complete(self.pinger.ping_many(self.servers, StabilityTester.SLEEP_TIME))
+
+        futures = [self.pool.submit(self.ping_server, server) for server in self.servers]
+        results = []
+        for future in futures:
+            try:
+                # ping3 gives up after SLEEP_TIME on its own, this only guards against a probe that hangs anyway
+                results.append(future.result(timeout=max(deadline - monotonic(), 0) + StabilityTester.SLEEP_TIME))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def close(self):
+        if self.scheduler is not None:
+            print(f"Tester on {self.interface} tick stats:\n{self.scheduler.stats}")
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+        if self.pinger is not None:
+            self.pinger.close()
+            # let the cancelled reader task unwind before the loop goes away
+            self.loop.run_until_complete(asyncio.sleep(0))
+            self.loop.close()
 
     def ping_server(self, server: str):
         return ping(server, src_addr=self.interface, unit='ms', timeout=StabilityTester.SLEEP_TIME)
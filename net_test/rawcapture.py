@@ -0,0 +1,204 @@
+import select
+import socket
+import struct
+from sys import argv
+from time import perf_counter
+from typing import Callable, Iterator, List, Tuple
+
+# https://man7.org/linux/man-pages/man7/packet.7.html
+ETH_P_IP = 0x0800
+ETH_HEADER_LEN = 14
+SLL_HEADER_LEN = 16
+
+# pcap link types we know how to skip to the ip header of
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+
+# version/ihl, tos, total length, id, flags/fragment, ttl, proto, checksum, src, dst
+IPV4_HEADER = struct.Struct("!BxH8x4s4s")
+PCAP_GLOBAL_HEADER = struct.Struct("IHHiIII")
+PCAP_RECORD_HEADER = struct.Struct("IIII")
+
+
+class CaptureSourceError(Exception):
+    pass
+
+
+# reads the fixed fields straight out of the buffer, no layered packet object is ever built
+# returns (src, dst, total length) with src/dst as packed 4 byte addresses, None for anything that isn't ipv4
+def parse_ipv4(buf, offset: int = 0):
+    if len(buf) - offset < IPV4_HEADER.size:
+        return None
+
+    version_ihl, total_length, src, dst = IPV4_HEADER.unpack_from(buf, offset)
+    if version_ihl >> 4 != 4:
+        return None
+
+    return src, dst, total_length
+
+
+# AF_PACKET/SOCK_DGRAM with ETH_P_IP, the kernel strips the link layer header and only hands us ipv4
+# python has no recvmmsg, so batches are built by draining the non blocking socket after each select
+class RawSocketSource:
+    def __init__(self, interface: str, batch_size: int = 256, snaplen: int = 64, poll_timeout: float = 0.5):
+        if not hasattr(socket, "AF_PACKET"):
+            raise CaptureSourceError("AF_PACKET sockets are only available on linux.")
+
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_DGRAM, socket.htons(ETH_P_IP))
+        self.sock.bind((interface, 0))
+        self.sock.setblocking(False)
+
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        # we only read the ip header, so every frame is truncated into one small reusable buffer per slot
+        self.buffers = [bytearray(snaplen) for _ in range(batch_size)]
+        self.views = [memoryview(b) for b in self.buffers]
+
+    def batches(self) -> Iterator[List[memoryview]]:
+        while True:
+            ready, _, _ = select.select([self.sock], [], [], self.poll_timeout)
+            if not ready:
+                # give the caller a chance to check its stop event on an idle link
+                yield []
+                continue
+
+            batch = []
+            for view in self.views:
+                try:
+                    n = self.sock.recv_into(view)
+                except BlockingIOError:
+                    break
+                batch.append(view[:n])
+
+            yield batch
+
+    def close(self):
+        self.sock.close()
+
+
+# replays a pcap file (not pcapng) through the same parser, used for tests and benchmarks without a live network
+class PcapFileSource:
+    def __init__(self, path: str, batch_size: int = 256):
+        self.file = open(path, 'rb')
+        self.batch_size = batch_size
+
+        header = self.file.read(PCAP_GLOBAL_HEADER.size)
+        magic = header[:4]
+        if magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+            self.endian = "<"
+        elif magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
+            self.endian = ">"
+        else:
+            raise CaptureSourceError(f"{path} is not a pcap file.")
+
+        self.record_header = struct.Struct(self.endian + PCAP_RECORD_HEADER.format)
+        linktype = struct.unpack(self.endian + PCAP_GLOBAL_HEADER.format, header)[6]
+        # ethertype sits in the last two bytes of both link headers, raw captures have none
+        if linktype == LINKTYPE_ETHERNET:
+            self.l3_offset = ETH_HEADER_LEN
+        elif linktype == LINKTYPE_RAW:
+            self.l3_offset = 0
+        elif linktype == LINKTYPE_LINUX_SLL:
+            self.l3_offset = SLL_HEADER_LEN
+        else:
+            raise CaptureSourceError(f"Unsupported pcap link type {linktype}.")
+
+    def batches(self) -> Iterator[List[memoryview]]:
+        batch = []
+        while True:
+            record = self.file.read(self.record_header.size)
+            if len(record) < self.record_header.size:
+                break
+
+            incl_len = self.record_header.unpack(record)[2]
+            data = memoryview(self.file.read(incl_len))
+            if self.l3_offset > 0 and data[self.l3_offset - 2:self.l3_offset] != b"\x08\x00":
+                continue  # not ipv4
+            batch.append(data[self.l3_offset:])
+
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def close(self):
+        self.file.close()
+
+
+# drives a source until it runs dry, the stop callback returns True or max_packets ipv4 packets were emitted
+# emit receives (src, dst, length) with dotted quad addresses, ip_filter (packed addresses) drops the rest early
+def run_capture(source, emit: Callable[[str, str, int], None], should_stop: Callable[[], bool] = None,
+                max_packets=None, ip_filter: set = None) -> Tuple[int, int]:
+    ntoa = socket.inet_ntoa
+    names = {}  # packed address -> dotted quad, a handful of hosts make up most of the traffic
+    seen = 0
+    emitted = 0
+
+    try:
+        for batch in source.batches():
+            for buf in batch:
+                parsed = parse_ipv4(buf)
+                if parsed is None:
+                    continue
+                seen += 1
+
+                src, dst, length = parsed
+                if ip_filter is not None and src not in ip_filter and dst not in ip_filter:
+                    continue
+
+                src_name = names.get(src)
+                if src_name is None:
+                    src_name = names[src] = ntoa(src)
+                dst_name = names.get(dst)
+                if dst_name is None:
+                    dst_name = names[dst] = ntoa(dst)
+
+                emit(src_name, dst_name, length)
+                emitted += 1
+                if max_packets is not None and emitted >= max_packets:
+                    return seen, emitted
+
+            if should_stop is not None and should_stop():
+                break
+    finally:
+        source.close()
+
+    return seen, emitted
+
+
+def pack_ip_filter(ips: List = None):
+    if not ips:
+        return None
+    return {socket.inet_aton(ip) for ip in ips}
+
+
+# python -m net_test.rawcapture <file.pcap> [comma separated ips], compares against scapy's dissection
+if __name__ == "__main__":
+    pcap = argv[1]
+    ips = [ip.strip() for ip in argv[2].split(",")] if len(argv) > 2 else None
+    rows = []
+
+    start = perf_counter()
+    seen, emitted = run_capture(PcapFileSource(pcap), lambda s, d, l: rows.append((s, d, l)),
+                                ip_filter=pack_ip_filter(ips))
+    raw_elapsed = perf_counter() - start
+    print(f"raw parser: {seen} ipv4 packets, {emitted} emitted in {raw_elapsed:.3f}s "
+          f"({seen / raw_elapsed if raw_elapsed else 0:.0f} packets/s)")
+
+    from scapy.all import sniff
+
+    counts = [0]
+
+    def callback(packet):
+        ip = packet[0][1]
+        counts[0] += 1
+        return ip.src, ip.dst, ip.len
+
+    start = perf_counter()
+    sniff(offline=pcap, filter="ip", prn=callback, store=0)
+    scapy_elapsed = perf_counter() - start
+    print(f"scapy: {counts[0]} ipv4 packets in {scapy_elapsed:.3f}s "
+          f"({counts[0] / scapy_elapsed if scapy_elapsed else 0:.0f} packets/s)")
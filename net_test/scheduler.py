@@ -0,0 +1,65 @@
+import datetime
+from time import monotonic, sleep, time
+
+
+class TickStats:
+    def __init__(self):
+        self.ticks = 0
+        self.late = 0  # fired, but after their deadline
+        self.missed = 0  # never fired, skipped over by the SKIP policy
+        self.max_lateness = 0.0  # s
+        self.total_lateness = 0.0  # s
+
+    def __str__(self):
+        avg = self.total_lateness / self.ticks if self.ticks else 0
+        return f"Ticks: {self.ticks}, late: {self.late}, missed: {self.missed}\n" \
+               f"\tAverage lateness: {avg * 1000:.2f}ms, max lateness: {self.max_lateness * 1000:.2f}ms"
+
+
+# fires on absolute deadlines origin + n * interval on the monotonic clock, so time spent probing, printing
+# or writing is never added to the period and the sample rate can't drift over hours
+class TickScheduler:
+    CATCH_UP = "catch_up"  # fire every missed tick back to back until we're on schedule again
+    SKIP = "skip"  # drop the missed ticks and carry on from the next deadline still ahead of us
+
+    LATE_TOLERANCE = 0.005  # s, wakeups within this of the deadline don't count as late
+
+    def __init__(self, interval: float, policy: str = SKIP):
+        self.interval = interval
+        self.policy = policy
+        self.stats = TickStats()
+        self.index = 0
+
+        # start on the next wall clock multiple of the interval so testers on different interfaces line up
+        now_wall = time()
+        boundary = (now_wall // interval + 1) * interval
+        self.origin_mono = monotonic() + (boundary - now_wall)
+        self.origin_wall = datetime.datetime.fromtimestamp(boundary, datetime.timezone.utc)
+
+    def deadline(self, index: int) -> float:
+        return self.origin_mono + index * self.interval
+
+    # blocks until the next tick is due, returns the scheduled (not the actual) wall clock time of that tick
+    def wait(self) -> datetime.datetime:
+        now = monotonic()
+        due = self.deadline(self.index)
+
+        if now < due:
+            sleep(due - now)
+        else:
+            lateness = now - due
+            if self.policy == TickScheduler.SKIP and lateness >= self.interval:
+                skipped = int(lateness // self.interval)
+                self.stats.missed += skipped
+                self.index += skipped
+                lateness = now - self.deadline(self.index)
+
+            if lateness > TickScheduler.LATE_TOLERANCE:
+                self.stats.late += 1
+            self.stats.total_lateness += lateness
+            self.stats.max_lateness = max(self.stats.max_lateness, lateness)
+
+        tick = self.origin_wall + datetime.timedelta(seconds=self.index * self.interval)
+        self.index += 1
+        self.stats.ticks += 1
+        return tick
@@ -1,14 +1,25 @@
+import datetime
+from ipaddress import IPv4Address
 from math import inf
-from typing import List
+from sys import argv
+from time import perf_counter
+from typing import List, Dict, Tuple
 
-from scapy.all import sniff, get_if_list, get_if_addr, get_if_addr6#, IFACES
+from scapy.all import conf, sniff, get_if_list, get_if_addr, get_if_addr6#, IFACES
 
 from db.dao import Dao
+from net_test.rawcapture import RawSocketSource, run_capture, pack_ip_filter
 
 
 # https://scapy.readthedocs.io/en/latest/api/scapy.sendrecv.html
 class Sniffer:
     IP_FILTER: List = None
+    AGGREGATE_WINDOW: float = None  # seconds per flow window, None writes one row per packet
+    SAMPLE_EVERY: int = 0  # in aggregate mode also keep every Nth raw packet, 0 keeps none
+    IDLE_POLL: float = 0.5  # seconds a capture waits for packets before it closes an expired flow window anyway
+    SCAPY_ENGINE = "scapy"
+    RAW_ENGINE = "raw"  # AF_PACKET socket + struct parsing, see net_test/rawcapture.py, linux only
+    ENGINE = SCAPY_ENGINE
 
     def __init__(self, interface, readable_interface, evt, packet_count=inf):
         self.interface = interface
@@ -16,23 +27,129 @@ class Sniffer:
         self.evt = evt
         self.max_packets = packet_count
 
+        # (src, dst) -> [packets, bytes, first seen, last seen], the interface is fixed per sniffer
+        self.flows: Dict[Tuple[str, str], List] = {}
+        self.window_start = None
+        self.packets_seen = 0
+        self.packets_captured = 0
+        # set once the IP_FILTER made it into the kernel filter, process_packet then skips its own check
+        self.kernel_filtered = False
+
         self.db = Dao()
 
+    # compiles the -f ip list into a BPF expression so non matching packets never reach userspace
+    @staticmethod
+    def build_bpf_filter(ips: List = None) -> str:
+        if not ips:
+            return "ip"
+
+        hosts = []
+        for ip in ips:
+            # raises ValueError on anything that isn't an ipv4 address, nothing else ends up in the expression
+            hosts.append(f"host {IPv4Address(ip)}")
+
+        return f"ip and ({' or '.join(hosts)})"
+
+    # the socket stays open across the sniff calls, each one returns after IDLE_POLL without packets so an expired
+    # flow window gets closed and the stop event seen on an idle link too
+    def capture(self, bpf: str):
+        sock = conf.L2listen(iface=self.interface, filter=bpf)
+        try:
+            while not self.evt.is_set() and self.packets_captured < self.max_packets:
+                remaining = self.max_packets - self.packets_captured
+                sniff(opened_socket=sock, prn=self.process_packet, count=0 if remaining == inf else remaining,
+                      timeout=Sniffer.IDLE_POLL, stop_filter=lambda x: self.evt.is_set(), store=0)
+                self.close_expired_window()
+        finally:
+            sock.close()
+
+    # the raw engine calls this between batches, and every poll timeout on an idle link
+    def poll(self) -> bool:
+        self.close_expired_window()
+        return self.evt.is_set()
+
+    def start_raw_sniffing(self):
+        # the raw engine has no bpf, the ip filter is applied on the packed addresses before anything is decoded
+        source = RawSocketSource(self.interface, poll_timeout=Sniffer.IDLE_POLL)
+        run_capture(source, self.process_ip, should_stop=self.poll,
+                    max_packets=None if self.max_packets == inf else self.max_packets,
+                    ip_filter=pack_ip_filter(Sniffer.IP_FILTER))
+
+        self.flush_flows()
+
     def start_sniffing(self):
-        if self.max_packets == inf:
-            sniff(filter="ip", prn=self.process_packet, iface=self.interface,
-                  stop_filter=lambda x: self.evt.is_set(), store=0)
-        else:
-            sniff(filter="ip", prn=self.process_packet, count=self.max_packets, iface=self.interface,
-                  stop_filter=lambda x: self.evt.is_set(), store=0)
+        if Sniffer.ENGINE == Sniffer.RAW_ENGINE:
+            self.start_raw_sniffing()
+            return
+
+        bpf = Sniffer.build_bpf_filter(Sniffer.IP_FILTER)
+        self.kernel_filtered = Sniffer.IP_FILTER is not None
+        try:
+            self.capture(bpf)
+        except Exception as e:
+            if not self.kernel_filtered:
+                raise
+            # libpcap couldn't compile or attach the expression, keep capturing everything and filter in python
+            print(f"Couldn't apply capture filter \"{bpf}\" ({e}), falling back to filtering in python.")
+            self.kernel_filtered = False
+            self.capture("ip")
+
+        # whatever was counted in the last, partial window
+        self.flush_flows()
 
     # https://thepacketgeek.com/scapy/sniffing-custom-actions/part-1/
     def process_packet(self, packet):
-        if Sniffer.IP_FILTER is not None:
+        self.packets_captured += 1
+        if Sniffer.IP_FILTER is not None and not self.kernel_filtered:
             if not (packet[0][1].src in Sniffer.IP_FILTER or packet[0][1].dst in Sniffer.IP_FILTER):
                 return
 
-        self.db.save_packet(packet[0][1].src, packet[0][1].dst, self.readable_interface, packet[0][1].len)
+        ip = packet[0][1]
+        self.process_ip(ip.src, ip.dst, ip.len)
+
+    # common sink for both capture engines
+    def process_ip(self, src: str, dst: str, length: int):
+        if Sniffer.AGGREGATE_WINDOW is None:
+            self.db.save_packet(src, dst, self.readable_interface, length)
+            return
+
+        self.count_flow(src, dst, length)
+        if Sniffer.SAMPLE_EVERY > 0 and self.packets_seen % Sniffer.SAMPLE_EVERY == 0:
+            self.db.save_packet(src, dst, self.readable_interface, length, sampled=True)
+
+    def count_flow(self, src: str, dst: str, size: int, now: datetime.datetime = None):
+        if now is None:
+            now = datetime.datetime.now(datetime.timezone.utc)
+
+        self.close_expired_window(now)
+        if self.window_start is None:
+            self.window_start = now
+
+        self.packets_seen += 1
+        flow = self.flows.get((src, dst))
+        if flow is None:
+            self.flows[(src, dst)] = [1, size, now, now]
+        else:
+            flow[0] += 1
+            flow[1] += size
+            flow[3] = now
+
+    # called for every packet and by the capture loops when no packet came in for IDLE_POLL, so the last window of a
+    # burst is written once it's over instead of when the link wakes up again. the next packet starts a new window
+    def close_expired_window(self, now: datetime.datetime = None):
+        if self.window_start is None or Sniffer.AGGREGATE_WINDOW is None:
+            return
+        if now is None:
+            now = datetime.datetime.now(datetime.timezone.utc)
+        if (now - self.window_start).total_seconds() >= Sniffer.AGGREGATE_WINDOW:
+            self.flush_flows()
+            self.window_start = None
+
+    def flush_flows(self):
+        for (src, dst), (packets, size, first_seen, last_seen) in self.flows.items():
+            self.db.save_flow(src, dst, self.readable_interface, packets, size, first_seen, last_seen,
+                              self.window_start)
+        self.flows = {}
 
     # use column 0 for arguments to sniff with scapy i think
     @staticmethod
@@ -48,3 +165,28 @@ class Sniffer:
             ip_list.append(get_if_addr(iface))
 
         return ip_list
+
+
+# replays a pcap through both filters and counts how many packets reach the python callback,
+# python -m net_test.sniffer <file.pcap> <comma separated ips>
+if __name__ == "__main__":
+    pcap = argv[1]
+    ip_filter = [ip.strip() for ip in argv[2].split(",")]
+
+    def replay(bpf, python_check):
+        counts = {"callbacks": 0, "kept": 0}
+
+        def callback(packet):
+            counts["callbacks"] += 1
+            if not python_check or packet[0][1].src in ip_filter or packet[0][1].dst in ip_filter:
+                counts["kept"] += 1
+
+        start = perf_counter()
+        sniff(offline=pcap, filter=bpf, prn=callback, store=0)
+        return counts["callbacks"], counts["kept"], perf_counter() - start
+
+    for name, bpf, python_check in (("python filter", "ip", True),
+                                    ("kernel filter", Sniffer.build_bpf_filter(ip_filter), False)):
+        callbacks, kept, elapsed = replay(bpf, python_check)
+        print(f"{name}: \"{bpf}\"\n"
+              f"\tCallbacks: {callbacks}, kept: {kept}, took {elapsed:.3f}s")
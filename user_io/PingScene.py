@@ -1,12 +1,16 @@
 from random import Random
+from sys import argv
 from time import time, sleep
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 
+import numpy as np
 import pygame
 from pygame.constants import MOUSEBUTTONDOWN
 
-from db.dao import Dao
-from user_io.pygameplotter import Scene, Stamp, Engine
+from db.tables import Timeframe
+from user_io.historypager import HistoryPager
+from user_io.pygameplotter import Scene, Engine, TextCache
+from user_io.stampring import StampBuffer, StampChannel
 
 pygame.mixer.pre_init(44100, -16, 2, 2048)
 try:
@@ -24,14 +28,27 @@ class PingScene(Scene):
     def __init__(self, time_step, ylim, element_count=10, title=None, timer=False):
         super().__init__()
 
-        self.DB_PULL_INTERVAL = 100
         self.STEP_UP = 2
         self.STEP_DOWN = 2
         self.scroll_offset = 0
         self.start_sticky = True
         self.total_stamps = 0
-        self.display_stamps: List[Stamp] = []
+        # live stamps in a fixed ring, older ones only paged in from the db while scrolling
+        self.display_stamps = StampBuffer()
+        # started on the first scroll back
+        self.pager = None
+        self.paging = False
+        self.pager_version = None
+        # rows of this scroll back already in the stamp/dead counters
+        self.rows_counted = 0
+        self.dead_counted = 0
+        # the testers only ever touch this, the scene state below is only changed on the ui thread
+        self.incoming = StampChannel()
         self.plot_font = pygame.font.Font(pygame.font.get_default_font(), 14)
+        self.text_cache = TextCache(self.plot_font)
+        # axes, grid and tick labels only change with the window size and the scroll position
+        self.axes_layer = None
+        self.axes_layer_key = None
 
         self.element_count = element_count
         self.stepx = time_step
@@ -58,6 +75,9 @@ class PingScene(Scene):
         self.jump_to_bottom_button_rect: pygame.Rect = pygame.rect.Rect(0, 0, 0, 0)
 
         self.reset = False
+        # everything on screen has to be redrawn, set by new stamps, input and the engine
+        self.dirty = True
+        self.timer_text_drawn = None
 
     def pushEvent(self, event: pygame.event):
         if event.type == MOUSEBUTTONDOWN:
@@ -65,6 +85,7 @@ class PingScene(Scene):
                 if self.jump_to_bottom_button_rect.collidepoint(event.pos):
                     self.scroll_offset = 0
                     self.start_sticky = True
+                    self.drop_history()
 
             # scroll up
             if event.button == 4:
@@ -77,11 +98,59 @@ class PingScene(Scene):
                 if self.scroll_offset <= 0:
                     self.start_sticky = True
                     self.scroll_offset = 0
+                    self.drop_history()
+
+    # back on live, the paged in history isn't needed anymore, the next scroll back pages it in again
+    def drop_history(self):
+        self.display_stamps.drop_history()
+        self.paging = False
+
+    def start_history(self):
+        if self.pager is None:
+            self.pager = HistoryPager()
+            self.pager.start()
+        # the first page starts at the oldest written tick the live ring holds, past the rows of it the ring has,
+        # whatever the ring drops from now on is kept by the buffer
+        self.pager.reset(*self.display_stamps.oldest_recorded())
+        self.display_stamps.start_history()
+        self.paging = True
+        self.rows_counted = 0
+        self.dead_counted = 0
+
+    # what the buffer holds, then whatever pages the pager has ready right behind it
+    def window(self, first: int, count: int):
+        labels, pings = self.display_stamps.window(first, count)
+        if len(pings) < count and self.paging:
+            more_labels, more_pings = self.pager.window(max(first - len(self.display_stamps), 0), count - len(pings))
+            labels, pings = labels + more_labels, np.concatenate((pings, more_pings))
+        return labels, pings
+
+    def invalidate(self):
+        self.dirty = True
+
+    def timer_text(self) -> str:
+        minutes, seconds = divmod(time() - self.start_time, 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"Active For: {hours:02.0f}:{minutes:02.0f}"
+
+    # between stamps the only thing that moves is the timer, once a minute
+    def needs_redraw(self) -> bool:
+        return self.dirty or len(self.incoming.items) > 0 or \
+            (self.timer and self.timer_text() != self.timer_text_drawn) or \
+            (self.paging and self.pager.version != self.pager_version)
 
     def onTransition(self) -> int:
         return 0
 
     def draw_axes(self, screen):
+        key = (screen.get_size(), self.scroll_offset)
+        if self.axes_layer_key != key:
+            self.axes_layer = pygame.Surface(screen.get_size()).convert()
+            self.render_axes(self.axes_layer)
+            self.axes_layer_key = key
+        screen.blit(self.axes_layer, (0, 0))
+
+    def render_axes(self, screen):
         # draws vertical lines along the X axis
         def draw_x_gaps(colour, ghost_colour, height_start, height_end, width):
             current_width = self.MARGIN_W
@@ -170,24 +239,19 @@ class PingScene(Scene):
                     screen.get_height() - self.MARGIN_SMALL_W * 4, self.MARGIN_SMALL_W * 2)
 
     def draw_stamps(self, screen, colour_alive, colour_dead):
-        def is_dead(stamp: Stamp):
-            return stamp.ping <= 0
-
         offset_x = self.MARGIN_W
         offset_y = self.MARGIN_H
 
-        end = min(len(self.display_stamps), self.element_count + 1)
-        for i in range(0, end - 1):
-            curr_stamp = self.display_stamps[i + self.scroll_offset]
-            next_stamp = self.display_stamps[i + 1 + self.scroll_offset]
-
-            curr_point = (offset_x + self.map_x_to_plot(screen, i), offset_y + self.map_y_to_plot(screen, curr_stamp))
+        labels, pings = self.window(self.scroll_offset, self.element_count + 1)
+        pings = pings.tolist()
+        for i in range(0, len(pings) - 1):
+            curr_point = (offset_x + self.map_x_to_plot(screen, i), offset_y + self.map_y_to_plot(screen, pings[i]))
             next_point = (
-                offset_x + self.map_x_to_plot(screen, i + 1), offset_y + self.map_y_to_plot(screen, next_stamp))
-            line_colour = colour_dead if is_dead(curr_stamp) else colour_alive
+                offset_x + self.map_x_to_plot(screen, i + 1), offset_y + self.map_y_to_plot(screen, pings[i + 1]))
+            line_colour = colour_dead if pings[i] <= 0 else colour_alive
             text_offset_y = self.label_offset_y if curr_point[1] > next_point[1] else -self.label_offset_y
 
-            self.draw_text(screen, curr_stamp.label, line_colour, curr_point, offset_y=text_offset_y)
+            self.draw_text(screen, labels[i], line_colour, curr_point, offset_y=text_offset_y)
             pygame.draw.line(screen, line_colour, curr_point, next_point, 2)
 
     def calc_jump_to_bottom_pos_tuples(self, screen) -> Tuple[Tuple[int, int], Tuple[int, int], Tuple[int, int]]:
@@ -199,9 +263,8 @@ class PingScene(Scene):
 
     def draw_misc(self, screen):
         if self.timer:
-            minutes, seconds = divmod(time() - self.start_time, 60)
-            hours, minutes = divmod(minutes, 60)
-            self.draw_text(screen, f"Active For: {hours:02.0f}:{minutes:02.0f}", self.WHITE,
+            self.timer_text_drawn = self.timer_text()
+            self.draw_text(screen, self.timer_text_drawn, self.WHITE,
                            (int(self.MARGIN_W), int(self.MARGIN_H / 2)), offset_x=10)
 
         if self.title:
@@ -218,7 +281,7 @@ class PingScene(Scene):
                        (screen.get_width(), int(self.MARGIN_W / 2)), offset_x=-200)
 
     def draw_text(self, screen, s: str, colour, pos: Tuple[int, int], offset_x: int = 0, offset_y: int = 0):
-        surface = self.plot_font.render(s, True, colour)
+        surface = self.text_cache.render(s, colour)
         x = int(pos[0] - surface.get_width() / 2) + offset_x
         y = int(pos[1] - surface.get_height() / 2) + offset_y
         if x < 0:
@@ -232,9 +295,9 @@ class PingScene(Scene):
             y = screen.get_height()
         screen.blit(surface, (x, y))
 
-    def map_y_to_plot(self, screen, stamp: Stamp) -> int:
+    def map_y_to_plot(self, screen, ping: int) -> int:
         # https://stackoverflow.com/questions/929103/convert-a-number-range-to-another-range-maintaining-ratio
-        inverted_ping = self.ylim - stamp.ping  # invert because we display inverted
+        inverted_ping = self.ylim - ping  # invert because we display inverted
         y_axis_true_h = screen.get_height() - self.MARGIN_H * 2
         return round((((inverted_ping - 0) * y_axis_true_h) / self.ylim))
 
@@ -245,51 +308,102 @@ class PingScene(Scene):
         else:
             return int(x_axis_true_w - (x_axis_true_w / self.element_count) * index)
 
-    def add_stamp(self, label, ping):
+    # called from the tester threads, the stamp is applied on the next frame. dt is the tick of the row written for
+    # it, None if nothing was written
+    def add_stamp(self, label, ping, dt=None):
+        self.incoming.put(label, ping, 0 if dt is None else int(Timeframe.datetime.db_value(dt)))
+
+    def apply_stamp(self, label, ping, stamp_ms=0):
         if not self.start_sticky:
             self.scroll_offset += 1
 
         if ping <= 0:
             self.dead_counter += 1
-        stamp: Stamp = Stamp(label, ping, self.label_offset_y)
-        self.display_stamps.insert(0, stamp)
+        self.display_stamps.add(label, ping, stamp_ms)
         self.total_stamps += 1
 
-    def render(self, screen):
+    def render(self, screen) -> Optional[List[pygame.Rect]]:
+        for label, ping, stamp_ms in self.incoming.drain():
+            self.apply_stamp(label, ping, stamp_ms)
+            self.dirty = True
+
         # if it's not sticky, e.g. we're not on the latest and greatest, and the user is scrolling...
         if not self.start_sticky:
-            # pull from db if we don't have enough records to display without crashing
-            end = min(len(self.display_stamps), self.element_count + 1)
-            if len(self.display_stamps) < end + self.scroll_offset + 1:
-                # pull records
-                d = Dao()
-                timestamps = d.get_n_timestamp_records_starting_from(self.total_stamps,
-                                                                     interval=self.DB_PULL_INTERVAL)
-                self.total_stamps += self.DB_PULL_INTERVAL
-                stamps: List[Stamp] = []
-                # convert into stamps
-                for timestamp in timestamps:
-                    if timestamp.ms <= 0:
-                        self.dead_counter += 1
-                    stamps.append(Stamp(timestamp.receiver_readable, timestamp.ms, offset=self.label_offset_y))
-                self.display_stamps.extend(stamps)
-
-                # if we still don't have enough records, remove the last step the user did...
-                if len(self.display_stamps) < end + self.scroll_offset + 1:
-                    if self.scroll_offset > self.STEP_UP:
-                        self.scroll_offset -= self.STEP_UP
-                    else:
-                        self.scroll_offset = 0
+            if not self.paging:
+                self.start_history()
+
+            # the pages the window falls on plus one on either side, requested without waiting for them
+            wanted = self.element_count + 1
+            first = self.scroll_offset - len(self.display_stamps)
+            if first + wanted > 0:
+                page_size = self.pager.page_size
+                self.pager.want(max(first, 0) // page_size - 1, (first + wanted - 1) // page_size + 1)
+
+            # a page landed in the background, the rows on screen changed even without a new stamp
+            if self.pager.version != self.pager_version:
+                self.dirty = True
+                self.pager_version = self.pager.version
+            rows_read, dead_read = self.pager.rows_read, self.pager.dead_read
+            self.total_stamps += rows_read - self.rows_counted
+            self.dead_counter += dead_read - self.dead_counted
+            self.rows_counted, self.dead_counted = rows_read, dead_read
+
+            # past the oldest row in the db, remove the last step the user did...
+            total_rows = self.pager.total_rows()
+            if total_rows is not None and first + wanted > total_rows:
+                self.scroll_offset = max(len(self.display_stamps) + total_rows - wanted, 0)
+                if self.scroll_offset == 0:
+                    self.start_sticky = True
+                    self.drop_history()
 
         self.draw_axes(screen)
         self.draw_misc(screen)
         self.draw_stamps(screen, self.GREEN, self.MARINE)
 
+        # the frame is drawn in full either way, it's cheap with the cached layers, but when only the timer moved
+        # the rest of it is the same as on screen and only the top strip has to go to the display
+        if self.dirty:
+            self.dirty = False
+            return None
+        return [pygame.Rect(0, 0, screen.get_width(), self.MARGIN_H)]
+
+
+# python -m user_io.PingScene check runs headless (SDL_VIDEODRIVER=dummy) and checks that a history page arriving
+# without any new stamp sends the whole frame to the display, not only the timer strip
+def check_page_redraw():
+    screen = pygame.display.set_mode((800, 600))
+    scene = PingScene(1, 1000, title="Test", timer=True)
+    # never started, the test stands in for the pager thread
+    scene.pager = HistoryPager()
+    scene.scroll_offset = scene.STEP_UP
+    scene.start_sticky = False
+
+    scene.render(screen)
+    assert scene.render(screen) is not None, "nothing changed, only the timer strip should be flipped"
+    scene.pager.version += 1
+    assert scene.needs_redraw(), "a new page has to wake the engine"
+    assert scene.render(screen) is None, "a new page has to flip the full frame"
+    assert not scene.needs_redraw()
+    print("a history page with no new stamps redraws the full frame")
+
+
+# stamps arriving every frame without any input still let the engine drop to its idle tickrate
+def check_idle_while_stamping():
+    scene = PingScene(1, 1000, title="Test", timer=True)
+    engine = Engine([scene])
+    start = time()
+    while time() - start < Engine.IDLE_AFTER_MS / 1000 + 1:
+        scene.add_stamp("test", Random().randint(0, 750))
+        engine.main_loop()
+    assert engine.idle(), "stamps alone kept the engine at the full tickrate"
+    assert scene.total_stamps > 0
+    print(f"idle after {Engine.IDLE_AFTER_MS}ms with {scene.total_stamps} stamps drawn and no input")
+
 
-# TODO benchmark mem usage of keeping 36k+ objects in memory
-#  I noticed something weird with resource manager (1.5gb committed, working set 8mb ? what was that all about?)
-#  and I think the culprit is pingscene. so, benchmark the memory usage live
-if __name__ == "__main__":
+if __name__ == "__main__" and argv[1:] == ["check"]:
+    check_page_redraw()
+    check_idle_while_stamping()
+elif __name__ == "__main__":
     ping_scene = PingScene(1, 1000, title="Test", timer=True)
     engine = Engine([ping_scene])
     h = 0
@@ -0,0 +1,101 @@
+import os
+from contextlib import redirect_stdout
+from sys import argv
+from time import perf_counter
+
+import numpy as np
+
+from db.columns import TimestampColumns, Categories
+from user_io.output import Generator, zstandard
+
+
+# compares the per row write + echo the csv export used to do with the chunked writer on synthetic chunks. the old
+# echo is timed going to os.devnull and to a pseudo terminal (line buffered like stdout on a console, with a thread
+# reading the other end the way a terminal emulator would, minus drawing the text)
+# python -m user_io.bench_csv <output dir> [rows, default 1000000] [chunk size, default 10000]
+if __name__ == "__main__":
+    out_dir = argv[1]
+    total = int(argv[2]) if len(argv) > 2 else 1000000
+    chunk_size = int(argv[3]) if len(argv) > 3 else 10000
+
+    def synthetic_chunks():
+        rng = np.random.default_rng(0)
+        hosts = ["8.8.8.8", "1.1.1.1", "9.9.9.9"]
+        receivers, readable, interfaces = Categories(), Categories(), Categories()
+        receivers.encode(hosts)
+        readable.encode([f"dns{i}" for i in range(len(hosts))])
+        interfaces.encode(["eth0"])
+        for first in range(0, total, chunk_size):
+            n = min(chunk_size, total - first)
+            codes = (np.arange(first, first + n) % len(hosts)).astype(np.int32)
+            yield TimestampColumns(1700000000000 + np.arange(first, first + n, dtype=np.int64) * 1000,
+                                   rng.integers(1, 200, n, dtype=np.int32), np.full(n, 1000, dtype=np.int32),
+                                   rng.random(n) < 0.01, codes, codes, np.zeros(n, dtype=np.int32),
+                                   receivers, readable, interfaces)
+
+    generator = Generator()
+    generator.output_path = out_dir + os.sep
+    generator.postfix = ""
+
+    def per_row_with_echo(echo) -> float:
+        start = perf_counter()
+        with open(f"{generator.output_path}LEGACY.csv", "w") as file:
+            lc = 1
+            for columns in synthetic_chunks():
+                rows = zip(columns.ms.tolist(), columns.limit.tolist(),
+                           columns.receivers.decode(columns.receiver),
+                           columns.receivers_readable.decode(columns.receiver_readable),
+                           columns.interfaces.decode(columns.interface),
+                           np.where(columns.dead, "True", "False"),
+                           generator.format_column_datetimes(columns.epoch_ms))
+                for row in rows:
+                    line = ",".join(map(str, row)) + "\n"
+                    file.write(line)
+                    print(f"{lc}Writing:\t{line}", file=echo)
+                    lc += 1
+        return perf_counter() - start
+
+    with open(os.devnull, "w") as devnull:
+        legacy = per_row_with_echo(devnull)
+    print(f"per row + echo to devnull: {total} rows in {legacy:.2f}s ({total / legacy:.0f} rows/s)")
+
+    legacy_terminal = None
+    if hasattr(os, "openpty"):
+        import termios
+        from threading import Thread
+
+        main_fd, terminal_fd = os.openpty()
+
+        # reads what the terminal would show as it comes, without it the writes block once the pty buffer is full
+        def drain():
+            try:
+                while os.read(main_fd, 1 << 16):
+                    pass
+            except OSError:
+                pass  # the terminal side was closed
+
+        Thread(target=drain, daemon=True).start()
+        with open(terminal_fd, "w", buffering=1) as terminal:
+            legacy_terminal = per_row_with_echo(terminal)
+            termios.tcdrain(terminal_fd)
+        os.close(main_fd)
+        print(f"per row + echo to a terminal: {total} rows in {legacy_terminal:.2f}s "
+              f"({total / legacy_terminal:.0f} rows/s)")
+    else:
+        print("no pseudo terminals here, only the devnull echo was timed.")
+
+    for csv_time, compression in ((Generator.CSV_ISO, None), (Generator.CSV_EPOCH, None),
+                                  (Generator.CSV_ISO, Generator.GZIP), (Generator.CSV_ISO, Generator.ZSTD)):
+        if compression == Generator.ZSTD and zstandard is None:
+            print("zstandard isn't installed, skipping zstd.")
+            continue
+
+        generator.csv_time = csv_time
+        generator.compression = compression
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            start = perf_counter()
+            generator.write_csv_chunks(f"{csv_time}-{compression}", synthetic_chunks(), generator.timestamp_csv_fields)
+            elapsed = perf_counter() - start
+        against_terminal = f", {legacy_terminal / elapsed:.1f}x terminal" if legacy_terminal is not None else ""
+        print(f"chunked, {csv_time}, {compression or 'uncompressed'}: {total} rows in {elapsed:.2f}s "
+              f"({total / elapsed:.0f} rows/s, {legacy / elapsed:.1f}x devnull{against_terminal})")
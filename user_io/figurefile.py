@@ -0,0 +1,57 @@
+import json
+from typing import List
+
+import numpy as np
+
+# saved graphs, the series of every subplot as plain arrays plus a json header, written with -pickle next to the jpg.
+# unlike a pickled Axes they load without matplotlib, don't depend on its version and can't run code when opened
+FIGURE_EXTENSION = ".npz"
+FORMAT_VERSION = 1
+
+
+# graph_data is a List[DataPlotPoint], x as datetimes (datetime64 or datetime objects), y as numbers
+def save_figure(path: str, suptitle: str, graph_data: List, ylabel: str):
+    header = dict(version=FORMAT_VERSION, suptitle=suptitle, ylabel=ylabel,
+                  subplots=[dict(title=data.title, receiver=data.r,
+                                 ylim=None if data.ylim is None else float(data.ylim)) for data in graph_data])
+    arrays = {"header": np.array(json.dumps(header))}
+    for i, data in enumerate(graph_data):
+        arrays[f"x{i}"] = np.asarray(data.x, dtype="datetime64[ms]").astype(np.int64)
+        arrays[f"y{i}"] = np.asarray(data.y)
+
+    with open(f"{path}{FIGURE_EXTENSION}", "wb") as file:
+        np.savez_compressed(file, **arrays)
+
+
+# opening only reads the header, the series are decompressed when the figure is actually drawn
+class SavedFigure:
+    def __init__(self, path: str):
+        self.path = path
+        self.file = np.load(path, allow_pickle=False)
+        self.header = json.loads(str(self.file["header"]))
+        if self.header["version"] > FORMAT_VERSION:
+            raise ValueError(f"{path} was saved by a newer version (format {self.header['version']}).")
+
+        self.suptitle = self.header["suptitle"]
+        self.ylabel = self.header["ylabel"]
+        self.subplots = self.header["subplots"]
+
+    def series(self, index: int):
+        return self.file[f"x{index}"].astype("datetime64[ms]"), self.file[f"y{index}"]
+
+    # same layout render_chart draws the jpg with
+    def draw(self, figure):
+        figure.subplots_adjust(hspace=1.5)
+        for i, subplot in enumerate(self.subplots):
+            ax = figure.add_subplot(len(self.subplots), 1, i + 1)
+            x, y = self.series(i)
+            ax.plot(x, y)
+            ax.set_title(subplot["title"])
+            ax.set_xlabel("Dates")
+            ax.set_ylabel(self.ylabel)
+            ax.set_ylim((0, subplot["ylim"]))
+        figure.suptitle(self.suptitle)
+        return figure
+
+    def close(self):
+        self.file.close()
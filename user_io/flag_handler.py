@@ -2,10 +2,13 @@
 # -i <interface ip> -dynamic -l <loop times> -t <sleep time> -c <packet count>
 # -o <output path> -f <comma separated ips> -sniff -records <YYYY,MM,DD,HH,MM>
 # -save <startdate, in YYYY,MM,DD,HH,MM,SS> <enddate, in YYYY,MM,DD,HH,MM,SS>
-# -csv, -pdf, -graph, -onefile, -verbose_onefile -relaxed <drop threshold>
-# -data <int 0> -anon -pickle
-# to open pickle files just drag and drop all .p files or pass the files as arguments
+# -csv, -pdf, -graph, -parquet, -html, -onefile, -verbose_onefile -relaxed <drop threshold>
+# -data <int 0> -anon -pickle -aggregate <flow window seconds> -sample <keep every Nth packet> -raw
+# -asyncping -catchup -workers <chart rendering processes> -epoch -compress <gzip|zstd> -summary
+# to open saved graphs (-pickle) just drag and drop all .npz files or pass the files as arguments
 from datetime import datetime, timedelta
+from importlib.util import find_spec
+from ipaddress import ip_address, IPv4Address
 from math import inf
 from typing import List
 
@@ -64,6 +67,8 @@ class CMDHandler:
     SAVE_FLAG_ARG = "-SAVE"
     OUTPUT_PATH_ARG = "-O"
     CSV_OUT_ARG = "-CSV"
+    PARQUET_OUT_ARG = "-PARQUET"
+    HTML_OUT_ARG = "-HTML"
     PDF_OUT_ARG = "-PDF"
     GRAPH_OUT_ARG = "-GRAPH"
     ONEFILE_OUT_ARG = "-ONEFILE"
@@ -74,6 +79,17 @@ class CMDHandler:
     DATA_ARG = "-DATA"
     ANON_ARG = "-ANON"
     PICKLE_ARG = "-PICKLE"
+    AGGREGATE_ARG = "-AGGREGATE"
+    SAMPLE_ARG = "-SAMPLE"
+    RAW_CAPTURE_ARG = "-RAW"
+    ASYNC_PING_ARG = "-ASYNCPING"
+    CATCH_UP_ARG = "-CATCHUP"
+    WORKERS_ARG = "-WORKERS"
+    EPOCH_ARG = "-EPOCH"
+    COMPRESS_ARG = "-COMPRESS"
+    SUMMARY_ARG = "-SUMMARY"
+
+    COMPRESSIONS = ["GZIP", "ZSTD"]
 
     RECORDS_ARG_TYPE_YEAR_MAGIC_CONSTANT = 1
     RECORDS_ARG_TYPE_MONTH_MAGIC_CONSTANT = 2
@@ -83,9 +99,12 @@ class CMDHandler:
 
     VALID_FLAGS = [INTERFACE_TO_USE_ARG, LOOP_TIMES_ARG, SLEEP_TIME_ARG, SNIFF_ARG, IP_FORMAT_ARG, PACKET_COUNT_ARG,
                    SAVE_FLAG_ARG, OUTPUT_PATH_ARG, CSV_OUT_ARG, PDF_OUT_ARG, GRAPH_OUT_ARG, RECORDS_ARG, DYNAMIC_ARG,
-                   ONEFILE_OUT_ARG, VERBOSE_ONEFILE_OUT_ARG, RELAXED_ARG, KALM_ARG, DATA_ARG, ANON_ARG, PICKLE_ARG]
+                   ONEFILE_OUT_ARG, VERBOSE_ONEFILE_OUT_ARG, RELAXED_ARG, KALM_ARG, DATA_ARG, ANON_ARG, PICKLE_ARG,
+                   AGGREGATE_ARG, SAMPLE_ARG, RAW_CAPTURE_ARG, ASYNC_PING_ARG,
+                   CATCH_UP_ARG, WORKERS_ARG, EPOCH_ARG, COMPRESS_ARG, PARQUET_OUT_ARG,
+                   SUMMARY_ARG, HTML_OUT_ARG]
 
-    SPECIAL_OUTPUT_FLAGS = [CSV_OUT_ARG, PDF_OUT_ARG, GRAPH_OUT_ARG]
+    SPECIAL_OUTPUT_FLAGS = [CSV_OUT_ARG, PARQUET_OUT_ARG, PDF_OUT_ARG, GRAPH_OUT_ARG]
 
     ONE_FILE_OUTPUT_FLAGS = [ONEFILE_OUT_ARG, VERBOSE_ONEFILE_OUT_ARG]
 
@@ -116,7 +135,18 @@ class CMDHandler:
         self.PICKLE_FLAG = False
         self.ANON_FLAG = False
         self.SNIFF_FLAG = False
+        self.AGGREGATE_WINDOW = None
+        self.SAMPLE_EVERY = 0
+        self.RAW_CAPTURE_FLAG = False
+        self.ASYNC_PING_FLAG = False
+        self.CATCH_UP_FLAG = False
+        self.WORKERS = 1
+        self.EPOCH_FLAG = False
+        self.COMPRESSION = None
+        self.SUMMARY_FLAG = False
         self.CSV_FLAG = False
+        self.PARQUET_FLAG = False
+        self.HTML_FLAG = False
         self.PDF_FLAG = False
         self.GRAPH_FLAG = False
         self.ONEFILE_FLAG = False
@@ -199,11 +229,16 @@ class CMDHandler:
                 upper_arg = arg.upper()
 
                 if upper_arg not in CMDHandler.VALID_FLAGS:
-                    # if arg ends in .p (pickle file)
-                    if len(arg) > 2 and arg[len(arg) - 2: len(arg)] == ".p":
+                    # if arg ends in .npz (saved graph)
+                    if arg.lower().endswith(".npz"):
                         self.PICKLE_FOUND = True
                         self.pickles.append(arg)
+                        index += 1
                         continue
+                    elif arg.lower().endswith(".p"):
+                        raise InvalidFlagError(arg, None, "Pickled graphs aren't opened anymore, since loading a "
+                                                          "pickle can run any code. Regenerate the graph with -pickle "
+                                                          "to get an .npz file instead.")
                     else:
                         raise InvalidFlagError(arg, None, f"Encountered non valid flag {arg}.")
 
@@ -230,6 +265,41 @@ class CMDHandler:
                         self.IP_FILTER = argv[index + 1].split(",")
                         args_skip += 1
 
+                if upper_arg == CMDHandler.AGGREGATE_ARG:
+                    if self.arg_has_value(arg, index, argv, type_check=float):
+                        self.AGGREGATE_WINDOW = float(argv[index + 1])
+                        args_skip += 1
+
+                if upper_arg == CMDHandler.SAMPLE_ARG:
+                    if self.arg_has_value(arg, index, argv, type_check=int):
+                        self.SAMPLE_EVERY = int(argv[index + 1])
+                        args_skip += 1
+
+                if upper_arg == CMDHandler.RAW_CAPTURE_ARG:
+                    self.RAW_CAPTURE_FLAG = True
+
+                if upper_arg == CMDHandler.ASYNC_PING_ARG:
+                    self.ASYNC_PING_FLAG = True
+
+                if upper_arg == CMDHandler.CATCH_UP_ARG:
+                    self.CATCH_UP_FLAG = True
+
+                if upper_arg == CMDHandler.WORKERS_ARG:
+                    if self.arg_has_value(arg, index, argv, type_check=int):
+                        self.WORKERS = int(argv[index + 1])
+                        args_skip += 1
+
+                if upper_arg == CMDHandler.EPOCH_ARG:
+                    self.EPOCH_FLAG = True
+
+                if upper_arg == CMDHandler.SUMMARY_ARG:
+                    self.SUMMARY_FLAG = True
+
+                if upper_arg == CMDHandler.COMPRESS_ARG:
+                    if self.arg_has_value(arg, index, argv):
+                        self.COMPRESSION = argv[index + 1].upper()
+                        args_skip += 1
+
                 if upper_arg == CMDHandler.PACKET_COUNT_ARG:
                     if self.arg_has_value(arg, index, argv, type_check=int):
                         self.PACKET_COUNT = int(argv[index + 1])
@@ -299,6 +369,12 @@ class CMDHandler:
                 if upper_arg == CMDHandler.CSV_OUT_ARG:
                     self.CSV_FLAG = True
 
+                if upper_arg == CMDHandler.PARQUET_OUT_ARG:
+                    self.PARQUET_FLAG = True
+
+                if upper_arg == CMDHandler.HTML_OUT_ARG:
+                    self.HTML_FLAG = True
+
                 if upper_arg == CMDHandler.PDF_OUT_ARG:
                     self.PDF_FLAG = True
 
@@ -347,6 +423,8 @@ class CMDHandler:
                                                                                         "specified."))
 
         out_specifier_found = self.CSV_FLAG or \
+                              self.PARQUET_FLAG or \
+                              self.HTML_FLAG or \
                               self.PDF_FLAG or \
                               self.GRAPH_FLAG or \
                               self.ONEFILE_FLAG or \
@@ -357,7 +435,9 @@ class CMDHandler:
                                                                                    " to specify in what format the "
                                                                                    "output "
                                                                                    "will be in. Valid flags are: "
-                                                                                   "-csv, -pdf, -graph, -onefile, "
+                                                                                   "-csv, -parquet, -html, -pdf, "
+                                                                                   "-graph, "
+                                                                                   "-onefile, "
                                                                                    "-verbose_onefile ."))
 
         if self.VERBOSE_ONEFILE_FLAG and not self.GRAPH_FLAG:
@@ -395,7 +475,7 @@ class CMDHandler:
                 "An output specifier must be present "
                 "to specify in what format the output "
                 "will be in. Valid flags are: "
-                "-csv, -pdf, -graph, -onefile, "
+                "-csv, -parquet, -html, -pdf, -graph, -onefile, "
                 "-verbose_onefile .")
             )
 
@@ -477,6 +557,94 @@ class CMDHandler:
                                                                                      "specified. The count must be "
                                                                                      "a positive integer."))
 
+        if self.IP_FILTER is not None:
+            addresses = []
+            for ip in self.IP_FILTER:
+                try:
+                    address = ip_address(ip.strip())
+                except ValueError:
+                    self.exceptions.append(InvalidFormatException([CMDHandler.IP_FORMAT_ARG], "The ip filter must be "
+                                                                                              "a comma separated list "
+                                                                                              "of ipv4 addresses, "
+                                                                                              f"got {ip}."))
+                    continue
+
+                # the sniffer only captures ipv4 (the bpf and the raw engine both filter on ip), a v6 host would
+                # never match
+                if not isinstance(address, IPv4Address):
+                    self.exceptions.append(InvalidFormatException([CMDHandler.IP_FORMAT_ARG], "The ip filter only "
+                                                                                              "supports ipv4 "
+                                                                                              "addresses, "
+                                                                                              f"got {ip.strip()}."))
+                    continue
+                addresses.append(str(address))
+
+            # stripped and in canonical form, so the bpf, the raw engine and the python check all compare the same
+            # strings scapy and the raw parser give back
+            self.IP_FILTER = addresses
+
+        if self.AGGREGATE_WINDOW is not None and not self.SNIFF_FLAG:
+            self.exceptions.append(InvalidFormatException([CMDHandler.SNIFF_ARG], "-aggregate only affects the "
+                                                                                  "sniffer, -sniff must also be "
+                                                                                  "specified."))
+
+        if self.RAW_CAPTURE_FLAG and not self.SNIFF_FLAG:
+            self.exceptions.append(InvalidFormatException([CMDHandler.SNIFF_ARG], "-raw selects the sniffer's "
+                                                                                  "capture engine, -sniff must also "
+                                                                                  "be specified."))
+
+        if self.AGGREGATE_WINDOW is not None and self.AGGREGATE_WINDOW <= 0:
+            self.exceptions.append(InvalidFormatException(["positive aggregation window"], "A valid aggregation "
+                                                                                           "window must be "
+                                                                                           "specified. The window "
+                                                                                           "must be a positive "
+                                                                                           "number of seconds."))
+
+        if self.SAMPLE_EVERY != 0 and self.AGGREGATE_WINDOW is None:
+            self.exceptions.append(InvalidFormatException([CMDHandler.AGGREGATE_ARG], "-sample keeps raw packets "
+                                                                                      "next to aggregated flows, "
+                                                                                      "-aggregate must also be "
+                                                                                      "specified."))
+
+        if self.SAMPLE_EVERY < 0:
+            self.exceptions.append(InvalidFormatException(["positive sample rate"], "A valid sample rate must be "
+                                                                                    "specified. The rate must be "
+                                                                                    "a positive integer."))
+
+        if self.WORKERS != 1 and not self.GRAPH_FLAG:
+            self.exceptions.append(InvalidFormatException([CMDHandler.GRAPH_OUT_ARG], "-workers only parallelizes "
+                                                                                      "chart rendering, -graph must "
+                                                                                      "also be specified."))
+
+        if self.WORKERS < 1:
+            self.exceptions.append(InvalidFormatException(["positive worker count"], "A valid worker count must be "
+                                                                                     "specified. The count must be "
+                                                                                     "a positive integer."))
+
+        if (self.EPOCH_FLAG or self.COMPRESSION is not None) and not self.CSV_FLAG:
+            self.exceptions.append(InvalidFormatException([CMDHandler.CSV_OUT_ARG], "-epoch and -compress only "
+                                                                                    "affect the csv output, -csv must "
+                                                                                    "also be specified."))
+
+        if self.COMPRESSION is not None and self.COMPRESSION not in CMDHandler.COMPRESSIONS:
+            self.exceptions.append(InvalidFormatException(["valid compression"], "-compress must be one of "
+                                                                                 f"{CMDHandler.COMPRESSIONS}, got "
+                                                                                 f"{self.COMPRESSION}."))
+
+        if self.COMPRESSION == "ZSTD" and find_spec("zstandard") is None:
+            self.exceptions.append(InvalidFormatException(["zstandard"], "zstd compression needs the zstandard "
+                                                                         "package, install it or use -compress "
+                                                                         "gzip."))
+
+        if self.SUMMARY_FLAG and not self.PDF_FLAG:
+            self.exceptions.append(InvalidFormatException([CMDHandler.PDF_OUT_ARG], "-summary replaces the raw rows "
+                                                                                    "of the pdf output, -pdf must "
+                                                                                    "also be specified."))
+
+        if self.PARQUET_FLAG and find_spec("pyarrow") is None:
+            self.exceptions.append(InvalidFormatException(["pyarrow"], "-parquet output needs the pyarrow package, "
+                                                                       "install it or use -csv."))
+
         if self.DROP_THRESHOLD != 1 and not self.VERBOSE_ONEFILE_FLAG:
             self.exceptions.append(InvalidFormatException([CMDHandler.VERBOSE_ONEFILE_OUT_ARG],
                                                           "Relaxed threshold is specified, but "
@@ -0,0 +1,225 @@
+from collections import OrderedDict
+from queue import Queue
+from sys import argv
+from threading import Thread, Lock
+from time import perf_counter, sleep
+from typing import List, Tuple
+
+import numpy as np
+
+from db.columns import Categories
+from db.dao import Dao
+from db.tables import Timeframe
+
+
+# pages of older pings for PingScene's scroll back, fetched on a background thread so a frame never waits on sqlite.
+# a scroll back session starts at reset() from the oldest tick the scene holds: page 0 is the newest rows at or before
+# that tick that the scene doesn't hold already, every next page seeks past the last row of the one before it. rows
+# still queued in the writer and stamps never written can't shift the start, it's a position in the db, not a count.
+# decoded pages (label codes and pings) are kept in a small lru, the scene asks for the pages around its window plus
+# one on either side, so scrolling in both directions usually finds the page already there
+class HistoryPager(Thread):
+    PAGE_SIZE = 500
+    CACHE_PAGES = 32
+
+    _STOP = object()
+
+    def __init__(self, page_size: int = PAGE_SIZE, cache_pages: int = CACHE_PAGES):
+        super().__init__(name="HistoryPager", daemon=True)
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+        self.requests = Queue()
+        self.lock = Lock()
+
+        # shared with the ui thread, only touched under the lock
+        self.pages: OrderedDict = OrderedDict()
+        self.pending = set()
+        self.session = 0
+        self.last_page = None  # index of the last page, once the db ran out of older rows
+        self.total = None  # rows in the session, known with the last page
+        self.version = 0  # bumped on every stored page, so the scene knows to redraw
+        self.rows_read = 0  # rows and failed pings of the session, every page counted once however often it's read
+        self.dead_read = 0
+
+        # only used on the pager thread. labels are encoded here and decoded on the ui thread, reading a code
+        # that's already in a page is safe while new ones are appended
+        self.labels = Categories()
+        self.session_start = None
+        self.skip = 0
+        self.boundaries: List[Tuple] = []  # (datetime, id) of the last row of every page fetched so far
+        self.fetched = 0  # pages read from the db, cache misses
+
+    # starts a new scroll back at the stored epoch ms of the oldest tick the scene holds (None if it holds none that
+    # were written), skip is how many rows of that tick it holds
+    def reset(self, before_ms, skip: int):
+        with self.lock:
+            self.session += 1
+            self.pages.clear()
+            self.pending.clear()
+            self.last_page = None
+            self.total = None
+            self.rows_read = 0
+            self.dead_read = 0
+            self.version += 1
+            self.requests.put((self.session, None, (before_ms, skip)))
+
+    # never blocks, pages that aren't cached or on their way are queued
+    def want(self, first_page: int, last_page: int):
+        with self.lock:
+            for page in range(max(first_page, 0), last_page + 1):
+                if self.last_page is not None and page > self.last_page:
+                    break
+                if page in self.pages:
+                    self.pages.move_to_end(page)
+                elif page not in self.pending:
+                    self.pending.add(page)
+                    self.requests.put((self.session, page, None))
+
+    # label codes and pings of rows first..first + count of the session, up to the first page that isn't cached
+    def window(self, first: int, count: int) -> Tuple[List[str], np.ndarray]:
+        codes, pings = [], []
+        held = 0
+        with self.lock:
+            while held < count:
+                page = self.pages.get((first + held) // self.page_size)
+                if page is None:
+                    break
+                offset = (first + held) % self.page_size
+                part_codes, part_pings = page[0][offset:offset + count - held], page[1][offset:offset + count - held]
+                if len(part_pings) == 0:
+                    break
+                codes.append(part_codes)
+                pings.append(part_pings)
+                held += len(part_pings)
+
+        if not pings:
+            return [], np.zeros(0, dtype=np.int32)
+        return [self.labels[code] for code in np.concatenate(codes).tolist()], np.concatenate(pings)
+
+    # rows in the session once the last page is known, None before that
+    def total_rows(self):
+        with self.lock:
+            return self.total
+
+    def run(self):
+        # one Dao for the thread, so the tables are only checked once
+        dao = Dao()
+
+        while True:
+            item = self.requests.get()
+            if item is HistoryPager._STOP:
+                break
+            session, page, start = item
+            if session != self.session:
+                continue
+            if start is not None:
+                before_ms, self.skip = start
+                self.session_start = None if before_ms is None else Timeframe.datetime.python_value(before_ms)
+                self.boundaries = []
+                continue
+
+            # a page can only be sought once the page before it was read, walk up to it
+            with self.lock:
+                past_end = self.last_page is not None and page > self.last_page
+            if not past_end:
+                for step in range(len(self.boundaries), page + 1):
+                    if not self.fetch(dao, session, step):
+                        break
+            if page < len(self.boundaries) and not self.cached(page):
+                self.fetch(dao, session, page)
+
+            with self.lock:
+                self.pending.discard(page)
+
+    def cached(self, page: int) -> bool:
+        with self.lock:
+            return page in self.pages
+
+    # reads one page and caches it, False when there's nothing left past it
+    def fetch(self, dao, session: int, page: int) -> bool:
+        if page == 0:
+            rows = dao.get_timestamp_page_before(self.session_start, skip=self.skip, interval=self.page_size,
+                                                 inclusive=True)
+        else:
+            before, before_id = self.boundaries[page - 1]
+            rows = dao.get_timestamp_page_before(before, before_id, interval=self.page_size)
+        self.fetched += 1
+
+        first_read = page == len(self.boundaries)
+        if rows and first_read:
+            self.boundaries.append((rows[-1][0], rows[-1][1]))
+        codes = self.labels.encode([row[2] for row in rows])
+        pings = np.fromiter((row[3] for row in rows), dtype=np.int32, count=len(rows))
+
+        with self.lock:
+            if session != self.session:
+                return False
+            if len(rows) < self.page_size and self.last_page is None:
+                self.last_page = page if rows else page - 1
+                self.total = page * self.page_size + len(rows)
+            if first_read:
+                self.rows_read += len(rows)
+                self.dead_read += int((pings <= 0).sum())
+            if rows:
+                self.pages[page] = (codes, pings)
+                self.pages.move_to_end(page)
+                while len(self.pages) > self.cache_pages:
+                    self.pages.popitem(last=False)
+            self.version += 1
+
+        return len(rows) == self.page_size
+
+    def stop(self):
+        self.requests.put(HistoryPager._STOP)
+
+
+# python -m user_io.historypager <db path>, pages back through the whole timestamp table the way a long scroll back
+# would and checks the rows against one plain query
+if __name__ == "__main__":
+    from db.tables import configure_database
+
+    configure_database(argv[1])
+    pager = HistoryPager()
+    pager.start()
+    pager.reset(None, 0)
+
+    expected = list(Timeframe.select(Timeframe.ms).order_by(Timeframe.datetime.desc(), Timeframe.id.desc())
+                    .tuples().limit(50 * HistoryPager.PAGE_SIZE))
+    start = perf_counter()
+    first = 0
+    waits = 0
+    while first < len(expected):
+        page = first // pager.page_size
+        pager.want(page - 1, page + 1)
+        labels, pings = pager.window(first, pager.page_size)
+        if len(pings) == 0:
+            waits += 1
+            sleep(0.001)
+            continue
+        assert pings.tolist() == [row[0] for row in expected[first:first + len(pings)]], f"rows from {first}"
+        first += len(pings)
+    print(f"{first} rows in {perf_counter() - start:.2f}s, {pager.fetched} pages read, {waits} polls found nothing")
+
+    # back towards live, the pages in the lru come back without a query
+    fetched = pager.fetched
+    for page in range(49, 49 - HistoryPager.CACHE_PAGES + 2, -1):
+        pager.want(page - 1, page + 1)
+        labels, pings = pager.window(page * pager.page_size, 1)
+        assert len(pings) == 1, f"page {page} should still be cached"
+    print(f"scrolled back over {HistoryPager.CACHE_PAGES - 2} cached pages, {pager.fetched - fetched} more read")
+
+    # a session from a ring holding the newest rows down to part of one tick picks up right behind the last held row
+    held = list(Timeframe.select(Timeframe.datetime)
+                .order_by(Timeframe.datetime.desc(), Timeframe.id.desc()).tuples().limit(1234))
+    if held:
+        oldest = held[-1][0]
+        pager.reset(Timeframe.datetime.db_value(oldest), sum(1 for row in held if row[0] == oldest))
+        while True:
+            pager.want(-1, 1)
+            labels, pings = pager.window(0, pager.page_size)
+            if len(pings) > 0:
+                break
+            sleep(0.001)
+        assert pings.tolist() == [row[0] for row in expected[len(held):len(held) + len(pings)]], "session start"
+        print(f"a session from {len(held)} held rows starts right behind them")
+    pager.stop()
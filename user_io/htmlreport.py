@@ -0,0 +1,190 @@
+import html
+import json
+import os
+import re
+from typing import Dict, List
+
+import numpy as np
+
+from user_io.summary import BinnedSeries, RangeSummary
+
+# every level halves the one before it, the browser picks the coarsest one that still has a bucket per pixel
+# for the visible range, so zooming in swaps to finer buckets without going back to the database
+HTML_BINS = 1 << 14
+HTML_LEVELS = 6
+
+# d3 v7 ships next to this file (see d3.LICENSE) and is inlined into every report, so the file opens offline
+D3_LOCAL = os.path.join(os.path.dirname(__file__), "d3.min.js")
+
+
+def rounded(values: np.ndarray) -> List:
+    # nan has no json, empty buckets become null
+    return [None if v != v else v for v in np.round(values, 1).tolist()]
+
+
+# min/max per bucket keeps spikes and drops that an average alone would smooth away, the pairwise merge of
+# the finest level gives exactly what a coarser binning of the raw rows would have given
+def zoom_levels(binned: BinnedSeries, rate=False) -> List[Dict]:
+    count, total, low, high, failed = binned.count, binned.sum, binned.min, binned.max, binned.failed
+    levels = []
+    for level in range(HTML_LEVELS):
+        if level > 0:
+            count = count.reshape(-1, 2).sum(axis=1)
+            total = total.reshape(-1, 2).sum(axis=1)
+            low = low.reshape(-1, 2).min(axis=1)
+            high = high.reshape(-1, 2).max(axis=1)
+            failed = failed.reshape(-1, 2).sum(axis=1)
+
+        bucket_ms = binned.span_ms / len(count)
+        kept = np.flatnonzero((count > 0) | (failed > 0))
+        seen = count[kept] > 0
+        entry = dict(bucket_ms=bucket_ms, i=kept.tolist())
+        if rate:
+            # bytes per second, so the value doesn't depend on the bucket size of the level
+            entry["y"] = rounded(total[kept] / (bucket_ms / 1000))
+        else:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                entry["y"] = rounded(np.where(seen, total[kept] / count[kept], np.nan))
+            entry["lo"] = rounded(np.where(seen, low[kept], np.nan))
+            entry["hi"] = rounded(np.where(seen, high[kept], np.nan))
+            entry["failed"] = failed[kept].tolist()
+        levels.append(entry)
+
+    return levels
+
+
+def report_data(summary: RangeSummary, title: str, offset_ms: int) -> Dict:
+    series = []
+    for stats in summary.pings.values():
+        series.append(dict(title=f"Interface {stats.interface or 'unknown'} server {stats.receiver}", unit="ms",
+                           stats=f"{stats.pings} pings, {stats.failed} failed, {stats.availability():.3f}% available",
+                           levels=zoom_levels(stats.binned)))
+    for stats in summary.traffic.values():
+        series.append(dict(title=f"Traffic on {stats.interface or 'unknown'}", unit="bytes/s",
+                           stats=f"{stats.packets} packets, {stats.bytes} bytes",
+                           levels=zoom_levels(stats.binned, rate=True)))
+
+    return dict(title=title, start_ms=summary.start_ms, end_ms=summary.end_ms, offset_ms=offset_ms,
+                bins=summary.bins, series=series)
+
+
+def write_report(path: str, data: Dict):
+    # a report that needs the network to draw isn't what -html promises, no silent cdn fallback
+    if not os.path.isfile(D3_LOCAL):
+        raise FileNotFoundError(f"{D3_LOCAL} is missing, the html report inlines d3 from it.")
+    with open(D3_LOCAL, encoding="utf-8") as file:
+        d3 = file.read()
+
+    # names come from the capture (interfaces, servers), a "</script>" or "<!--" in one must not end the script
+    # early, every < goes in as its json escape
+    payload = json.dumps(data, separators=(",", ":")).replace("<", "\\u003c")
+    # one pass, so a placeholder that turns up inside the title or the data is left alone
+    parts = {"{title}": html.escape(data["title"]), "{d3}": f"<script>{d3}</script>", "{data}": payload}
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(re.sub(r"\{(?:title|d3|data)\}", lambda match: parts[match.group(0)], HTML_TEMPLATE))
+
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body { font-family: sans-serif; margin: 20px; }
+h2 { font-size: 14px; margin: 12px 0 2px 0; }
+.stats { font-size: 12px; color: #555; }
+.band { fill: steelblue; opacity: 0.25; }
+.line { fill: none; stroke: steelblue; stroke-width: 1; }
+.failed { fill: none; stroke: red; stroke-width: 1.5; }
+</style>
+{d3}
+</head>
+<body>
+<h1>{title}</h1>
+<p class="stats">Scroll to zoom, drag to pan, double click to reset. All charts share the time axis.</p>
+<div id="charts"></div>
+<script>
+const REPORT = {data};
+const margin = {top: 10, right: 20, bottom: 24, left: 70};
+const width = Math.max(600, window.innerWidth - 60), height = 170;
+// shifted to the wall clock the report was generated in and drawn as utc, like the other outputs
+const shift = REPORT.offset_ms;
+const x0 = d3.scaleUtc()
+    .domain([new Date(REPORT.start_ms + shift), new Date(REPORT.end_ms + shift)])
+    .range([margin.left, width - margin.right]);
+let x = x0;
+const charts = [];
+
+function pointsOf(series, level) {
+  series.cache = series.cache || {};
+  if (series.cache[level]) return series.cache[level];
+  const l = series.levels[level], points = [];
+  for (let k = 0; k < l.i.length; k++) {
+    if (k > 0 && l.i[k] !== l.i[k - 1] + 1) points.push(null);  // empty buckets break the line
+    points.push({t: new Date(REPORT.start_ms + shift + l.i[k] * l.bucket_ms), y: l.y[k],
+                 lo: l.lo ? l.lo[k] : null, hi: l.hi ? l.hi[k] : null, failed: l.failed ? l.failed[k] : 0});
+  }
+  return series.cache[level] = points;
+}
+
+function levelFor(series) {
+  const [a, b] = x.domain(), pixels = width - margin.left - margin.right;
+  for (let level = series.levels.length - 1; level > 0; level--) {
+    if ((b - a) / series.levels[level].bucket_ms >= pixels) return level;
+  }
+  return 0;
+}
+
+function draw(chart) {
+  const points = pointsOf(chart.series, levelFor(chart.series));
+  const [a, b] = x.domain();
+  const visible = points.filter(p => p === null || (p.t >= a - chart.series.levels[0].bucket_ms && p.t <= b));
+  const defined = p => p !== null && p.y !== null;
+  chart.line.attr("d", d3.line().defined(defined).x(p => x(p.t)).y(p => chart.y(p.y))(visible));
+  if (chart.band) {
+    chart.band.attr("d", d3.area().defined(p => p !== null && p.lo !== null)
+        .x(p => x(p.t)).y0(p => chart.y(p.lo)).y1(p => chart.y(p.hi))(visible));
+    const bottom = height - margin.bottom;
+    chart.failed.attr("d", visible.filter(p => p !== null && p.failed > 0)
+        .map(p => `M${x(p.t).toFixed(1)},${bottom}v-8`).join(""));
+  }
+  chart.axis.call(d3.axisBottom(x).ticks(width / 110));
+}
+
+const zoom = d3.zoom()
+    .scaleExtent([1, REPORT.bins / 4])
+    .translateExtent([[margin.left, 0], [width - margin.right, height]])
+    .extent([[margin.left, 0], [width - margin.right, height]])
+    .on("zoom", event => {
+      x = event.transform.rescaleX(x0);
+      // keep every chart on the same transform so the next gesture on another chart doesn't jump
+      charts.forEach(chart => chart.svg.property("__zoom", event.transform));
+      charts.forEach(draw);
+    });
+
+REPORT.series.forEach(series => {
+  const root = d3.select("#charts").append("div");
+  root.append("h2").text(series.title);
+  root.append("div").attr("class", "stats").text(series.stats);
+  const svg = root.append("svg").attr("width", width).attr("height", height);
+  const top = d3.max(series.levels[0].hi || series.levels[0].y) || 1;
+  const y = d3.scaleLinear().domain([0, top]).nice().range([height - margin.bottom, margin.top]);
+  const id = "clip" + charts.length;
+  svg.append("clipPath").attr("id", id).append("rect")
+      .attr("x", margin.left).attr("y", 0).attr("width", width - margin.left - margin.right).attr("height", height);
+  const plot = svg.append("g").attr("clip-path", `url(#${id})`);
+  const chart = {series, svg, y,
+                 band: series.levels[0].lo ? plot.append("path").attr("class", "band") : null,
+                 line: plot.append("path").attr("class", "line"),
+                 failed: plot.append("path").attr("class", "failed"),
+                 axis: svg.append("g").attr("transform", `translate(0,${height - margin.bottom})`)};
+  svg.append("g").attr("transform", `translate(${margin.left},0)`).call(d3.axisLeft(y).ticks(5));
+  svg.append("text").attr("x", 4).attr("y", margin.top + 8).attr("font-size", 11).text(series.unit);
+  svg.call(zoom).on("dblclick.zoom", () => svg.transition().call(zoom.transform, d3.zoomIdentity));
+  charts.push(chart);
+  draw(chart);
+});
+</script>
+</body>
+</html>
+"""
@@ -0,0 +1,225 @@
+from bisect import bisect_right
+from sys import argv
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from db.columns import TimestampColumns, Categories
+
+
+class Outage:
+    def __init__(self, interface, receiver, start_ms: int, end_ms: int, samples: int):
+        self.interface = interface
+        self.receiver = receiver  # readable name
+        self.start_ms = start_ms  # first failed ping
+        self.end_ms = end_ms  # first ping that got through again, the last failed one if the range ended first
+        self.samples = samples  # failed pings in the run
+
+    def duration_s(self) -> float:
+        return (self.end_ms - self.start_ms) / 1000
+
+    def __str__(self):
+        return f"Outage of {self.receiver} on {self.interface}: {self.samples} failed pings, {self.duration_s()}s"
+
+
+# running count/min/max/average and a histogram of span lengths, spans themselves aren't kept
+class SpanStats:
+    HISTOGRAM_EDGES_S = [0, 60, 300, 900, 3600, 6 * 3600, 24 * 3600, 7 * 24 * 3600]
+    HISTOGRAM_LABELS = ["<1m", "1-5m", "5-15m", "15m-1h", "1-6h", "6-24h", "1-7d", ">7d"]
+
+    def __init__(self):
+        self.count = 0
+        self.total_s = 0
+        self.min_s = None
+        self.max_s = None
+        self.histogram = [0] * len(SpanStats.HISTOGRAM_EDGES_S)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total_s += seconds
+        self.min_s = seconds if self.min_s is None else min(self.min_s, seconds)
+        self.max_s = seconds if self.max_s is None else max(self.max_s, seconds)
+        self.histogram[max(bisect_right(SpanStats.HISTOGRAM_EDGES_S, seconds) - 1, 0)] += 1
+
+    def average_s(self):
+        return self.total_s / self.count if self.count else None
+
+
+class SeriesRuns:
+    def __init__(self, interface, receiver):
+        self.interface = interface
+        self.receiver = receiver  # readable name
+
+        self.up_start = None  # first ping of the running connectivity span
+        self.last_ok = None  # last ping that got through
+        self.drop = None  # [start ms, last failed ms, failed pings] of the running drop
+        self.uptime = SpanStats()
+        self.outages = SpanStats()
+
+
+# incremental run length engine over failed pings (interface_dead or ms <= 0) per interface/server.
+# drops shorter than drop_threshold failed pings are merged into the connectivity span around them, longer ones come
+# out as outages and end the span. the state of each series carries over chunk borders, so the result doesn't depend
+# on how the range was chunked and nothing but the running spans is kept in memory
+class OutageDetector:
+    def __init__(self, drop_threshold: int = 1):
+        self.drop_threshold = max(drop_threshold, 1)
+        self.series: Dict[Tuple, SeriesRuns] = {}
+
+    @staticmethod
+    def failed(columns: TimestampColumns) -> np.ndarray:
+        # same rule the rollups count dead pings with
+        return columns.dead | (columns.ms <= 0)
+
+    def close_span(self, runs: SeriesRuns):
+        if runs.up_start is not None:
+            runs.uptime.add((runs.last_ok - runs.up_start) / 1000)
+        runs.up_start = None
+
+    # the drop ended at end_ms, either it's an outage or it disappears into the connectivity span
+    def close_drop(self, runs: SeriesRuns, end_ms: int) -> List[Outage]:
+        start_ms, _, samples = runs.drop
+        runs.drop = None
+        if samples < self.drop_threshold:
+            return []
+
+        self.close_span(runs)
+        outage = Outage(runs.interface, runs.receiver, start_ms, end_ms, samples)
+        runs.outages.add(outage.duration_s())
+        return [outage]
+
+    # returns the outages that ended inside this chunk, chunks of one query have to come in time order
+    def feed(self, columns: TimestampColumns) -> List[Outage]:
+        outages = []
+        failed = OutageDetector.failed(columns)
+        # codes come from the same Categories for every chunk of one query, so they're stable keys
+        key_codes = (columns.interface.astype(np.int64) << 32) | columns.receiver.astype(np.int64)
+
+        for key_code in np.unique(key_codes):
+            idx = np.flatnonzero(key_codes == key_code)
+            key = (int(columns.interface[idx[0]]), int(columns.receiver[idx[0]]))
+            runs = self.series.get(key)
+            if runs is None:
+                runs = self.series[key] = SeriesRuns(
+                    columns.interfaces[key[0]], columns.receivers_readable[columns.receiver_readable[idx[0]]])
+
+            dead = failed[idx]
+            times = columns.epoch_ms[idx].tolist()
+            # run boundaries, every run is all failed or all ok
+            bounds = np.concatenate(([0], np.flatnonzero(dead[1:] != dead[:-1]) + 1, [len(idx)])).tolist()
+
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                if dead[start]:
+                    if runs.drop is None:
+                        runs.drop = [times[start], times[end - 1], end - start]
+                    else:
+                        runs.drop[1] = times[end - 1]
+                        runs.drop[2] += end - start
+                else:
+                    if runs.drop is not None:
+                        outages += self.close_drop(runs, times[start])
+                    if runs.up_start is None:
+                        runs.up_start = times[start]
+                    runs.last_ok = times[end - 1]
+
+        return outages
+
+    # closes whatever is still running when the data ran out, an open outage ends at its last failed ping
+    def finish(self) -> List[Outage]:
+        outages = []
+        for runs in self.series.values():
+            if runs.drop is not None:
+                outages += self.close_drop(runs, runs.drop[1])
+            self.close_span(runs)
+        return sorted(outages, key=lambda o: o.start_ms)
+
+
+# synthetic checks, python -m user_io.outages [pings, default 100000]
+# the same random series is fed in differently sized chunks and compared with a plain per ping loop
+if __name__ == "__main__":
+    total = int(argv[1]) if len(argv) > 1 else 100000
+    rng = np.random.default_rng(1)
+
+    def make_series(n, servers):
+        # mostly up, with drops of random length so every threshold has something to merge
+        dead = np.zeros(n, dtype=bool)
+        for start in rng.integers(0, n, n // 200):
+            dead[start:start + int(rng.geometric(0.2))] = True
+        ms = np.where(dead, 0, rng.integers(5, 80, n)).astype(np.int32)
+        # a few failures are only visible through ms, the rest through interface_dead
+        only_ms = dead & (rng.random(n) < 0.1)
+        epoch_ms = 1700000000000 + (np.arange(n, dtype=np.int64) // servers) * 1000
+        receiver = (np.arange(n) % servers).astype(np.int32)
+        return epoch_ms, ms, dead & ~only_ms, receiver
+
+    def chunks_of(series, size):
+        epoch_ms, ms, dead, receiver = series
+        receivers, readable, interfaces = Categories(), Categories(), Categories()
+        receivers.encode([f"10.0.0.{i}" for i in range(receiver.max() + 1)])
+        readable.encode([f"server{i}" for i in range(receiver.max() + 1)])
+        interfaces.encode(["eth0"])
+        for first in range(0, len(ms), size):
+            part = slice(first, first + size)
+            n = len(ms[part])
+            yield TimestampColumns(epoch_ms[part], ms[part], np.full(n, 1000, dtype=np.int32), dead[part],
+                                   receiver[part], receiver[part], np.zeros(n, dtype=np.int32),
+                                   receivers, readable, interfaces)
+
+    def reference(series, threshold):
+        # one ping at a time, the way you'd do it on paper
+        epoch_ms, ms, dead, receiver = series
+        found = []
+        spans = {}
+        for server in np.unique(receiver):
+            sel = receiver == server
+            times, failed = epoch_ms[sel].tolist(), (dead[sel] | (ms[sel] <= 0)).tolist()
+            up_start = last_ok = drop_start = None
+            drop_count = 0
+            lengths = []
+            for t, f in zip(times, failed):
+                if f:
+                    if drop_start is None:
+                        drop_start, drop_count = t, 0
+                    drop_count += 1
+                    drop_last = t
+                    continue
+                if drop_start is not None and drop_count >= threshold:
+                    found.append((server, drop_start, t, drop_count))
+                    if up_start is not None:
+                        lengths.append((last_ok - up_start) / 1000)
+                    up_start = None
+                drop_start = None
+                if up_start is None:
+                    up_start = t
+                last_ok = t
+            if drop_start is not None and drop_count >= threshold:
+                found.append((server, drop_start, drop_last, drop_count))
+                if up_start is not None:
+                    lengths.append((last_ok - up_start) / 1000)
+                up_start = None
+            if up_start is not None:
+                lengths.append((last_ok - up_start) / 1000)
+            spans[server] = lengths
+        return sorted(found, key=lambda o: (o[1], o[0])), spans
+
+    series = make_series(total, 3)
+    for threshold in (1, 3, 10):
+        expected, expected_spans = reference(series, threshold)
+        for size in (1, 7, 1000, total):
+            detector = OutageDetector(threshold)
+            outages = []
+            for chunk in chunks_of(series, size):
+                outages += detector.feed(chunk)
+            outages += detector.finish()
+            got = sorted(((int(o.receiver[6:]), o.start_ms, o.end_ms, o.samples) for o in outages),
+                         key=lambda o: (o[1], o[0]))
+            assert got == expected, f"threshold {threshold}, chunk {size}: outages differ"
+
+            for (_, server), runs in detector.series.items():
+                lengths = expected_spans[server]
+                assert runs.uptime.count == len(lengths), f"threshold {threshold}, chunk {size}: span count"
+                assert abs(runs.uptime.total_s - sum(lengths)) < 1e-6
+                assert runs.uptime.max_s == max(lengths) and runs.uptime.min_s == min(lengths)
+                assert sum(runs.uptime.histogram) == len(lengths)
+
+        print(f"threshold {threshold}: {len(expected)} outages, same for chunks of 1, 7, 1000 and {total} pings")
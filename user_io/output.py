@@ -1,34 +1,47 @@
+import gzip
 import os
-import pickle as pl
-from datetime import datetime
-from time import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from time import time, perf_counter
 from typing import Generator as PyGenerator
-from typing import List, Callable, Tuple, AnyStr
+from typing import List, Callable, AnyStr, Dict
 
+import numpy as np
+from PIL import Image
 from fpdf import FPDF
 from matplotlib import pyplot
-from matplotlib import rcParams
-
-from db.tables import Packet, Timeframe
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from db.columns import TimestampColumns, PacketColumns, Categories, local_offset_ms, wall_clock
+from db.rollup import pick_granularity
+from db.tables import Timeframe, PingRollup, TrafficRollup
+from user_io.figurefile import save_figure, SavedFigure
+from user_io.htmlreport import HTML_BINS, report_data, write_report
+from user_io.outages import Outage, OutageDetector, SpanStats
+from user_io.pdfstream import StreamingPdf, PdfTable
+from user_io.summary import RangeSummary, BinnedSeries
 
 
 # TODO implement anon dictionary and matching
 # TODO graph split to different graph per 5 subplots
 
-# TODO onefile
-
-# TODO verbose_onefile with relaxed threshold
-# TODO should dump pdf with graph in landscape (not portrait)
-# TODO should report minimum time of continuous internet record
-# TODO should report maximum time of continuous internet record
-# TODO should report average time of continuous internet record
 # TODO maybe have a few nice graphs for averages, and a normal distribution graph
 
-# TODO make everything multiprocessed with a pool of processes as many as the computer's cores
-#  when the pool is filled, wait for a process to end then create a new one for a new chunk, ad naseum
-#  when the chunks end wait for all the processes to finish
-#  make all IO-bound activities with threads on these subprocesses
-#  possibly, make it flag activated
+# TODO make csv/pdf multiprocessed too, graphs already render on a pool with -workers <n>
 
 
 class DataPlotPoint:
@@ -48,11 +61,57 @@ class DataPlotPoint:
         return f"Title: {self.title}\nReceiver: {self.r}\n\tX axis: {self.x}\n\tY axis: {self.y}\n\tZ axis: {self.z}"
 
 
+# module level so it can be sent to the worker processes, only uses the object oriented api on an Agg canvas,
+# so no pyplot global state is shared between charts and the output doesn't depend on which process drew it
+def render_chart(path: str, suptitle: str, graph_data: List[DataPlotPoint], ylabel: str, pickle_dump: bool):
+    figure = Figure(figsize=(11.7, 16.6))
+    FigureCanvasAgg(figure)
+    figure.subplots_adjust(hspace=1.5)
+
+    ax = None
+    for i in range(len(graph_data)):
+        data = graph_data[i]
+        ax = figure.add_subplot(len(graph_data), 1, i + 1)
+
+        ax.plot(data.x, data.y)
+        ax.set_title(data.title)
+        ax.set_xlabel("Dates")
+        ax.set_ylabel(ylabel)
+
+        ax.set_ylim((0, data.ylim))
+    figure.suptitle(suptitle)
+
+    # I kid you not, he turns himself into a pickle. (an npz of the series, see user_io.figurefile)
+    if pickle_dump and ax is not None:
+        print(f"Dumping figure...{path}.npz")
+        save_figure(path, suptitle, graph_data, ylabel)
+
+    print(f"Outputting...{path}.jpg")
+    figure.savefig(f"{path}.jpg", bbox_inches="tight", dpi=300)
+
+
 class Generator:
     TIMESTAMP_INFIX = "TIMESTAMP"
     PACKET_INFIX = "PACKET"
-
-    def __init__(self):
+    FLOW_INFIX = "FLOW"
+    MAX_IN_FLIGHT_PER_WORKER = 2
+
+    CSV_ISO = "iso"  # local wall clock, YYYY-MM-DDTHH:MM:SS.mmm
+    CSV_EPOCH = "epoch"  # ms since the epoch, as stored
+    CSV_BUFFER_SIZE = 1 << 20
+    GZIP = "gzip"
+    ZSTD = "zstd"
+    GZIP_LEVEL = 6  # 9 roughly halves the throughput for a few % smaller files
+    PARQUET_COMPRESSION = "zstd"
+    PDF_PAGES_PER_FILE = 5000
+    GRAPH_ROLLUP_AFTER = timedelta(days=1)  # longer -graph ranges are drawn from the rollups
+    GRAPH_MAX_POINTS = 2000  # buckets per series, decides the rollup granularity
+    VERBOSE_OUTAGE_ROWS = 2000
+
+    def __init__(self, workers=1, csv_time=CSV_ISO, compression=None):
+        self.workers = workers
+        self.csv_time = csv_time
+        self.compression = compression
         self.output_path = None
         self.postfix = 0
 
@@ -85,372 +144,725 @@ class Generator:
         # clean up any files / reset all
         pass
 
-    def get_all_ips_from_timestamp(self, chunk: List[Timeframe]) -> List:
-        ips = []
-
-        timestamp: Timeframe
-        for timestamp in chunk:
-            if timestamp.interface not in ips:
-                ips.append(timestamp.interface)
-
-        return ips
-
-    def get_all_servers_for_ip_from_timestamp(self, chunk: List[Timeframe], ip) -> List:
-        servers = []
-        servers_return = []
-
-        timestamp: Timeframe
-        for timestamp in chunk:
-            if timestamp.interface == ip and timestamp.receiver not in servers:
-                servers.append(timestamp.receiver)
-
-                servers_return.append((timestamp.receiver, timestamp.receiver_readable))
-
-        return servers_return
+    # row indices per distinct (outer, inner) code pair, ordered by first appearance of the outer code,
+    # then by first appearance of the pair within it
+    def group_column_indices(self, outer: np.ndarray, inner: np.ndarray = None) -> List[np.ndarray]:
+        if len(outer) == 0:
+            return []
 
-    def get_all_data_points_for_ip_server_combo_from_timestamp(self, chunk: List[Timeframe],
-                                                               ip, server) -> Tuple[List, List, int]:
-        data = []
-        dates = []
-        maxy = 1
+        key = outer.astype(np.int64)
+        if inner is not None:
+            key = (key << 32) | inner.astype(np.int64)
 
-        timestamp: Timeframe
-        for timestamp in chunk:
-            if timestamp.interface == ip and timestamp.receiver == server:
-                data.append(timestamp.ms)
-                dates.append(timestamp.datetime)
+        _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+        _, outer_first_of = np.unique(outer, return_inverse=True)
+        outer_first = np.full(outer_first_of.max() + 1, len(outer))
+        np.minimum.at(outer_first, outer_first_of, np.arange(len(outer)))
 
-                if timestamp.limit > timestamp.ms > maxy:
-                    maxy = timestamp.ms
-
-        return data, dates, maxy
-
-    def generate_timestamp_data_plot_obj_from(self, chunk: List[Timeframe],
-                                              x_format: Callable[[List], List] = None,
-                                              y_format: Callable[[List], List] = None) -> List[DataPlotPoint]:
-        ips: List = self.get_all_ips_from_timestamp(chunk)
-        servers: List = []
+        groups = np.split(np.argsort(inverse, kind='stable'), np.cumsum(np.bincount(inverse))[:-1])
+        order = np.lexsort((first, outer_first[outer_first_of[first]]))
+        return [groups[g] for g in order]
 
+    def generate_timestamp_data_plot_obj_from_columns(self, columns: TimestampColumns) -> List[DataPlotPoint]:
         plotpoints: List[DataPlotPoint] = []
+        dates = columns.datetimes()
 
-        for ip in ips:
-            servers.append(self.get_all_servers_for_ip_from_timestamp(chunk, ip))
-
-        # ips and servers are parallel lists, for each val in ip, a list of servers exists in servers[[]]
-        for i in range(len(ips)):
-            for server_tuple in servers[i]:
-                ip = ips[i]
-                server_ip = server_tuple[0]
-                server_readable = server_tuple[1]
-
-                name = f"Interface {ip if ip is not None else 'unknown'} server {server_readable}"
-                data, dates, ylim = self.get_all_data_points_for_ip_server_combo_from_timestamp(chunk, ip, server_ip)
+        for idx in self.group_column_indices(columns.interface, columns.receiver):
+            ip = columns.interfaces[columns.interface[idx[0]]]
+            server_readable = columns.receivers_readable[columns.receiver_readable[idx[0]]]
+            data = columns.ms[idx]
 
-                if x_format is not None:
-                    dates = x_format(dates)
-                if y_format is not None:
-                    data = y_format(data)
+            below_limit = data[(data > 1) & (data < columns.limit[idx])]
+            ylim = int(below_limit.max()) if len(below_limit) else 1
 
-                plotpoints.append(DataPlotPoint(name, dates, data, receiver=server_readable, ylim=ylim))
+            name = f"Interface {ip if ip is not None else 'unknown'} server {server_readable}"
+            plotpoints.append(DataPlotPoint(name, dates[idx], data, receiver=server_readable, ylim=ylim))
 
         return plotpoints
 
-    def get_all_interfaces_from(self, chunk: List[Packet]) -> List:
-        interfaces = []
-
-        for packet in chunk:
-            if packet.interface_used not in interfaces:
-                interfaces.append(packet.interface_used)
+    def generate_packet_data_plot_obj_from_columns(self, columns: PacketColumns) -> List[DataPlotPoint]:
+        plotpoints: List[DataPlotPoint] = []
+        dates = columns.datetimes()
+        ls = len(columns)  # list size
 
-        return interfaces
+        for idx in self.group_column_indices(columns.interface):
+            sizes = columns.size[idx]
+            avg = sizes.sum() / ls
+            maxy = sizes.max()
+            # sizes that were below the largest size seen before them
+            below = sizes[sizes < np.maximum.accumulate(sizes)]
+            maxy_lower = below.max() if len(below) else 0
 
-    def format_packet_datetimes_for_interface_from(self, chunk: List[Packet], interface) -> List:
-        dates = []
+            lim = avg * 10
 
-        packet: Packet
-        for packet in chunk:
-            if packet.interface_used == interface:
-                dates.append(packet.datetime.strftime('%M %S %f'))
+            if maxy_lower > avg * 2:
+                lim = maxy_lower
 
-        return dates
+            if maxy > maxy_lower * 2:
+                lim = maxy
 
-    def get_all_packet_sizes_for_interface_from(self, chunk: List[Packet], interface) -> Tuple[List[int], int]:
-        sizes = []
-        avg = 0
-        maxy = 0
-        maxy_lower = 0
-        ls = len(chunk)  # list size
+            plotpoints.append(DataPlotPoint("", dates[idx], sizes, ylim=lim))
 
-        packet: Packet
-        for packet in chunk:
-            if packet.interface_used == interface:
-                sizes.append(packet.size)
-                avg += packet.size / ls
-                if maxy < packet.size:
-                    maxy = packet.size
+        return plotpoints
 
-                if maxy_lower < packet.size < maxy:
-                    maxy_lower = packet.size
+    def format_column_datetimes(self, epoch_ms: np.ndarray, separator=" ") -> np.ndarray:
+        if len(epoch_ms) == 0:
+            return np.array([], dtype=str)
+        formatted = np.datetime_as_string(wall_clock(epoch_ms), unit='ms')
+        return formatted if separator == "T" else np.char.replace(formatted, 'T', separator)
+
+    # rollup buckets instead of raw rows, one point per bucket, so a month at hour granularity is ~720 points a series
+    def generate_ping_rollup_data_plot_obj_from(self, rollups: List[PingRollup]) -> List[DataPlotPoint]:
+        series = {}
+
+        rollup: PingRollup
+        for rollup in rollups:
+            key = (rollup.interface, rollup.receiver)
+            if key not in series:
+                series[key] = ([], [], [], rollup.receiver_readable, 1)
+            dates, avgs, dead, readable, maxy = series[key]
+
+            alive = rollup.count - rollup.dead
+            avg = rollup.ms_sum / alive if alive > 0 else 0
+            dates.append(datetime.fromtimestamp(rollup.bucket))
+            avgs.append(avg)
+            dead.append(rollup.dead)
+            if avg > maxy:
+                series[key] = (dates, avgs, dead, readable, avg)
 
-        lim = avg * 10
+        plotpoints = []
+        for (interface, _), (dates, avgs, dead, readable, maxy) in series.items():
+            name = f"Interface {interface if interface else 'unknown'} server {readable}"
+            plotpoints.append(DataPlotPoint(name, dates, avgs, z=dead, receiver=readable, ylim=maxy))
 
-        if maxy_lower > avg * 2:
-            lim = maxy_lower
+        return plotpoints
 
-        if maxy > maxy_lower * 2:
-            lim = maxy
+    def generate_traffic_rollup_data_plot_obj_from(self, rollups: List[TrafficRollup]) -> List[DataPlotPoint]:
+        series = {}
 
-        return sizes, lim
+        rollup: TrafficRollup
+        for rollup in rollups:
+            dates, sizes, packets = series.setdefault(rollup.interface, ([], [], []))
+            dates.append(datetime.fromtimestamp(rollup.bucket))
+            sizes.append(rollup.bytes)
+            packets.append(rollup.packets)
 
-    def generate_packet_data_plot_obj_from(self, chunk: List[Packet],
-                                           x_format: Callable[[List], List] = None,
-                                           y_format: Callable[[List], List] = None) -> List[DataPlotPoint]:
         plotpoints = []
-        ifaces = self.get_all_interfaces_from(chunk)
-
-        for iface in ifaces:
-            dates = self.format_packet_datetimes_for_interface_from(chunk, iface)
-            sizes, ylim = self.get_all_packet_sizes_for_interface_from(chunk, iface)
-
-            if x_format is not None:
-                dates = x_format(dates)
-            if y_format is not None:
-                sizes = y_format(sizes)
-
-            plotpoints.append(DataPlotPoint("", dates, sizes, ylim=ylim))
+        for interface, (dates, sizes, packets) in series.items():
+            plotpoints.append(DataPlotPoint(f"Interface {interface if interface else 'unknown'}", dates, sizes,
+                                            z=packets, ylim=max(sizes) if sizes else 1))
 
         return plotpoints
 
-    def generate_timestamp_csv(self, generator: PyGenerator[List[Timeframe], None, None]):
+    def open_csv(self, infix: str):
+        path = f"{self.output_path}{infix}{self.postfix}.csv"
+        # compression happens on the fly while writing, nothing uncompressed ever hits the disk
+        if self.compression == Generator.GZIP:
+            return gzip.open(f"{path}.gz", "wt", newline="", compresslevel=Generator.GZIP_LEVEL)
+        if self.compression == Generator.ZSTD:
+            return zstandard.open(f"{path}.zst", "wt", newline="")
+        return open(path, "w", newline="", buffering=Generator.CSV_BUFFER_SIZE)
+
+    def csv_datetimes(self, epoch_ms: np.ndarray) -> List[str]:
+        if self.csv_time == Generator.CSV_EPOCH:
+            return list(map(str, epoch_ms.tolist()))
+        return self.format_column_datetimes(epoch_ms, separator="T").tolist()
+
+    # quoting is worked out once per distinct value instead of once per row, the rest of the columns are numbers
+    @staticmethod
+    def csv_categories(categories: Categories, codes: np.ndarray) -> List[str]:
+        escaped = ['"' + v.replace('"', '""') + '"' if any(c in v for c in ',"\r\n') else v
+                   for v in map(str, categories.values)]
+        return np.array(escaped, dtype=object)[codes].tolist()
+
+    # one buffered write per chunk straight from the columns, progress is printed per chunk instead of echoing rows
+    def write_csv_chunks(self, infix: str, chunks, fields_of: Callable):
+        rows = 0
+        start = perf_counter()
+        with self.open_csv(infix) as file:
+            for chunk in chunks:
+                if len(chunk) == 0:
+                    continue
+                file.write("\n".join(map(",".join, zip(*fields_of(chunk)))))
+                file.write("\n")
+                rows += len(chunk)
+
+                elapsed = perf_counter() - start
+                print(f"{infix} csv: {rows} rows written ({rows / elapsed if elapsed else 0:.0f} rows/s)")
+
+        print(f"{infix} csv: done, {rows} rows in {perf_counter() - start:.2f}s.")
+        return rows
+
+    def timestamp_csv_fields(self, columns: TimestampColumns) -> List[List[str]]:
+        return [list(map(str, columns.ms.tolist())), list(map(str, columns.limit.tolist())),
+                self.csv_categories(columns.receivers, columns.receiver),
+                self.csv_categories(columns.receivers_readable, columns.receiver_readable),
+                self.csv_categories(columns.interfaces, columns.interface),
+                np.where(columns.dead, "True", "False").tolist(),
+                self.csv_datetimes(columns.epoch_ms)]
+
+    def packet_csv_fields(self, columns: PacketColumns) -> List[List[str]]:
+        fields = [list(map(str, columns.size.tolist())),
+                  self.csv_categories(columns.addresses, columns.sender),
+                  self.csv_categories(columns.addresses, columns.receiver),
+                  self.csv_categories(columns.interfaces, columns.interface),
+                  self.csv_datetimes(columns.epoch_ms)]
+        if columns.packets is not None:
+            fields += [list(map(str, columns.packets.tolist())),
+                       self.csv_datetimes(columns.first_seen_ms),
+                       self.csv_datetimes(columns.last_seen_ms)]
+        return fields
+
+    def generate_timestamp_csv(self, generator: PyGenerator[TimestampColumns, None, None]):
+        print("Generating timestamp csv(s)...")
+        return self.write_csv_chunks(Generator.TIMESTAMP_INFIX, generator, self.timestamp_csv_fields)
+
+    # flows share the packet outputs, pass FLOW_INFIX with a flow generator to write them to their own files
+    def generate_packet_csv(self, generator: PyGenerator[PacketColumns, None, None], infix=PACKET_INFIX):
         print("Generating packet csv(s)...")
-        lc = 1
-        with open(f"{self.output_path}{Generator.TIMESTAMP_INFIX}{self.postfix}.csv", "w") as file:
-            for timestamps in generator:
-                for timestamp in timestamps:
-                    line = f"{timestamp.ms},{timestamp.limit},{timestamp.receiver},{timestamp.receiver_readable}," \
-                           f"{timestamp.interface},{timestamp.interface_dead},{timestamp.datetime}\n"
-                    file.write(line)
-                    print(f"{lc}Writing:\t{line}")
-                    lc += 1
-
-    def generate_packet_csv(self, generator: PyGenerator[List[Packet], None, None]):
-        print("Generating packet csv(s)...")
-        lc = 1
-        with open(f"{self.output_path}{Generator.PACKET_INFIX}{self.postfix}.csv", "w") as file:
-            for packets in generator:
-                for packet in packets:
-                    line = f"{packet.size},{packet.sender},{packet.receiver},{packet.interface_used}," \
-                           f"{packet.datetime}\n"
-                    file.write(line)
-                    print(f"{lc}Writing:\t{line}")
-                    lc += 1
-
-    def generate_timestamp_graph(self, generator: PyGenerator[List[Timeframe], None, None],
-                                 pickle_dump=False):
-        print("Generating timestamp graph(s)...")
+        return self.write_csv_chunks(infix, generator, self.packet_csv_fields)
+
+    # the Categories codes already are dictionary indices, so chunks go into arrow without touching the strings
+    @staticmethod
+    def arrow_dictionary(categories: Categories, codes: np.ndarray):
+        null_code = categories.codes.get(None)
+        mask = codes == null_code if null_code is not None else None
+        # parquet can't store a null inside the dictionary, the null slot gets a placeholder and is masked out
+        values = ["" if v is None else v for v in categories.values]
+        return pa.DictionaryArray.from_arrays(pa.array(codes, type=pa.int32(), mask=mask),
+                                              pa.array(values, type=pa.string()))
+
+    # the same naive wall clock the csv, pdf and html show, not the stored epoch
+    @staticmethod
+    def arrow_timestamps(epoch_ms: np.ndarray):
+        return pa.array(wall_clock(epoch_ms), type=pa.timestamp("ms"))
+
+    def timestamp_arrow_batch(self, columns: TimestampColumns):
+        return pa.record_batch([pa.array(columns.ms), pa.array(columns.limit),
+                                self.arrow_dictionary(columns.receivers, columns.receiver),
+                                self.arrow_dictionary(columns.receivers_readable, columns.receiver_readable),
+                                self.arrow_dictionary(columns.interfaces, columns.interface),
+                                pa.array(columns.dead),
+                                self.arrow_timestamps(columns.epoch_ms)],
+                               names=["ms", "limit", "receiver", "receiver_readable", "interface", "interface_dead",
+                                      "datetime"])
+
+    def packet_arrow_batch(self, columns: PacketColumns):
+        arrays = [pa.array(columns.size),
+                  self.arrow_dictionary(columns.addresses, columns.sender),
+                  self.arrow_dictionary(columns.addresses, columns.receiver),
+                  self.arrow_dictionary(columns.interfaces, columns.interface),
+                  self.arrow_timestamps(columns.epoch_ms)]
+        names = ["size", "sender", "receiver", "interface_used", "datetime"]
+        if columns.packets is not None:
+            arrays += [pa.array(columns.packets),
+                       self.arrow_timestamps(columns.first_seen_ms),
+                       self.arrow_timestamps(columns.last_seen_ms)]
+            names += ["packets", "first_seen", "last_seen"]
+        return pa.record_batch(arrays, names=names)
+
+    # every chunk becomes one row group, so memory stays bounded by -data however long the range is
+    def write_parquet_chunks(self, infix: str, chunks, batch_of: Callable):
+        path = f"{self.output_path}{infix}{self.postfix}.parquet"
+        rows = 0
+        start = perf_counter()
+        writer = None
+        try:
+            for chunk in chunks:
+                if len(chunk) == 0:
+                    continue
+                batch = batch_of(chunk)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, batch.schema, compression=Generator.PARQUET_COMPRESSION)
+                writer.write_batch(batch)
+                rows += len(chunk)
+
+                elapsed = perf_counter() - start
+                print(f"{infix} parquet: {rows} rows written ({rows / elapsed if elapsed else 0:.0f} rows/s)")
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if writer is None:
+            print(f"{infix} parquet: no rows in range, nothing written.")
+        else:
+            print(f"{infix} parquet: done, {rows} rows in {perf_counter() - start:.2f}s.")
+        return rows
+
+    def generate_timestamp_parquet(self, generator: PyGenerator[TimestampColumns, None, None]):
+        print("Generating timestamp parquet...")
+        return self.write_parquet_chunks(Generator.TIMESTAMP_INFIX, generator, self.timestamp_arrow_batch)
+
+    def generate_packet_parquet(self, generator: PyGenerator[PacketColumns, None, None], infix=PACKET_INFIX):
+        print("Generating packet parquet...")
+        return self.write_parquet_chunks(infix, generator, self.packet_arrow_batch)
+
+    # renders every chunk through render_chart, in a process pool when workers > 1. at most
+    # MAX_IN_FLIGHT_PER_WORKER chunks per worker are queued, so memory stays bounded however long the range is,
+    # and chunks are collected in submission order so file names follow the data order like the serial path
+    def render_graphs(self, chunks, plot_obj_from: Callable, infix: str, ylabel: str, pickle_dump: bool,
+                      graphs: List):
+        pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        in_flight = deque()
         index = 0
-        chunk: List[Timeframe]
-        for chunk in generator:
-            rcParams['figure.figsize'] = (11.7, 16.6)
-            pyplot.subplots_adjust(hspace=1.5)
-
-            graph_data: List[DataPlotPoint] = self.generate_timestamp_data_plot_obj_from(chunk)
-            ax = None
-            pltnum = 1
-            suptitle = f"{chunk[0].datetime.strftime('%y-%b-%d : %H %M')} - " \
-                       f"{chunk[-1].datetime.strftime('%y-%b-%d : %H %M')}"
-            for i in range(len(graph_data)):
-                data = graph_data[i]
-                ax = pyplot.subplot(len(graph_data), 1, pltnum)
-
-                ax.plot(data.x, data.y)
-                ax.set_title(data.title)
-                ax.set_xlabel("Dates")
-                ax.set_ylabel("ms")
-
-                ax.set_ylim((0, data.ylim))
-                pyplot.suptitle(suptitle)
-
-                pltnum += 1
-            # I kid you not, he turns himself into a pickle.
-            if pickle_dump and ax is not None:
-                print(f"Dumping pickle...{Generator.TIMESTAMP_INFIX}{index}{self.postfix}.p")
-                pl.dump(ax, open(f"{self.output_path}{Generator.TIMESTAMP_INFIX}{index}{self.postfix}.p", 'wb'))
-
-            print(f"Outputting...{Generator.TIMESTAMP_INFIX}{index}{self.postfix}.jpg")
-            pyplot.savefig(f"{self.output_path}{Generator.TIMESTAMP_INFIX}{index}{self.postfix}.jpg",
-                           bbox_inches="tight", dpi=300)
-            pyplot.close()
-
-            self.timestamp_graphs.append(f"{self.output_path}{Generator.TIMESTAMP_INFIX}{index}{self.postfix}.jpg")
-
-            index += 1
 
+        try:
+            for chunk in chunks:
+                graph_data: List[DataPlotPoint] = plot_obj_from(chunk)
+                dates = chunk.datetimes()[[0, -1]].astype(datetime)
+                suptitle = f"{dates[0].strftime('%y-%b-%d : %H %M')} - " \
+                           f"{dates[1].strftime('%y-%b-%d : %H %M')}"
+
+                path = f"{self.output_path}{infix}{index}{self.postfix}"
+                args = (path, suptitle, graph_data, ylabel, pickle_dump)
+                if pool is None:
+                    render_chart(*args)
+                    graphs.append(f"{path}.jpg")
+                else:
+                    in_flight.append((pool.submit(render_chart, *args), path))
+                    if len(in_flight) >= self.workers * Generator.MAX_IN_FLIGHT_PER_WORKER:
+                        future, done_path = in_flight.popleft()
+                        future.result()
+                        graphs.append(f"{done_path}.jpg")
+
+                index += 1
+
+            while in_flight:
+                future, done_path = in_flight.popleft()
+                future.result()
+                graphs.append(f"{done_path}.jpg")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def generate_timestamp_graph(self, generator: PyGenerator[TimestampColumns, None, None],
+                                 pickle_dump=False):
+        print("Generating timestamp graph(s)...")
+        self.render_graphs(generator, self.generate_timestamp_data_plot_obj_from_columns, Generator.TIMESTAMP_INFIX,
+                           "ms", pickle_dump, self.timestamp_graphs)
         self.timestamp_plot_flag = True
 
-    def generate_packet_graph(self, generator: PyGenerator[List[Packet], None, None],
-                              pickle_dump=False):
+    def generate_packet_graph(self, generator: PyGenerator[PacketColumns, None, None],
+                              pickle_dump=False, infix=PACKET_INFIX):
         print("Generating packet graph(s)...")
-        # do stuff
-        index = 0
-
-        chunk: List[Packet]
-        for chunk in generator:
-            rcParams['figure.figsize'] = (11.7, 16.6)
-            pyplot.subplots_adjust(hspace=1.5)
-
-            graph_data: List[DataPlotPoint] = self.generate_packet_data_plot_obj_from(chunk)
-            ax = None
-            pltnum = 1
-            suptitle = f"{chunk[0].datetime.strftime('%y-%b-%d : %H %M')} - " \
-                       f"{chunk[-1].datetime.strftime('%y-%b-%d : %H %M')}"
-
-            for i in range(len(graph_data)):
-                data = graph_data[i]
-                ax = pyplot.subplot(len(graph_data), 1, pltnum)
-
-                ax.plot(data.x, data.y)
-                ax.set_title(data.title)
-                ax.set_xlabel("Dates")
-                ax.set_ylabel("packet size")
-
-                ax.set_ylim((0, data.ylim))
-                pyplot.suptitle(suptitle)
-
-                pltnum += 1
-            # I kid you not, he turns himself into a pickle.
-            if pickle_dump and ax is not None:
-                print(f"Dumping pickle...{Generator.PACKET_INFIX}{index}{self.postfix}.p")
-                pl.dump(ax, open(f"{self.output_path}{Generator.PACKET_INFIX}{index}{self.postfix}.p", 'wb'))
-
-            print(f"Outputting...{Generator.PACKET_INFIX}{index}{self.postfix}.jpg")
-            pyplot.savefig(f"{self.output_path}{Generator.PACKET_INFIX}{index}{self.postfix}.jpg",
-                           bbox_inches="tight", dpi=300)
-            pyplot.close()
-
-            self.packet_graphs.append(f"{self.output_path}{Generator.PACKET_INFIX}{index}{self.postfix}.jpg")
-
-            index += 1
-
+        self.render_graphs(generator, self.generate_packet_data_plot_obj_from_columns, infix,
+                           "packet size" if infix == Generator.PACKET_INFIX else "bytes", pickle_dump,
+                           self.packet_graphs)
         self.packet_plot_flag = True
 
-    def get_new_pdf_instance(self):
-        pdf = FPDF()
-        pdf.set_font('Courier', '', 14)
-        pdf.add_page()
-        return pdf
-
-    def generate_timestamp_pdf(self, generator: PyGenerator[List[Timeframe], None, None]):
-        print("Generating timestamp pdf(s)...")
-        pdf = self.get_new_pdf_instance()
-        lines = 0
-        prev_line = 0
-        closed = False
-
-        for chunk in generator:
-            local_lines = 0
-
-            data_list = self.generate_timestamp_data_plot_obj_from(chunk)
-            # add title here
-            print(f"Got chunk, data list {len(data_list)}")
-            for data in data_list:
-                pdf.multi_cell(0, 12, data.title, 1, "C")
-                # x list holds date vals
-                # y list holds ms vals
-                for ms, date in enumerate(zip(data.y, data.x)):
-                    pdf.multi_cell(0, 8, f"{ms} ms, {date}", 1, "C")
-                    lines += 1
-                    local_lines += 1
-            closed = False
-
-            if lines > 50000:
-                print("Wrote too many lines in one pdf -- writing and starting on new file...")
-                pdf.close()
-
-                print(f"Saving pdf... {Generator.TIMESTAMP_INFIX}{self.postfix}_{prev_line + 1}_{prev_line + lines}")
-                pdf.output(f"{self.output_path}{Generator.TIMESTAMP_INFIX}{self.postfix}_"
-                           f"{prev_line + 1}_{prev_line + lines}.pdf", "F")
-
-                # update counters
-                prev_line += lines
-                lines = 0
-                closed = True
-
-                # reset to new instance
-                pdf = self.get_new_pdf_instance()
-
-            print("Wrote to pdf, moving to next chunk...")
-
-        if not closed:
-            print(f"Closing output stream having written {lines} lines.")
+    # finest rollup granularity that keeps the series of [datestart, dateend) under GRAPH_MAX_POINTS buckets
+    @staticmethod
+    def graph_granularity(datestart: datetime, dateend: datetime) -> int:
+        return pick_granularity(0, int((dateend - datestart).total_seconds()), Generator.GRAPH_MAX_POINTS)
+
+    # long ranges, one chart for the whole range with a point per rollup bucket instead of a chart per chunk of raw
+    # rows, so a month of pings reads a few thousand rollup rows
+    def generate_rollup_graph(self, datestart: datetime, dateend: datetime, ping_rollups: List[PingRollup],
+                              traffic_rollups: List[TrafficRollup], pickle_dump=False):
+        print("Generating rollup graph(s)...")
+        suptitle = f"{datestart.strftime('%y-%b-%d : %H %M')} - {dateend.strftime('%y-%b-%d : %H %M')}"
+
+        graph_data = self.generate_ping_rollup_data_plot_obj_from(ping_rollups)
+        if graph_data:
+            path = f"{self.output_path}{Generator.TIMESTAMP_INFIX}0{self.postfix}"
+            render_chart(path, suptitle, graph_data, "average ms", pickle_dump)
+            self.timestamp_graphs.append(f"{path}.jpg")
+            self.timestamp_plot_flag = True
+
+        graph_data = self.generate_traffic_rollup_data_plot_obj_from(traffic_rollups)
+        if graph_data:
+            path = f"{self.output_path}{Generator.PACKET_INFIX}0{self.postfix}"
+            render_chart(path, suptitle, graph_data, "bytes", pickle_dump)
+            self.packet_graphs.append(f"{path}.jpg")
+            self.packet_plot_flag = True
+
+    # category values as printable strings, missing ones (null interfaces) become the placeholder
+    @staticmethod
+    def category_strings(categories: Categories, codes: np.ndarray, missing="unknown") -> List[str]:
+        values = [missing if v is None else str(v) for v in categories.values]
+        return np.array(values, dtype=object)[codes].tolist()
+
+    # streams the table rows into pdfs of at most PDF_PAGES_PER_FILE pages, named by the rows they hold like before
+    def write_pdf_table(self, infix: str, title: str, headers: List[str], widths: List[int], chunks,
+                        fields_of: Callable):
+        def open_part():
+            pdf = StreamingPdf(f"{self.output_path}{infix}{self.postfix}.pdf.part")
+            return pdf, PdfTable(pdf, title, headers, widths)
+
+        def close_part(pdf: StreamingPdf, table: PdfTable, first_row: int):
+            table.close()
             pdf.close()
-
-            print(f"Outputting {self.output_path}{Generator.TIMESTAMP_INFIX}{self.postfix}_{prev_line + 1}_{lines}.pdf"
-                  f" with {lines} lines.")
-            pdf.output(f"{self.output_path}{Generator.TIMESTAMP_INFIX}{self.postfix}_"
-                       f"{prev_line + 1}_{prev_line + lines}.pdf", "F")
-
-    def generate_packet_pdf(self, generator: PyGenerator[List[Packet], None, None]):
-        print("Generating packet pdf(s)...")
-        pdf = self.get_new_pdf_instance()
-        lines = 0
-        prev_line = 0
-        closed = False
-
-        for chunk in generator:
-            local_lines = 0
-
-            data_list = self.generate_packet_data_plot_obj_from(chunk)
-            # add title here
-            print(f"Got chunk, data list {len(data_list)}")
-            for data in data_list:
-                pdf.multi_cell(0, 12, data.title, 1, "C")
-                # x list holds date vals
-                # y list holds ms vals
-                for ms, date in enumerate(zip(data.y, data.x)):
-                    pdf.multi_cell(0, 8, f"{ms} ms, {date}", 1, "C")
-                    lines += 1
-                    local_lines += 1
-            closed = False
-
-            if lines > 50000:
-                print("Wrote too many lines in one pdf -- writing and starting on new file...")
-                pdf.close()
-
-                print(f"Saving pdf... {Generator.PACKET_INFIX}{self.postfix}_{prev_line + 1}_{prev_line + lines}")
-                pdf.output(f"{self.output_path}{Generator.PACKET_INFIX}{self.postfix}_"
-                           f"{prev_line + 1}_{prev_line + lines}.pdf", "F")
-
-                # update counters
-                prev_line += lines
-                lines = 0
-                closed = True
-
-                # reset to new instance
-                pdf = self.get_new_pdf_instance()
-
-            print("Wrote to pdf, moving to next chunk...")
-
-        if not closed:
-            print(f"Closing output stream having written {lines} lines.")
+            path = f"{self.output_path}{infix}{self.postfix}_{first_row}_{first_row + table.rows - 1}.pdf"
+            os.replace(pdf.path, path)
+            print(f"Outputting {path} with {table.rows} rows, {len(pdf.pages)} pages.")
+            return table.rows
+
+        start = perf_counter()
+        pdf, table = open_part()
+        first_row = 1
+        for chunk in chunks:
+            table.add_lines(list(map(table.template.format, *fields_of(chunk))))
+            if pdf.page_count() >= Generator.PDF_PAGES_PER_FILE:
+                first_row += close_part(pdf, table, first_row)
+                pdf, table = open_part()
+
+        if table.rows or table.buffer or first_row == 1:
+            first_row += close_part(pdf, table, first_row)
+        else:
             pdf.close()
+            os.remove(pdf.path)
+
+        print(f"{infix} pdf: done, {first_row - 1} rows in {perf_counter() - start:.2f}s.")
+
+    def timestamp_pdf_fields(self, columns: TimestampColumns) -> List[List[str]]:
+        return [self.format_column_datetimes(columns.epoch_ms).tolist(),
+                self.category_strings(columns.interfaces, columns.interface),
+                self.category_strings(columns.receivers_readable, columns.receiver_readable),
+                list(map(str, columns.ms.tolist())),
+                np.where(OutageDetector.failed(columns), "DEAD", "").tolist()]
+
+    def packet_pdf_fields(self, columns: PacketColumns) -> List[List[str]]:
+        fields = [self.format_column_datetimes(columns.epoch_ms).tolist(),
+                  self.category_strings(columns.interfaces, columns.interface),
+                  self.category_strings(columns.addresses, columns.sender),
+                  self.category_strings(columns.addresses, columns.receiver),
+                  list(map(str, columns.size.tolist()))]
+        if columns.packets is not None:
+            fields.append(list(map(str, columns.packets.tolist())))
+        return fields
+
+    def generate_timestamp_pdf(self, generator: PyGenerator[TimestampColumns, None, None]):
+        print("Generating timestamp pdf(s)...")
+        self.write_pdf_table(Generator.TIMESTAMP_INFIX, "Ping records",
+                             ["date", "interface", "server", "ms", ""], [24, 10, 13, 6, 5],
+                             generator, self.timestamp_pdf_fields)
 
-            print(f"Outputting {self.output_path}{Generator.PACKET_INFIX}{self.postfix}_{prev_line + 1}_{lines}.pdf"
-                  f" with {lines} lines.")
-            pdf.output(f"{self.output_path}{Generator.PACKET_INFIX}{self.postfix}_"
-                       f"{prev_line + 1}_{prev_line + lines}.pdf", "F")
+    def generate_packet_pdf(self, generator: PyGenerator[PacketColumns, None, None], infix=PACKET_INFIX):
+        print("Generating packet pdf(s)...")
+        if infix == Generator.FLOW_INFIX:
+            self.write_pdf_table(infix, "Flow records", ["window", "interface", "sender", "receiver", "bytes",
+                                                         "packets"], [24, 10, 16, 16, 11, 8],
+                                 generator, self.packet_pdf_fields)
+        else:
+            self.write_pdf_table(infix, "Packet records", ["date", "interface", "sender", "receiver", "size"],
+                                 [24, 10, 16, 16, 7], generator, self.packet_pdf_fields)
+
+    # aggregated stats instead of raw rows, the hourly tables come from the rollups and outages are only looked for in
+    # the windows with failed pings (see Dao.get_failed_ping_windows), one column generator per window.
+    # a month of 1s pings ends up a few pages
+    def generate_summary_pdf(self, datestart: datetime, dateend: datetime, ping_rollups: List[PingRollup],
+                             traffic_rollups: List[TrafficRollup], outage_windows):
+        print("Generating summary pdf...")
+        start = perf_counter()
+        path = f"{self.output_path}SUMMARY{self.postfix}.pdf"
+        pdf = StreamingPdf(path)
+        period = f"{datestart.strftime('%Y-%m-%d %H:%M:%S')} - {dateend.strftime('%Y-%m-%d %H:%M:%S')}"
+
+        def hour(bucket) -> str:
+            return datetime.fromtimestamp(bucket).strftime("%Y-%m-%d %H:00")
+
+        def stamp(epoch_ms) -> str:
+            return datetime.fromtimestamp(epoch_ms / 1000).strftime("%Y-%m-%d %H:%M:%S")
+
+        def ms_stats(count, dead, ms_min, ms_max, ms_sum, ms_sum_sq):
+            alive = count - dead
+            if alive <= 0:
+                return ["-", "-", "-", "-"]
+            avg = ms_sum / alive
+            std = max(ms_sum_sq / alive - avg * avg, 0) ** 0.5
+            return [str(ms_min), f"{avg:.1f}", str(ms_max), f"{std:.1f}"]
+
+        # totals per interface/server over the whole range
+        totals: Dict = {}
+        rollup: PingRollup
+        for rollup in ping_rollups:
+            key = (rollup.interface or "unknown", rollup.receiver_readable)
+            total = totals.setdefault(key, [0, 0, None, None, 0, 0])
+            total[0] += rollup.count
+            total[1] += rollup.dead
+            if rollup.ms_min is not None:
+                total[2] = rollup.ms_min if total[2] is None else min(total[2], rollup.ms_min)
+                total[3] = rollup.ms_max if total[3] is None else max(total[3], rollup.ms_max)
+            total[4] += rollup.ms_sum
+            total[5] += rollup.ms_sum_sq
+
+        table = PdfTable(pdf, f"Summary {period}",
+                         ["interface", "server", "pings", "failed", "loss %", "min", "avg", "max", "std"],
+                         [16, 18, 10, 8, 8, 7, 8, 7, 8])
+        table.add_rows([interface, server, count, dead, f"{dead / count * 100:.2f}",
+                        *ms_stats(count, dead, *rest)]
+                       for (interface, server), (count, dead, *rest) in totals.items())
+        table.close()
+
+        outages: List[Outage] = []
+        for window in outage_windows:
+            # windows are apart by at least a minute of successful pings, nothing carries over between them
+            detector = OutageDetector()
+            for columns in window:
+                outages += detector.feed(columns)
+            outages += detector.finish()
+        outages.sort(key=lambda o: o.start_ms)
+
+        table = PdfTable(pdf, f"Outages {period}", ["interface", "server", "from", "to", "seconds", "failed"],
+                         [16, 18, 20, 20, 10, 8])
+        table.add_rows([o.interface or "unknown", o.receiver, stamp(o.start_ms), stamp(o.end_ms),
+                        f"{o.duration_s():.0f}", o.samples] for o in outages)
+        if not outages:
+            table.add_rows([["-", "no outages", "", "", "", ""]])
+        table.close()
+
+        table = PdfTable(pdf, f"Pings per hour {period}",
+                         ["hour", "interface", "server", "pings", "failed", "min", "avg", "max"],
+                         [17, 16, 18, 7, 7, 7, 8, 7])
+        table.add_rows([hour(r.bucket), r.interface or "unknown", r.receiver_readable, r.count, r.dead,
+                        *ms_stats(r.count, r.dead, r.ms_min, r.ms_max, r.ms_sum, r.ms_sum_sq)[:3]]
+                       for r in ping_rollups)
+        table.close()
+
+        if traffic_rollups:
+            table = PdfTable(pdf, f"Traffic per hour {period}", ["hour", "interface", "packets", "bytes"],
+                             [17, 16, 12, 16])
+            table.add_rows([hour(r.bucket), r.interface or "unknown", r.packets, r.bytes] for r in traffic_rollups)
+            table.close()
+
+        pdf.close()
+        print(f"Outputting {path}, {len(pdf.pages)} pages, {len(outages)} outages, took {perf_counter() - start:.2f}s.")
+
+    # OO api on an Agg canvas like render_chart, one subplot per server (average with the min-max band, failed pings
+    # as red ticks at the bottom) and one for the traffic of every interface
+    def render_summary_chart(self, summary: RangeSummary, path: str):
+        rows = max(len(summary.pings) + (1 if summary.traffic else 0), 1)
+        figure = Figure(figsize=(11.7, max(8.3, 2.2 * rows)))
+        FigureCanvasAgg(figure)
+        figure.subplots_adjust(hspace=0.8)
+
+        def bin_dates(binned: BinnedSeries):
+            return wall_clock(binned.edges())
+
+        i = 1
+        for stats in summary.pings.values():
+            binned = stats.binned
+            dates = bin_dates(binned)
+            ax = figure.add_subplot(rows, 1, i)
+            seen = binned.count > 0
+            ax.fill_between(dates, np.where(seen, binned.min, np.nan), np.where(seen, binned.max, np.nan),
+                            alpha=0.3, linewidth=0)
+            ax.plot(dates, binned.averages(), linewidth=0.8)
+            down = binned.failed > 0
+            ax.plot(dates[down], np.zeros(int(down.sum())), "|", color="red", markersize=8)
+            ax.set_title(f"Interface {stats.interface or 'unknown'} server {stats.receiver}")
+            ax.set_ylabel("ms")
+            ax.set_ylim(bottom=0)
+            i += 1
+
+        if summary.traffic:
+            ax = figure.add_subplot(rows, 1, i)
+            for stats in summary.traffic.values():
+                ax.plot(bin_dates(stats.binned), stats.binned.sum, linewidth=0.8,
+                        label=stats.interface or "unknown")
+            ax.set_title("Traffic")
+            ax.set_ylabel("bytes")
+            ax.legend(loc="upper right")
+
+        print(f"Outputting...{path}")
+        figure.savefig(path, bbox_inches="tight", dpi=150)
+
+    @staticmethod
+    def pdf_table(pdf: FPDF, headers: List[str], widths: List[float], rows):
+        pdf.set_font('Courier', 'B', 9)
+        for header, width in zip(headers, widths):
+            pdf.cell(width, 6, header, 1, 0, "C")
+        pdf.ln()
+
+        pdf.set_font('Courier', '', 9)
+        for row in rows:
+            for cell, width in zip(row, widths):
+                pdf.cell(width, 5, str(cell), 1, 0, "C")
+            pdf.ln()
+
+    # landscape report of a RangeSummary, the caller can add more pages before outputting it
+    def summary_pdf(self, summary: RangeSummary, datestart: datetime, dateend: datetime, chart_path: str) -> FPDF:
+        def ms(value):
+            return "-" if value is None else f"{value:.1f}"
+
+        pdf = FPDF(orientation="L")
+        pdf.add_page()
+        pdf.set_font('Courier', 'B', 14)
+        pdf.cell(0, 10, f"Report {datestart.strftime('%Y-%m-%d %H:%M:%S')} - "
+                        f"{dateend.strftime('%Y-%m-%d %H:%M:%S')}", 0, 1, "C")
+        pdf.ln(4)
+
+        Generator.pdf_table(pdf, ["interface", "server", "pings", "failed", "available", "p50 ms", "p90 ms",
+                                  "p99 ms", "max ms"], [34, 44, 28, 22, 28, 28, 28, 28, 28],
+                            ([stats.interface or "unknown", stats.receiver, stats.pings, stats.failed,
+                              f"{stats.availability():.3f}%", ms(stats.rtt.quantile(0.5)),
+                              ms(stats.rtt.quantile(0.9)), ms(stats.rtt.quantile(0.99)), ms(stats.rtt.max)]
+                             for stats in summary.pings.values()))
+        pdf.ln(6)
+
+        if summary.traffic:
+            Generator.pdf_table(pdf, ["interface", "packets", "bytes", "average size"], [44, 40, 50, 40],
+                                ([stats.interface or "unknown", stats.packets, stats.bytes,
+                                  f"{stats.bytes / stats.packets:.0f}" if stats.packets else "-"]
+                                 for stats in summary.traffic.values()))
+
+        # chart on its own page, scaled to fit whichever side runs out first
+        pdf.add_page()
+        figure_w, figure_h = Image.open(chart_path).size
+        scale = min(277 / figure_w, 190 / figure_h)
+        pdf.image(chart_path, 10, 10, figure_w * scale, figure_h * scale)
+        return pdf
 
-    def generate_onefile(self, timestamp_generator: PyGenerator[List[Timeframe], None, None],
-                         packet_generator: PyGenerator[List[Packet], None, None]):
-        pass
+    # one pass over each generator, every chunk is folded into the summary and dropped, so memory doesn't depend on
+    # the length of the range
+    def summarize_range(self, timestamp_generator: PyGenerator[TimestampColumns, None, None],
+                        packet_generator: PyGenerator[PacketColumns, None, None],
+                        datestart: datetime, dateend: datetime, detector: OutageDetector = None,
+                        bins: int = RangeSummary.BINS) -> RangeSummary:
+        start = perf_counter()
+        summary = RangeSummary(Timeframe.datetime.db_value(datestart), Timeframe.datetime.db_value(dateend), bins)
+        for columns in timestamp_generator:
+            summary.add_timestamps(columns)
+            if detector is not None:
+                summary.outages += detector.feed(columns)
+        if detector is not None:
+            summary.outages = sorted(summary.outages + detector.finish(), key=lambda o: o.start_ms)
+        for columns in packet_generator:
+            summary.add_packets(columns)
+        print(f"Summarized {summary.rows} rows in {perf_counter() - start:.2f}s.")
+        return summary
+
+    def generate_onefile(self, timestamp_generator: PyGenerator[TimestampColumns, None, None],
+                         packet_generator: PyGenerator[PacketColumns, None, None],
+                         datestart: datetime, dateend: datetime):
+        summary = self.summarize_range(timestamp_generator, packet_generator, datestart, dateend)
+
+        chart_path = f"{self.output_path}ONEFILE{self.postfix}.jpg"
+        self.render_summary_chart(summary, chart_path)
+        pdf = self.summary_pdf(summary, datestart, dateend, chart_path)
+
+        print(f"Outputting {self.output_path}ONEFILE{self.postfix}.pdf")
+        pdf.output(f"{self.output_path}ONEFILE{self.postfix}.pdf", "F")
+
+    # the onefile report plus connectivity spans, outages and their histograms. drops shorter than drop_threshold
+    # failed pings don't break a span (see OutageDetector), the detector runs in the same pass as the summary
+    def generate_onefile_verbose(self, timestamp_generator: PyGenerator[TimestampColumns, None, None],
+                                 packet_generator: PyGenerator[PacketColumns, None, None],
+                                 datestart: datetime, dateend: datetime, drop_threshold):
+        detector = OutageDetector(drop_threshold)
+        summary = self.summarize_range(timestamp_generator, packet_generator, datestart, dateend, detector)
+        outages = summary.outages
+
+        chart_path = f"{self.output_path}VERBOSE_ONEFILE{self.postfix}.jpg"
+        self.render_summary_chart(summary, chart_path)
+        pdf = self.summary_pdf(summary, datestart, dateend, chart_path)
+
+        def duration(seconds):
+            if seconds is None:
+                return "-"
+            minutes, seconds = divmod(int(seconds), 60)
+            hours, minutes = divmod(minutes, 60)
+            return f"{hours}:{minutes:02}:{seconds:02}"
+
+        def stamp(epoch_ms) -> str:
+            return datetime.fromtimestamp(epoch_ms / 1000).strftime("%Y-%m-%d %H:%M:%S")
 
-    def generate_onefile_verbose(self, timestamp_generator: PyGenerator[List[Timeframe], None, None],
-                                 packet_generator: PyGenerator[List[Packet], None, None], drop_threshold):
-        pass
+        pdf.add_page()
+        pdf.set_font('Courier', 'B', 12)
+        pdf.cell(0, 8, f"Continuous connectivity, {detector.drop_threshold} failed ping(s) in a row make an outage",
+                 0, 1, "L")
+        Generator.pdf_table(pdf, ["interface", "server", "spans", "min", "average", "max", "outages",
+                                  "min", "average", "max"], [30, 40, 18, 26, 26, 26, 20, 26, 26, 26],
+                            ([runs.interface or "unknown", runs.receiver, runs.uptime.count,
+                              duration(runs.uptime.min_s), duration(runs.uptime.average_s()),
+                              duration(runs.uptime.max_s), runs.outages.count, duration(runs.outages.min_s),
+                              duration(runs.outages.average_s()), duration(runs.outages.max_s)]
+                             for runs in detector.series.values()))
+        pdf.ln(6)
+
+        for title, stats_of in (("Connectivity span lengths", lambda runs: runs.uptime),
+                                ("Outage lengths", lambda runs: runs.outages)):
+            pdf.set_font('Courier', 'B', 12)
+            pdf.cell(0, 8, title, 0, 1, "L")
+            Generator.pdf_table(pdf, ["server"] + SpanStats.HISTOGRAM_LABELS,
+                                [45] + [29] * len(SpanStats.HISTOGRAM_LABELS),
+                                ([runs.receiver] + stats_of(runs).histogram for runs in detector.series.values()))
+            pdf.ln(6)
 
-    def open_saved_pickles(self, pickles: List[AnyStr]):
+        pdf.add_page()
+        pdf.set_font('Courier', 'B', 12)
+        pdf.cell(0, 8, f"Outages ({len(outages)})", 0, 1, "L")
+        Generator.pdf_table(pdf, ["interface", "server", "from", "to", "duration", "failed pings"],
+                            [34, 44, 50, 50, 34, 34],
+                            ([o.interface or "unknown", o.receiver, stamp(o.start_ms), stamp(o.end_ms),
+                              duration(o.duration_s()), o.samples] for o in outages[:Generator.VERBOSE_OUTAGE_ROWS]))
+        if len(outages) > Generator.VERBOSE_OUTAGE_ROWS:
+            pdf.cell(0, 8, f"... and {len(outages) - Generator.VERBOSE_OUTAGE_ROWS} more, see the csv/pdf outputs",
+                     0, 1, "L")
+
+        print(f"Outputting {self.output_path}VERBOSE_ONEFILE{self.postfix}.pdf")
+        pdf.output(f"{self.output_path}VERBOSE_ONEFILE{self.postfix}.pdf", "F")
+
+    # interactive report, the same single pass as the onefile with a finer binning that the browser coarsens again
+    # while zooming (see user_io.htmlreport). the file size only depends on the bin count, not on the range length
+    def generate_html(self, timestamp_generator: PyGenerator[TimestampColumns, None, None],
+                      packet_generator: PyGenerator[PacketColumns, None, None],
+                      datestart: datetime, dateend: datetime):
+        summary = self.summarize_range(timestamp_generator, packet_generator, datestart, dateend, bins=HTML_BINS)
+        title = f"pywebwatcher2 {datestart.strftime('%Y-%m-%d %H:%M:%S')} - {dateend.strftime('%Y-%m-%d %H:%M:%S')}"
+
+        print(f"Outputting {self.output_path}HTML{self.postfix}.html")
+        write_report(f"{self.output_path}HTML{self.postfix}.html",
+                     report_data(summary, title, local_offset_ms(summary.start_ms)))
+
+    def open_saved_figures(self, paths: List[AnyStr]):
         # I'm pickle riiiiiiiiiick
-        for pickle_rick in pickles:
-            ax = pl.load(open(pickle_rick, 'rb'))
-            ax.figure.show()
+        start = perf_counter()
+        figures = [SavedFigure(path) for path in paths]
+        print(f"Opened {len(figures)} saved graph(s) in {(perf_counter() - start) * 1000:.1f}ms.")
+
+        for saved in figures:
+            # the series are only read and plotted when their turn comes
+            figure = saved.draw(pyplot.figure(figsize=(11.7, 16.6)))
+            figure.show()
             input("Press Enter to continue.")
+            pyplot.close(figure)
+            saved.close()
+
+
+# every export shows the same clock, checks that the datetimes of a chunk read the same from the parquet export as
+# from the csv one. the chunk spans the next dst change of the local timezone if it has one, run it under a TZ other
+# than UTC
+# python -m user_io.output <output dir>
+if __name__ == "__main__":
+    from contextlib import redirect_stdout
+    from sys import argv
+
+    if pa is None:
+        raise SystemExit("pyarrow isn't installed, nothing to check.")
+
+    now = int(time())
+    change = next((s for s in range(now, now + 366 * 24 * 3600, 3600)
+                   if local_offset_ms(s * 1000) != local_offset_ms(now * 1000)), now)
+    n = 2 * 3600 // 7
+    receivers, readable, interfaces = Categories(), Categories(), Categories()
+    receivers.encode(["8.8.8.8"])
+    readable.encode(["dns0"])
+    interfaces.encode(["eth0"])
+    zeros = np.zeros(n, dtype=np.int32)
+    check = TimestampColumns((change - 3600) * 1000 + np.arange(n, dtype=np.int64) * 7000, zeros + 20, zeros + 1000,
+                             np.zeros(n, dtype=bool), zeros, zeros, zeros, receivers, readable, interfaces)
+
+    generator = Generator()
+    generator.output_path = argv[1] + os.sep
+    generator.postfix = ""
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        generator.write_csv_chunks("CHECK", [check], generator.timestamp_csv_fields)
+        generator.write_parquet_chunks("CHECK", [check], generator.timestamp_arrow_batch)
+    with open(f"{generator.output_path}CHECK.csv") as file:
+        csv_datetimes = [line.rstrip("\n").split(",")[-1] for line in file]
+    parquet_datetimes = [value.as_py().isoformat(timespec="milliseconds") for value in
+                         pq.read_table(f"{generator.output_path}CHECK.parquet").column("datetime")]
+    assert parquet_datetimes == csv_datetimes, \
+        next((p, c) for p, c in zip(parquet_datetimes, csv_datetimes) if p != c)
+    print(f"parquet and csv agree on {n} rows from {csv_datetimes[0]} to {csv_datetimes[-1]}")
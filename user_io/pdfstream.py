@@ -0,0 +1,183 @@
+import zlib
+from typing import List
+
+# https://opensource.adobe.com/dc-acrobat-sdk-docs/pdfstandards/PDF32000_2008.pdf
+# fpdf keeps every page in memory until output(), this writes each page to disk as soon as it's finished,
+# only the object offsets and page numbers stay around. text and lines only, with the standard courier fonts so
+# nothing has to be embedded and every character is the same width, which is what the tables are laid out with
+CATALOG_OBJECT = 1
+PAGES_OBJECT = 2
+FONT_OBJECT = 3
+BOLD_FONT_OBJECT = 4
+FIRST_FREE_OBJECT = 5
+
+COURIER_WIDTH = 0.6  # glyph width as a fraction of the font size
+
+
+def escape(text: str) -> bytes:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") \
+        .encode("latin-1", errors="replace")
+
+
+class StreamingPdf:
+    PORTRAIT = (595.28, 841.89)  # a4, in points
+    LANDSCAPE = (841.89, 595.28)
+
+    def __init__(self, path: str, size=PORTRAIT):
+        self.path = path
+        self.width, self.height = size
+        self.file = open(path, "wb")
+        self.position = 0
+
+        self.offsets = {}
+        self.pages: List[int] = []
+        self.next_object = FIRST_FREE_OBJECT
+        self.content: List[bytes] = []
+        self.page_open = False
+
+        self.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self.write_object(FONT_OBJECT, b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier "
+                                       b"/Encoding /WinAnsiEncoding >>")
+        self.write_object(BOLD_FONT_OBJECT, b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier-Bold "
+                                            b"/Encoding /WinAnsiEncoding >>")
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self.position += len(data)
+
+    def write_object(self, number: int, body: bytes):
+        self.offsets[number] = self.position
+        self.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+    def new_object(self) -> int:
+        number = self.next_object
+        self.next_object += 1
+        return number
+
+    def add_page(self):
+        if self.page_open:
+            self.finish_page()
+        self.content = []
+        self.page_open = True
+
+    # coordinates are from the top left corner like fpdf, pdf itself counts from the bottom left
+    def text(self, x: float, y: float, text: str, size: float = 8, bold=False):
+        self.content.append(b"BT /F%d %.2f Tf %.2f %.2f Td (" % (2 if bold else 1, size, x, self.height - y)
+                            + escape(text) + b") Tj ET")
+
+    # one text object for a block of lines, way smaller than a Td per line when a page is mostly table rows
+    def lines(self, x: float, y: float, lines: List[str], size: float, leading: float):
+        self.content.append(b"BT /F1 %.2f Tf %.2f TL %.2f %.2f Td" % (size, leading, x, self.height - y))
+        self.content.append(b"(" + b") Tj T* (".join(escape(line) for line in lines) + b") Tj ET")
+
+    def line(self, x1: float, y1: float, x2: float, y2: float, width: float = 0.5):
+        self.content.append(b"%.2f w %.2f %.2f m %.2f %.2f l S" % (width, x1, self.height - y1, x2, self.height - y2))
+
+    def finish_page(self):
+        stream = zlib.compress(b"\n".join(self.content))
+        content_object = self.new_object()
+        self.write_object(content_object, b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream)
+                          + stream + b"\nendstream")
+
+        page_object = self.new_object()
+        self.write_object(page_object, b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] /Contents %d 0 R "
+                                       b"/Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> >> >>"
+                          % (PAGES_OBJECT, self.width, self.height, content_object, FONT_OBJECT, BOLD_FONT_OBJECT))
+        self.pages.append(page_object)
+        self.content = []
+        self.page_open = False
+
+    def close(self):
+        if self.page_open:
+            self.finish_page()
+        if not self.pages:
+            # a pdf needs at least one page to open
+            self.add_page()
+            self.finish_page()
+
+        kids = b" ".join(b"%d 0 R" % page for page in self.pages)
+        self.write_object(PAGES_OBJECT, b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(self.pages))
+        self.write_object(CATALOG_OBJECT, b"<< /Type /Catalog /Pages %d 0 R >>" % PAGES_OBJECT)
+
+        xref = self.position
+        entries = [b"0000000000 65535 f \n"]
+        for number in range(1, self.next_object):
+            entries.append(b"%010d 00000 n \n" % self.offsets[number])
+        self.write(b"xref\n0 %d\n" % self.next_object + b"".join(entries))
+        self.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                   % (self.next_object, CATALOG_OBJECT, xref))
+        self.file.close()
+
+    def page_count(self) -> int:
+        return len(self.pages) + (1 if self.page_open else 0)
+
+
+# fixed height rows of fixed width columns, laid out in as many side by side blocks as fit the page width.
+# rows are buffered for one page at most, so memory doesn't depend on how many rows go through
+class PdfTable:
+    MARGIN = 28
+    FONT_SIZE = 7
+    LEADING = 9
+    TITLE_SIZE = 10
+    BLOCK_GAP = 3  # characters between side by side blocks
+
+    def __init__(self, pdf: StreamingPdf, title: str, headers: List[str], widths: List[int]):
+        self.pdf = pdf
+        self.title = title
+        self.widths = widths
+        # left aligned and cut one short of the width so neighbouring columns never touch, takes strings only
+        self.template = "".join(f"{{:<{width}.{width - 1}}}" for width in widths)
+        self.header = self.template.format(*headers)
+
+        char_width = PdfTable.FONT_SIZE * COURIER_WIDTH
+        row_chars = sum(widths)
+        usable_chars = int((pdf.width - 2 * PdfTable.MARGIN) / char_width)
+        self.blocks = max(1, (usable_chars + PdfTable.BLOCK_GAP) // (row_chars + PdfTable.BLOCK_GAP))
+        self.block_width = (row_chars + PdfTable.BLOCK_GAP) * char_width
+
+        self.top = PdfTable.MARGIN + PdfTable.TITLE_SIZE + 2 * PdfTable.LEADING
+        self.rows_per_block = int((pdf.height - self.top - PdfTable.MARGIN) // PdfTable.LEADING)
+        self.rows_per_page = self.rows_per_block * self.blocks
+
+        self.buffer: List[str] = []
+        self.rows = 0
+
+    def add_rows(self, rows):
+        self.add_lines([self.template.format(*map(str, row)) for row in rows])
+
+    # rows already run through template, for callers that format whole string columns at once
+    def add_lines(self, lines: List[str]):
+        start = 0
+        while start < len(lines):
+            take = self.rows_per_page - len(self.buffer)
+            self.buffer.extend(lines[start:start + take])
+            start += take
+            if len(self.buffer) >= self.rows_per_page:
+                self.flush_page()
+
+    def flush_page(self):
+        if not self.buffer:
+            return
+
+        pdf = self.pdf
+        pdf.add_page()
+        pdf.text(PdfTable.MARGIN, PdfTable.MARGIN + PdfTable.TITLE_SIZE, self.title, size=PdfTable.TITLE_SIZE,
+                 bold=True)
+
+        header_y = PdfTable.MARGIN + PdfTable.TITLE_SIZE + PdfTable.LEADING + 2
+        for block in range(self.blocks):
+            rows = self.buffer[block * self.rows_per_block:(block + 1) * self.rows_per_block]
+            if not rows:
+                break
+            x = PdfTable.MARGIN + block * self.block_width
+            pdf.text(x, header_y, self.header, size=PdfTable.FONT_SIZE, bold=True)
+            pdf.line(x, header_y + 2, x + self.block_width - PdfTable.BLOCK_GAP * PdfTable.FONT_SIZE * COURIER_WIDTH,
+                     header_y + 2)
+            pdf.lines(x, self.top + PdfTable.LEADING - 2, rows, PdfTable.FONT_SIZE, PdfTable.LEADING)
+
+        self.rows += len(self.buffer)
+        self.buffer = []
+        pdf.finish_page()
+
+    def close(self):
+        self.flush_page()
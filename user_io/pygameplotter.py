@@ -1,8 +1,9 @@
 from abc import ABC, abstractmethod
-from typing import List, Tuple
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 
 import pygame
-from pygame.locals import RESIZABLE, QUIT, K_ESCAPE, K_LSHIFT, K_RSHIFT, VIDEORESIZE
+from pygame.locals import RESIZABLE, QUIT, K_ESCAPE, K_LSHIFT, K_RSHIFT, VIDEORESIZE, NOEVENT
 
 
 pygame.mixer.pre_init(44100, -16, 2, 2048)
@@ -24,6 +25,28 @@ class Stamp:
         self.label_offset = offset
 
 
+# rendered text surfaces by (text, colour), least recently used ones go first once capacity is reached. labels,
+# ticks and counters mostly repeat from frame to frame, so font rasterization only happens for new strings
+class TextCache:
+    CAPACITY = 512
+
+    def __init__(self, font: pygame.font.Font, capacity: int = CAPACITY):
+        self.font = font
+        self.capacity = capacity
+        self.surfaces: OrderedDict = OrderedDict()
+
+    def render(self, text: str, colour) -> pygame.surface.Surface:
+        key = (text, tuple(colour))
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = self.font.render(text, True, colour)
+            if len(self.surfaces) > self.capacity:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+
 class Scene(ABC):
     def __init__(self):
         pass
@@ -36,13 +59,27 @@ class Scene(ABC):
     def onTransition(self) -> int:
         pass
 
+    # the rects that changed, None when the whole screen did
     @abstractmethod
-    def render(self, screen):
+    def render(self, screen) -> Optional[List[pygame.Rect]]:
         pass
 
+    # scenes that don't keep track of their own changes are drawn every frame
+    def needs_redraw(self) -> bool:
+        return True
 
+    # the screen has to be drawn in full on the next render, after a resize, expose etc.
+    def invalidate(self):
+        pass
+
+
+# only renders when the scene has something new or an event came in, and only pushes the rects the scene reports to
+# the display. after IDLE_AFTER_MS without input the loop drops from tickrate to idle_tickrate and sleeps on the
+# event queue in between, so a window left open doesn't keep a core busy while it keeps showing new stamps
 class Engine:
     tickrate = 30
+    idle_tickrate = 4
+    IDLE_AFTER_MS = 1000
 
     def __init__(self, scenes_list: List[Scene], min_width_height: Tuple[int, int] = (300, 250),
                  start_width=630, start_height=325):
@@ -53,9 +90,11 @@ class Engine:
         self.is_shut_down = False
         self.reset = False
         self.screen = pygame.display.set_mode((start_width, start_height), RESIZABLE)
+        self.last_active = pygame.time.get_ticks()
 
     def main_loop(self):
-        for event in pygame.event.get():
+        events = pygame.event.get()
+        for event in events:
             if event.type == QUIT:
                 self.shutdown()
                 return
@@ -80,15 +119,37 @@ class Engine:
         if key_press[K_ESCAPE] and (key_press[K_LSHIFT] or key_press[K_RSHIFT]):
             self.shutdown()
 
+        previous_index = self.scene_index
         self.scene_index += self.scenes[self.scene_index].onTransition()
         if self.scene_index >= len(self.scenes):
             self.shutdown()
             return
 
-        self.scenes[self.scene_index].render(self.screen)
-
-        pygame.display.update()
-        self.clock.tick(Engine.tickrate)
+        scene = self.scenes[self.scene_index]
+        if events or self.scene_index != previous_index:
+            scene.invalidate()
+            # only input keeps the loop at the full tickrate, new data (a stamp every tester interval) is shown
+            # just as well at the idle rate and would otherwise never let the loop go idle
+            self.last_active = pygame.time.get_ticks()
+
+        if events or self.scene_index != previous_index or scene.needs_redraw():
+            rects = scene.render(self.screen)
+            if rects is None:
+                pygame.display.update()
+            elif rects:
+                pygame.display.update(rects)
+
+        if not self.idle():
+            self.clock.tick(Engine.tickrate)
+        else:
+            # wakes up early for input, whatever woke us goes back on the queue for the next loop
+            event = pygame.event.wait(1000 // Engine.idle_tickrate)
+            if event.type != NOEVENT:
+                pygame.event.post(event)
+            self.clock.tick()
+
+    def idle(self) -> bool:
+        return pygame.time.get_ticks() - self.last_active >= Engine.IDLE_AFTER_MS
 
     def shutdown(self):
         self.is_shut_down = True
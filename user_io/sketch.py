@@ -0,0 +1,81 @@
+from math import log, ceil
+
+import numpy as np
+
+
+# log bucketed quantile sketch (same idea as DDSketch, https://arxiv.org/abs/1908.10693): every value lands in the
+# bucket ceil(log_gamma(value)), so any quantile comes back within relative_accuracy of the real one. the bucket count
+# only grows with log(max value), a month of pings takes the same few hundred counters as a minute of them
+class QuantileSketch:
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = log(self.gamma)
+        self.bins = np.zeros(0, dtype=np.int64)
+        self.zeros = 0  # values <= 0, kept apart since they have no log
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, values: np.ndarray):
+        if len(values) == 0:
+            return
+
+        self.count += len(values)
+        low, high = values.min(), values.max()
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+        positive = values[values > 0]
+        self.zeros += len(values) - len(positive)
+        if len(positive) == 0:
+            return
+
+        # values under 1 (sub ms) share the first bucket, good enough for round trips
+        index = np.ceil(np.log(np.maximum(positive, 1)) / self.log_gamma).astype(np.int64)
+        counts = np.bincount(index)
+        if len(counts) > len(self.bins):
+            self.bins = np.concatenate((self.bins, np.zeros(len(counts) - len(self.bins), dtype=np.int64)))
+        self.bins[:len(counts)] += counts
+
+    def merge(self, other: "QuantileSketch"):
+        if len(other.bins) > len(self.bins):
+            self.bins = np.concatenate((self.bins, np.zeros(len(other.bins) - len(self.bins), dtype=np.int64)))
+        self.bins[:len(other.bins)] += other.bins
+        self.zeros += other.zeros
+        self.count += other.count
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    # q in [0, 1], None for an empty sketch
+    def quantile(self, q: float):
+        if self.count == 0:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return 0
+        index = int(np.searchsorted(np.cumsum(self.bins), rank - self.zeros, side="right"))
+        # middle of the bucket in the relative sense, clamped to what was actually seen
+        value = 2 * self.gamma ** index / (self.gamma + 1)
+        return min(max(value, self.min), self.max)
+
+
+# python -m user_io.sketch, checks the sketch against numpy's exact percentiles
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    data = np.concatenate((rng.lognormal(3, 0.6, 1000000), rng.integers(200, 2000, 5000)))
+    sketch = QuantileSketch()
+    for first in range(0, len(data), 10000):
+        sketch.add(data[first:first + 10000])
+
+    for q in (0.5, 0.9, 0.99, 0.999):
+        exact = np.quantile(data, q)
+        approx = sketch.quantile(q)
+        print(f"p{q * 100:g}: exact {exact:.2f}, sketch {approx:.2f}, error {abs(approx - exact) / exact * 100:.2f}% "
+              f"({len(sketch.bins)} buckets)")
+    print(f"buckets needed for round trips up to an hour: {ceil(log(3600000) / sketch.log_gamma)}")
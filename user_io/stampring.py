@@ -0,0 +1,208 @@
+from collections import deque
+from sys import argv
+from threading import Thread
+from time import perf_counter
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from db.columns import Categories
+
+
+# fixed capacity ring over two int32 columns (ping, label code) and the stored epoch ms of the row each stamp was
+# written as (0 for stamps that never were), index 0 is the newest stamp. pushing is O(1), a full ring drops the
+# oldest stamp when a newer one comes in, unless it's allowed to grow
+class StampRing:
+    def __init__(self, capacity: int, grow: bool = False):
+        self.capacity = capacity
+        self.grow = grow
+        self.ping = np.zeros(capacity, dtype=np.int32)
+        self.label = np.zeros(capacity, dtype=np.int32)
+        self.stamp_ms = np.zeros(capacity, dtype=np.int64)
+        self.start = 0  # slot of the newest stamp
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def slots(self, first: int, count: int) -> np.ndarray:
+        return (self.start + first + np.arange(count)) % self.capacity
+
+    def resize(self, capacity: int):
+        order = self.slots(0, self.size)
+        ping = np.zeros(capacity, dtype=np.int32)
+        label = np.zeros(capacity, dtype=np.int32)
+        stamp_ms = np.zeros(capacity, dtype=np.int64)
+        ping[:self.size] = self.ping[order]
+        label[:self.size] = self.label[order]
+        stamp_ms[:self.size] = self.stamp_ms[order]
+        self.ping, self.label, self.stamp_ms, self.capacity, self.start = ping, label, stamp_ms, capacity, 0
+
+    # returns the (label code, ping, stamp ms) that fell off the old end, None if nothing did
+    def push_newest(self, label_code: int, ping: int, stamp_ms: int = 0):
+        evicted = None
+        if self.size == self.capacity:
+            if self.grow:
+                self.resize(self.capacity * 2)
+            else:
+                last = (self.start + self.size - 1) % self.capacity
+                evicted = (int(self.label[last]), int(self.ping[last]), int(self.stamp_ms[last]))
+                self.size -= 1
+
+        self.start = (self.start - 1) % self.capacity
+        self.ping[self.start] = ping
+        self.label[self.start] = label_code
+        self.stamp_ms[self.start] = stamp_ms
+        self.size += 1
+        return evicted
+
+    # label codes and pings of stamps first..first + count, clipped to what's held
+    def window(self, first: int, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        slots = self.slots(first, max(min(count, self.size - first), 0))
+        return self.label[slots], self.ping[slots]
+
+    def clear(self):
+        self.start = 0
+        self.size = 0
+
+
+# the stamps PingScene holds, newest first: the live ring the testers push into, then the stamps that fell off it
+# while the user was scrolled back (older ones come from HistoryPager). memory is bounded by the live capacity plus
+# how long the user stayed scrolled back, the history is dropped again when the view goes back to live
+class StampBuffer:
+    LIVE_CAPACITY = 1 << 16
+    HISTORY_CAPACITY = 1024  # starting size, grows while scrolling back
+
+    def __init__(self, capacity: int = LIVE_CAPACITY):
+        self.labels = Categories()
+        self.live = StampRing(capacity)
+        self.history = StampRing(StampBuffer.HISTORY_CAPACITY, grow=True)
+        self.keep_evicted = False
+
+    def __len__(self):
+        return len(self.live) + len(self.history)
+
+    def add(self, label: str, ping: int, stamp_ms: int = 0):
+        evicted = self.live.push_newest(self.labels.encode([label])[0], ping, stamp_ms)
+        # while scrolled back the pages behind us start where the live ring did, keep what falls off in between
+        if evicted is not None and self.keep_evicted:
+            self.history.push_newest(*evicted)
+
+    # stored epoch ms of the oldest tick the live ring holds a written stamp of, and how many stamps of that tick it
+    # holds. the db rows older than what the ring holds start right behind them, (None, 0) when nothing was written
+    def oldest_recorded(self) -> Tuple[Optional[int], int]:
+        stamps = self.live.stamp_ms[self.live.slots(0, len(self.live))]
+        stamps = stamps[stamps > 0]
+        if len(stamps) == 0:
+            return None, 0
+        oldest = int(stamps.min())
+        return oldest, int((stamps == oldest).sum())
+
+    def start_history(self):
+        self.keep_evicted = True
+
+    def drop_history(self):
+        self.keep_evicted = False
+        self.history.clear()
+
+    def window(self, first: int, count: int) -> Tuple[List[str], np.ndarray]:
+        live_codes, live_pings = self.live.window(first, count)
+        history_codes, history_pings = self.history.window(max(first - len(self.live), 0), count - len(live_pings))
+        codes = np.concatenate((live_codes, history_codes))
+        return [self.labels[code] for code in codes.tolist()], np.concatenate((live_pings, history_pings))
+
+
+# hands stamps from the tester/sniffer threads to the ui thread. put and drain are single deque operations, which are
+# atomic in cpython, so any number of producers can put without a lock and never wait on a frame being drawn. when
+# the ui falls behind by more than capacity stamps the oldest waiting ones are dropped, they're still in the db
+class StampChannel:
+    CAPACITY = 8192
+
+    def __init__(self, capacity: int = CAPACITY):
+        self.capacity = capacity
+        self.items = deque(maxlen=capacity)
+        self.dropped = 0  # approximate, only for display
+
+    def put(self, label: str, ping: int, stamp_ms: int = 0):
+        if len(self.items) == self.capacity:
+            self.dropped += 1
+        self.items.append((label, ping, stamp_ms))
+
+    # everything that was waiting when the call started, oldest first
+    def drain(self) -> List[Tuple[str, int, int]]:
+        drained = []
+        for _ in range(len(self.items)):
+            try:
+                drained.append(self.items.popleft())
+            except IndexError:
+                break
+        return drained
+
+
+# python -m user_io.stampring [stamps, default 200000], checks the buffer against a plain list kept newest first,
+# the channel with concurrent producers, and times the buffer against the list.insert(0, stamp) PingScene used to do
+if __name__ == "__main__":
+    total = int(argv[1]) if len(argv) > 1 else 200000
+    rng = np.random.default_rng(2)
+    labels = [f"server{i}" for i in range(5)]
+
+    buffer = StampBuffer(capacity=1000)
+    reference = []
+    written = []
+    for n in range(5000):
+        stamp = (labels[n % 5], int(rng.integers(0, 500)))
+        # five servers a tick, a stamp that failed to be written has no row behind it
+        stamp_ms = 0 if n % 7 == 3 else 1700000000000 + (n // 5) * 1000
+        buffer.add(*stamp, stamp_ms)
+        reference.insert(0, stamp)
+        written.insert(0, stamp_ms)
+        if n == 2999:
+            # scrolled back from here on, the db rows behind the ring start at its oldest written tick
+            held = [ms for ms in written[:1000] if ms > 0]
+            assert buffer.oldest_recorded() == (min(held), held.count(min(held)))
+            buffer.start_history()
+        if n >= 3000:
+            # live stamps keep coming while scrolled back, evicted ones move over to the history
+            assert len(buffer) == n - 2999 + 1000
+            for first in (0, 990, 1000, 1400, 1490):
+                got_labels, got_pings = buffer.window(first, 11)
+                expected = reference[first:min(first + 11, len(buffer))]
+                assert list(zip(got_labels, got_pings.tolist())) == expected, f"window {first} after {n} stamps"
+    buffer.drop_history()
+    assert len(buffer) == 1000
+    print("windows match a plain list across the live ring and the kept history")
+
+    # a few producers putting as fast as they can while the consumer drains like a frame would
+    producers, per_producer = 4, 50000
+    channel = StampChannel(capacity=producers * per_producer)
+    received = []
+
+    def produce(name):
+        for n in range(per_producer):
+            channel.put(name, n)
+
+    threads = [Thread(target=produce, args=(f"p{i}",)) for i in range(producers)]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        received += channel.drain()
+    received += channel.drain()
+    channel_s = perf_counter() - start
+    for i in range(producers):
+        assert [ping for label, ping, _ in received if label == f"p{i}"] == list(range(per_producer)), f"producer {i}"
+    print(f"{producers} producers, {len(received)} stamps through the channel in order in {channel_s:.2f}s")
+
+    start = perf_counter()
+    stamps = []
+    for n in range(total):
+        stamps.insert(0, (labels[n % 5], n))
+    list_s = perf_counter() - start
+
+    start = perf_counter()
+    buffer = StampBuffer()
+    for n in range(total):
+        buffer.add(labels[n % 5], n)
+    ring_s = perf_counter() - start
+    print(f"{total} stamps: list.insert(0) {list_s:.2f}s, ring {ring_s:.2f}s "
+          f"({buffer.live.capacity * 16 // 1024}KB of columns)")
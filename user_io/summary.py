@@ -0,0 +1,122 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from db.columns import TimestampColumns, PacketColumns
+from user_io.outages import Outage, OutageDetector
+from user_io.sketch import QuantileSketch
+
+
+# fixed number of time bins over the report range, whatever the range length the graph gets the same point count
+class BinnedSeries:
+    def __init__(self, start_ms: int, end_ms: int, bins: int):
+        self.start_ms = start_ms
+        self.span_ms = max(end_ms - start_ms, 1)
+        self.bins = bins
+
+        self.count = np.zeros(bins, dtype=np.int64)
+        self.sum = np.zeros(bins, dtype=np.float64)
+        self.min = np.full(bins, np.inf)
+        self.max = np.full(bins, -np.inf)
+        self.failed = np.zeros(bins, dtype=np.int64)
+
+    def bin_of(self, epoch_ms: np.ndarray) -> np.ndarray:
+        return np.clip((epoch_ms - self.start_ms) * self.bins // self.span_ms, 0, self.bins - 1)
+
+    def add(self, epoch_ms: np.ndarray, values: np.ndarray, failed: np.ndarray = None):
+        index = self.bin_of(epoch_ms)
+        if failed is not None:
+            self.failed += np.bincount(index[failed], minlength=self.bins)
+            index = index[~failed]
+            values = values[~failed]
+
+        self.count += np.bincount(index, minlength=self.bins)
+        self.sum += np.bincount(index, weights=values, minlength=self.bins)
+        np.minimum.at(self.min, index, values)
+        np.maximum.at(self.max, index, values)
+
+    def averages(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 0, self.sum / self.count, np.nan)
+
+    # bin start times in epoch ms
+    def edges(self) -> np.ndarray:
+        return self.start_ms + np.arange(self.bins, dtype=np.int64) * self.span_ms // self.bins
+
+
+class PingStats:
+    def __init__(self, interface, receiver, binned: BinnedSeries):
+        self.interface = interface
+        self.receiver = receiver  # readable name
+        self.pings = 0
+        self.failed = 0
+        self.rtt = QuantileSketch()
+        self.binned = binned
+
+    def availability(self) -> float:
+        return (self.pings - self.failed) / self.pings * 100 if self.pings else 0
+
+
+class TrafficStats:
+    def __init__(self, interface, binned: BinnedSeries):
+        self.interface = interface
+        self.packets = 0
+        self.bytes = 0
+        self.binned = binned
+
+
+# everything the onefile report shows, built in one pass over the column chunks. memory only depends on the number
+# of servers/interfaces and the bin count, not on how many rows went through
+class RangeSummary:
+    BINS = 1000
+
+    def __init__(self, start_ms: int, end_ms: int, bins: int = BINS):
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.bins = bins
+
+        self.pings: Dict[Tuple, PingStats] = {}
+        self.traffic: Dict[str, TrafficStats] = {}
+        self.outages: List[Outage] = []  # only filled when an OutageDetector runs along
+        self.rows = 0
+
+    def add_timestamps(self, columns: TimestampColumns):
+        self.rows += len(columns)
+        failed = OutageDetector.failed(columns)
+        key_codes = (columns.interface.astype(np.int64) << 32) | columns.receiver.astype(np.int64)
+
+        for key_code in np.unique(key_codes):
+            idx = np.flatnonzero(key_codes == key_code)
+            interface = columns.interfaces[columns.interface[idx[0]]]
+            receiver = columns.receivers_readable[columns.receiver_readable[idx[0]]]
+            # keyed by name, the codes of a column generator aren't known to the other generators
+            key = (interface, columns.receivers[columns.receiver[idx[0]]])
+
+            stats = self.pings.get(key)
+            if stats is None:
+                stats = self.pings[key] = PingStats(interface, receiver,
+                                                    BinnedSeries(self.start_ms, self.end_ms, self.bins))
+
+            series_failed = failed[idx]
+            stats.pings += len(idx)
+            stats.failed += int(series_failed.sum())
+            ms = columns.ms[idx]
+            stats.rtt.add(ms[~series_failed])
+            stats.binned.add(columns.epoch_ms[idx], ms.astype(np.float64), series_failed)
+
+    # raw packets and flows both come through here, a flow row counts its own packets
+    def add_packets(self, columns: PacketColumns):
+        self.rows += len(columns)
+        for code in np.unique(columns.interface):
+            idx = np.flatnonzero(columns.interface == code)
+            interface = columns.interfaces[code]
+
+            stats = self.traffic.get(interface)
+            if stats is None:
+                stats = self.traffic[interface] = TrafficStats(interface,
+                                                               BinnedSeries(self.start_ms, self.end_ms, self.bins))
+
+            sizes = columns.size[idx]
+            stats.packets += int(columns.packets[idx].sum()) if columns.packets is not None else len(idx)
+            stats.bytes += int(sizes.sum())
+            stats.binned.add(columns.epoch_ms[idx], sizes.astype(np.float64))